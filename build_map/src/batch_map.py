@@ -0,0 +1,219 @@
+"""
+Batch build of several map variants from one loaded geometry set.
+
+The admin geometry is loaded and cleaned once. Merge and subdivide run once
+per distinct set of their config keys and are shared by every variant that
+agrees on them. The variant stages (sea regions, border simplification,
+preview, export) then run in a process pool, one task per distinct sea
+configuration, and every variant writes its own output folder:
+
+    python batch_map.py variants.json [--config build_config.json] [--workers N]
+
+variants.json:
+
+    {
+        "base": {"seed": 1},                        # optional, applied over build_config.json
+        "variants": [
+            {"name": "small", "n_regions": 30, "export_size": 2048},
+            {"name": "large", "n_regions": 90, "min_area_abs": 500000000}
+        ]
+    }
+
+A variant without "out_dir" exports to opengs_variants/<name>. Every export
+task holds its own rasters (about 0.5 GB at 4096 px), so keep --workers in
+line with the available memory.
+"""
+
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import build_map
+from border_overlay import border_style
+from build_config import CONFIG_PATH, apply_overrides, load_config
+from country_pool import resolve_workers
+from watch_map import STAGE_KEYS
+
+VARIANTS_DIR = "opengs_variants"
+
+
+# --------------------------------------------------------
+# VARIANT CONFIGS
+# --------------------------------------------------------
+def load_variants(batch_path, config_path=CONFIG_PATH):
+    """[(name, config)] for every variant of a batch file, each on top of config_path + "base"."""
+    with open(batch_path, encoding="utf-8") as f:
+        batch = json.load(f)
+
+    source = os.path.basename(batch_path)
+    base = apply_overrides(load_config(config_path), batch.get("base", {}), source)
+
+    variants = []
+    for i, overrides in enumerate(batch.get("variants", [])):
+        overrides = dict(overrides)
+        name = str(overrides.pop("name", f"variant_{i + 1}"))
+        config = apply_overrides(base, overrides, f"{source} ({name})")
+        if not config["out_dir"]:
+            config["out_dir"] = os.path.join(VARIANTS_DIR, name)
+        variants.append((name, config))
+
+    names = [name for name, _ in variants]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{source}: variant names must be unique")
+    dirs = [os.path.normcase(build_map.output_dir(config)) for _, config in variants]
+    if len(set(dirs)) != len(dirs):
+        raise ValueError(f"{source}: two variants write to the same out_dir")
+    return variants
+
+
+def stage_key(config, *stages):
+    """Hashable key of the config values the given stages read."""
+    keys = sorted({k for stage in stages for k in STAGE_KEYS[stage]})
+    return json.dumps([config[k] for k in keys])
+
+
+# --------------------------------------------------------
+# VARIANT STAGES (run in the worker processes)
+# --------------------------------------------------------
+def run_variant_group(land, land_union, variants):
+    """Sea regions once for a group of variants with the same sea config, then preview + export of each."""
+    cfg = variants[0][1]
+    t0 = time.perf_counter()
+    build_map.seed_everything(cfg["seed"])
+    sea_regions = build_map.generate_sea_regions(
+        land,
+        land_union,
+        n_regions=cfg["n_regions"],
+        sample_points=cfg["sea_sample_points"],
+        smooth_radius=cfg["sea_smooth_radius"],
+        seed=cfg["seed"],
+        method=cfg["sea_method"],
+        raster_cell=cfg["sea_raster_cell"],
+        tile_size=cfg["sea_tile_size"],
+    )
+    sea_time = time.perf_counter() - t0
+
+    done = []
+    for name, config in variants:
+        t0 = time.perf_counter()
+        # reseeded per stage as in build_map.build
+        build_map.seed_everything(config["seed"])
+        # the tolerance is in export pixels, so it depends on the variant's export_size
+        draw_land, draw_sea = build_map.simplify_borders(
+            land, sea_regions, config["simplify_px"], size=config["export_size"]
+        )
+        if config["preview"]:
+            build_map.seed_everything(config["seed"])
+            build_map.render_preview(draw_land, draw_sea, build_map.preview_path(config))
+        if config["export"]:
+            build_map.seed_everything(config["seed"])
+            build_map.export_opengs(
+                draw_land,
+                draw_sea,
+                theme_modes=config["theme_modes"],
+                out_dir=build_map.output_dir(config),
+                size=config["export_size"],
+                tile_size=config["tile_size"],
+                mesh_lods=config["mesh_lods"],
+                nuts_population=config["nuts_population"],
+                borders=border_style(config),
+            )
+        done.append((name, sea_time + time.perf_counter() - t0))
+        sea_time = 0.0
+    return done
+
+
+# --------------------------------------------------------
+# BATCH DRIVER
+# --------------------------------------------------------
+def run_batch(variants, workers=None):
+    """Build every (name, config) variant; returns the names of the variants that failed."""
+    if not variants:
+        print("[BATCH] No variants")
+        return []
+
+    t_start = time.perf_counter()
+    land_workers = variants[0][1]["workers"]
+
+    admin = build_map.load_admin()
+    clean_land, land_union = build_map.clean_geometry(admin, workers=land_workers)
+    print(f"[BATCH] Geometry loaded once ({len(clean_land)} regions, {time.perf_counter() - t_start:.1f}s)")
+
+    # shared land stages, once per distinct merge / subdivide config
+    merged, lands = {}, {}
+    for name, config in variants:
+        mkey = stage_key(config, "merge")
+        if mkey not in merged:
+            build_map.seed_everything(config["seed"])
+            merged[mkey] = build_map.merge_small_absolute(
+                clean_land, min_area=config["min_area_abs"], workers=land_workers
+            )
+        skey = stage_key(config, "merge", "subdivide")
+        if skey not in lands:
+            build_map.seed_everything(config["seed"])
+            lands[skey] = build_map.subdivide_large(
+                merged[mkey], max_area=config["max_area_abs"], seed=config["seed"], workers=land_workers
+            )
+    del merged
+
+    # one pool task per land + sea config, in batch file order
+    groups = {}
+    for name, config in variants:
+        skey = stage_key(config, "merge", "subdivide")
+        groups.setdefault((skey, stage_key(config, "sea")), []).append((name, config))
+
+    workers = min(resolve_workers(workers), len(groups))
+    print(
+        f"[BATCH] {len(variants)} variants: {len(lands)} land set(s), "
+        f"{len(groups)} sea config(s), {workers} worker(s)"
+    )
+
+    failed = []
+    results = {}
+
+    def collect(group, run):
+        try:
+            for name, seconds in run():
+                results[name] = seconds
+        except Exception:
+            traceback.print_exc()
+            failed.extend(name for name, _ in group)
+
+    if workers <= 1:
+        for (skey, _), group in groups.items():
+            collect(group, lambda: run_variant_group(lands[skey], land_union, group))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (group, pool.submit(run_variant_group, lands[skey], land_union, group))
+                for (skey, _), group in groups.items()
+            ]
+            for group, future in futures:
+                collect(group, future.result)
+
+    for name, config in variants:
+        if name in results:
+            print(f"[BATCH] {name}: {results[name]:.1f}s -> {build_map.output_dir(config)}")
+        else:
+            print(f"[BATCH] {name}: FAILED")
+    print(f"[BATCH] Done in {time.perf_counter() - t_start:.1f}s")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build several map variants from one loaded geometry set.")
+    parser.add_argument("batch", help="JSON file with the variant list")
+    parser.add_argument("--config", default=CONFIG_PATH, help="base JSON config the variants override")
+    parser.add_argument("--workers", type=int, default=None, help="variant processes (default: all cores)")
+    args = parser.parse_args()
+
+    variants = load_variants(os.path.abspath(args.batch), os.path.abspath(args.config))
+    failed = run_batch(variants, workers=args.workers)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Province and state border overlay for PoliticalMap and the theme maps.
+
+Both masks come from the id raster with shifted-array comparisons: a pixel is
+a border pixel when its right or lower neighbour belongs to another province
+(or, through the province -> state mapping, to another state). Only borders
+between two land pixels count; coasts are drawn by the sea outline. Lines
+are widened to `width` pixels by OR-ing shifted copies of the mask.
+
+The masks are computed once per export and painted into every map with
+NumPy (province borders first, state borders on top, the sea outline is drawn
+after them). They are stored in .build/diff/borders.npz, so re-rendered theme
+maps (build_map.py theme) get the same borders.
+"""
+
+import hashlib
+import io
+import os
+
+import numpy as np
+
+from export_shared import row_chunks
+from output_writer import atomic_write
+
+BORDERS_FILE = "borders.npz"
+
+
+def border_style(config):
+    """Border layers of a build config: {name: (color, width)}, layers of width 0 left out."""
+    style = {}
+    for name in ("province", "state"):
+        width = int(config[f"{name}_border_width"] or 0)
+        if width > 0:
+            style[name] = (tuple(int(c) for c in config[f"{name}_border_color"]), width)
+    return style
+
+
+# --------------------------------------------------------
+# MASKS
+# --------------------------------------------------------
+def edge_mask(ids):
+    """1 px border line: pixels whose right or lower neighbour has another id (both >= 0)."""
+    h, w = ids.shape
+    mask = np.zeros((h, w), dtype=bool)
+    for top, bottom in row_chunks(h):
+        # one extra row below for the vertical comparison
+        block = ids[top:min(bottom + 1, h)]
+        rows = bottom - top
+        m = mask[top:bottom]
+
+        a, b = block[:rows, :-1], block[:rows, 1:]
+        m[:, :-1] |= (a != b) & (a >= 0) & (b >= 0)
+        if len(block) > 1:
+            a, b = block[:-1], block[1:]
+            m[:len(a)] |= (a != b) & (a >= 0) & (b >= 0)
+    return mask
+
+
+def widen(mask, width):
+    """Grow a 1 px line to `width` px, alternating right/down and left/up so it stays centred."""
+    for i in range(1, width):
+        grown = mask.copy()
+        if i % 2:
+            grown[:, 1:] |= mask[:, :-1]
+            grown[1:] |= mask[:-1]
+        else:
+            grown[:, :-1] |= mask[:, 1:]
+            grown[:-1] |= mask[1:]
+        mask = grown
+    return mask
+
+
+def state_ids(id_map, state_of):
+    """State raster (int32, -1 for sea and provinces without a state), row chunk by row chunk."""
+    lut = np.append(np.asarray(state_of, dtype=np.int32), -1)   # id -1 -> last entry
+    out = np.empty(id_map.shape, dtype=np.int32)
+    for top, bottom in row_chunks(id_map.shape[0]):
+        block = id_map[top:bottom]
+        out[top:bottom] = lut[np.where((block >= 0) & (block < len(state_of)), block, -1)]
+    return out
+
+
+# --------------------------------------------------------
+# OVERLAY
+# --------------------------------------------------------
+class BorderOverlay:
+    """Border masks + colours, painted into RGB maps with apply()."""
+
+    def __init__(self, layers):
+        self.layers = layers   # [(mask, color)], painted in order
+
+    @classmethod
+    def build(cls, id_map, state_of, style):
+        """
+        id_map:   export id raster (land pids, < 0 = sea)
+        state_of: pid -> state index (-1 = none)
+        style:    border_style() of the config
+        """
+        layers = []
+        if "province" in style:
+            color, width = style["province"]
+            layers.append((widen(edge_mask(id_map), width), color))
+        if "state" in style:
+            color, width = style["state"]
+            layers.append((widen(edge_mask(state_ids(id_map, state_of)), width), color))
+        return cls(layers)
+
+    def apply(self, rgb):
+        for mask, color in self.layers:
+            rgb[mask] = color
+        return rgb
+
+    # --------------------------------------------------------
+    # STORE / LOAD (for re-rendered theme maps)
+    # --------------------------------------------------------
+    def save(self, folder):
+        buf = io.BytesIO()
+        arrays = {}
+        for i, (mask, color) in enumerate(self.layers):
+            arrays[f"mask{i}"] = np.packbits(mask, axis=None)
+            arrays[f"color{i}"] = np.asarray(color, dtype=np.uint8)
+        shape = self.layers[0][0].shape if self.layers else (0, 0)
+        np.savez_compressed(buf, shape=np.asarray(shape), n=len(self.layers), **arrays)
+        atomic_write(os.path.join(folder, BORDERS_FILE), buf.getvalue())
+
+    @classmethod
+    def load(cls, folder):
+        """Stored overlay, or an empty one when the export had no borders."""
+        path = os.path.join(folder, BORDERS_FILE)
+        if not os.path.exists(path):
+            return cls([])
+        with np.load(path, allow_pickle=False) as f:
+            h, w = (int(v) for v in f["shape"])
+            layers = [
+                (np.unpackbits(f[f"mask{i}"], count=h * w).astype(bool).reshape(h, w), tuple(f[f"color{i}"].tolist()))
+                for i in range(int(f["n"]))
+            ]
+        return cls(layers)
+
+
+def province_states(land, size):
+    """pid -> state index array of `size` ids (-1 = sea / no state), same state order as Provinces.bin."""
+    from province_db import state_groups
+
+    _, _, _, codes = state_groups(land)
+    state_of = np.full(size, -1, dtype=np.int32)
+    pids = np.asarray(land.index, dtype=np.int64)
+    keep = (pids >= 0) & (pids < size)
+    state_of[pids[keep]] = codes[keep]
+    return state_of
+
+
+def overlay_key(style, state_of):
+    """Part of the BuildDiff overlay key: border style + province -> state mapping."""
+    digest = hashlib.sha256(np.ascontiguousarray(state_of, dtype=np.int32).tobytes()).hexdigest()[:16]
+    return sorted(style.items()), digest
@@ -0,0 +1,58 @@
+import json
+import os
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(BASE, "build_config.json")
+
+# --------------------------------------------------------
+# DEFAULT BUILD PARAMETERS (overridden by build_config.json)
+# --------------------------------------------------------
+DEFAULT_CONFIG = {
+    "workers": 0,                    # processes for the per-country land stages, 0 = serial, null = all cores
+    "min_area_abs": 1_000_000_000,   # provinces smaller than this (m²) get merged
+    "max_area_abs": 0,               # provinces bigger than this (m²) get subdivided, 0 = off (e.g. 50_000_000_000)
+    "n_regions": 60,                 # number of sea regions
+    "sea_sample_points": 15000,      # random points sampled for sea clustering
+    "sea_smooth_radius": 15000,      # buffer(+r).buffer(-r) smoothing of sea cells
+    "sea_method": "kmeans",          # kmeans | minibatch | raster, see sea_partition.py
+    "sea_warm_start": False,         # watch mode + minibatch: start from the previous centres (faster, not reproducible)
+    "sea_raster_cell": 5000,         # raster method: cell size in metres
+    "sea_tile_size": 250_000,        # edge of the prepared sea tiles used for sea queries, metres
+    "simplify_px": 0,                # shared-border simplification tolerance in export pixels, 0 = off (e.g. 0.5)
+    "seed": None,                    # fixed seed -> reproducible sea cells (colours are always stable)
+    "preview": True,                 # write preview_map.png
+    "export": True,                  # run the OpenGS export
+    "export_size": 4096,             # edge of the exported rasters in pixels
+    "tile_size": 0,                  # > 0: also export every map as a Tiles/ pyramid of this tile size
+    "mesh_lods": [],                 # ProvinceMesh.bin LOD tolerances in pixels, e.g. [0, 2, 8], [] = no mesh
+    "out_dir": None,                 # export folder (relative to build_map/src), null = opengs_export
+    "nuts_population": None,         # NUTS-3 population table -> area-weighted population, see nuts_population.py
+    "province_border_width": 0,      # province border lines in PoliticalMap + theme maps, pixels, 0 = none
+    "province_border_color": [70, 70, 70],
+    "state_border_width": 0,         # state border lines (drawn over province borders), 0 = none
+    "state_border_color": [20, 20, 20],
+    "theme_modes": [],               # extra theme maps, see export_theme_map.export_theme_modes
+}
+
+
+def load_config(path=CONFIG_PATH):
+    """Return DEFAULT_CONFIG updated with the values found in `path` (if it exists)."""
+    config = dict(DEFAULT_CONFIG)
+    if path is None or not os.path.exists(path):
+        return config
+
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+
+    return apply_overrides(config, overrides, os.path.basename(path))
+
+
+def apply_overrides(config, overrides, source):
+    """Copy of `config` with the known keys of `overrides` replaced (unknown keys are reported and skipped)."""
+    config = dict(config)
+    for key, value in overrides.items():
+        if key not in DEFAULT_CONFIG:
+            print(f"[WARN] Unknown config key '{key}' in {source}")
+            continue
+        config[key] = value
+    return config
@@ -2,14 +2,14 @@
 # IMPORTS + CONFIG
 # =====================================================================
 
-import geopandas as gpd
-import pandas as pd
+# heavy libraries (geopandas, matplotlib, sklearn, PIL, ...) are imported
+# inside the stages that use them, so the utility commands start quickly
+import argparse
+import os, random
+
 import numpy as np
-import matplotlib.pyplot as plt
 
-from shapely.geometry import box, Point, MultiPoint, Polygon, MultiPolygon
-from shapely.ops import unary_union, voronoi_diagram
-import os, random
+from build_config import DEFAULT_CONFIG, CONFIG_PATH, load_config
 
 DEBUG = True
 def debug(msg):
@@ -23,12 +23,6 @@ BASE = os.path.dirname(os.path.abspath(__file__))
 # PART 1 — LOAD ADMIN1 + FIX EUROPE + CUT RUSSIA + ADD CAUCASUS + ISLANDS
 # =====================================================================
 
-debug("PART 1 START — loading & filtering admin1")
-
-admin = gpd.read_file(os.path.join(BASE, "ne_10m_admin_1_states_provinces.shp"))
-admin = admin.to_crs(3035)
-admin["geometry"] = admin.geometry.buffer(0)
-
 # -----------------------------
 # LIST OF COUNTRIES TO KEEP
 # -----------------------------
@@ -50,214 +44,410 @@ EUROPE_COUNTRIES = [
 
     # Caucasus (add back)
     "ARM","GEO","AZE",
-    
+
     # Turkey (only part will be visible after cropping)
     "TUR"
 ]
 
-admin["country"] = admin["adm0_a3"]
-admin = admin[admin["country"].isin(EUROPE_COUNTRIES)].reset_index(drop=True)
 
-debug(f"Regions loaded after country filter: {len(admin)}")
+def load_admin():
+    debug("PART 1 START — loading & filtering admin1")
 
-# -----------------------------
-# FIX: Cut RUSSIA to EUROPE part
-# -----------------------------
-def cut_russia(geom):
-    europe_lonlat = box(20, 35, 60, 75)  # 20E–60E, 35N–75N
-    europe_3035 = gpd.GeoSeries([europe_lonlat], crs=4326).to_crs(3035).iloc[0]
-    return geom.intersection(europe_3035)
+    import geometry_clean
 
-rus = admin[admin["country"] == "RUS"].copy()
-admin = admin[admin["country"] != "RUS"]
+    # load, fix validity, cut RUSSIA to its European part, crop to the Europe box
+    admin = geometry_clean.load_admin(
+        os.path.join(BASE, "ne_10m_admin_1_states_provinces.shp"),
+        EUROPE_COUNTRIES,
+    )
 
-rus["geometry"] = rus.geometry.apply(cut_russia)
-rus = rus[~rus.geometry.is_empty]
-
-admin = pd.concat([admin, rus], ignore_index=True)
-
-# -----------------------------
-# REMOVE GEOMETRIES OUTSIDE EUROPE AREA
-# -----------------------------
-# This bounding box keeps Med islands, Cyprus, Iceland, Caucasus
-minx, miny, maxx, maxy = 900000, 1000000, 7000000, 6500000
-admin = admin.cx[minx:maxx, miny:maxy]
-
-debug(f"Final part-1 regions: {len(admin)}")
-debug("PART 1 DONE")
+    debug(f"Final part-1 regions: {len(admin)}")
+    debug("PART 1 DONE")
+    return admin
 
 
 # =====================================================================
 # PART 2 — CLEAN GEOMETRY
 # =====================================================================
 
-debug("PART 2 START — cleaning geometry")
+def clean_geometry(admin, workers=0):
+    debug("PART 2 START — cleaning geometry")
 
-def remove_holes(g):
-    if g.geom_type == "Polygon":
-        return Polygon(g.exterior)
-    elif g.geom_type == "MultiPolygon":
-        return MultiPolygon([Polygon(p.exterior) for p in g.geoms])
-    return g
+    import geometry_clean
+    import sea_geometry
 
-admin["geometry"] = admin.geometry.apply(remove_holes)
-admin["geometry"] = admin.geometry.buffer(0)
+    land = geometry_clean.clean_admin(admin, workers=workers)
+    # coverage union, reused from the geometry cache when the input is unchanged
+    land_union = sea_geometry.cached_land_union(land)
 
-land = admin.copy()
-land_union = unary_union(land.geometry)
+    debug(f"PART 2 DONE — valid regions: {len(land)}")
+    return land, land_union
 
-debug(f"PART 2 DONE — valid regions: {len(land)}")
-debug("Before merge small: " + str(len(land)))
 
 # =====================================================================
 # PART 2.5 — MERGING OF SMALL REGIONS (ABSOLUTE THRESHOLD ONLY)
 # =====================================================================
 
-debug("PART 2.5 START — merging small provinces...")
-
-from shapely.geometry import Polygon, MultiPolygon
-
 # --------------------------
 # CONSTANT AREA MERGE THRESHOLD
 # --------------------------
-MIN_AREA_ABS = 1_000_000_000   # cokoliv menší než 10M m² se sloučí
+MIN_AREA_ABS = DEFAULT_CONFIG["min_area_abs"]   # cokoliv menší než 1000 km² se sloučí
 
 
-def merge_small_absolute(gdf):
-    gdf = gdf.copy()
-    gdf["area"] = gdf.geometry.area
+def merge_small_absolute(gdf, min_area=MIN_AREA_ABS, workers=0):
+    debug("Before merge small: " + str(len(gdf)))
+    debug("PART 2.5 START — merging small provinces...")
 
-    merged = []
+    import geometry_clean
 
-    for country, group in gdf.groupby("country"):
-        group = group.copy()
+    # each country is merged on its own, optionally in a process pool
+    merged = geometry_clean.merge_small_absolute(gdf, min_area, workers=workers)
 
-        while True:
-            small = group[group["area"] < MIN_AREA_ABS]
+    debug(f"PART 2.5 DONE ")
+    debug("After merge small: " + str(len(merged)))
+    return merged
 
-            if small.empty:
-                break
 
-            idx = small.index[0]
-            target = group.loc[idx]
+# =====================================================================
+# PART 2.6 — SUBDIVISION OF OVERSIZED REGIONS
+# =====================================================================
 
-            # candidates ONLY in the same country
-            candidates = group.drop(idx)
-            if candidates.empty:
-                group = group.drop(idx)
-                continue
+MAX_AREA_ABS = DEFAULT_CONFIG["max_area_abs"]   # cokoliv většího než 50 000 km² se rozdělí
 
-            # merge with nearest polygon
-            nearest_idx = candidates.distance(target.geometry).sort_values().index[0]
-            merged_geom = target.geometry.union(group.loc[nearest_idx].geometry)
 
-            group.loc[nearest_idx, "geometry"] = merged_geom
-            group = group.drop(idx)
-            group["area"] = group.geometry.area
+def subdivide_large(gdf, max_area=MAX_AREA_ABS, seed=None, workers=0):
+    debug("PART 2.6 START — subdividing oversized provinces...")
 
-        merged.append(group)
+    from subdivide_provinces import subdivide_large as split_large
 
-    merged = pd.concat(merged, ignore_index=True)
-    return merged.drop(columns="area")
+    out = split_large(gdf, max_area, seed=seed, workers=workers)
 
+    debug("PART 2.6 DONE — provinces: " + str(len(out)))
+    return out
 
-# Apply merge
-land = merge_small_absolute(land)
 
-debug(f"PART 2.5 DONE ")
+# =====================================================================
+# PART 3 — SEA REGIONS
+# =====================================================================
+
+N_REGIONS = DEFAULT_CONFIG["n_regions"]
+SEA_SAMPLE_POINTS = DEFAULT_CONFIG["sea_sample_points"]
+SEA_SMOOTH_RADIUS = DEFAULT_CONFIG["sea_smooth_radius"]
+SEA_METHOD = DEFAULT_CONFIG["sea_method"]
+SEA_RASTER_CELL = DEFAULT_CONFIG["sea_raster_cell"]
+SEA_TILE_SIZE = DEFAULT_CONFIG["sea_tile_size"]
+
+
+def generate_sea_regions(
+    land,
+    land_union,
+    n_regions=N_REGIONS,
+    sample_points=SEA_SAMPLE_POINTS,
+    smooth_radius=SEA_SMOOTH_RADIUS,
+    seed=None,
+    method=SEA_METHOD,
+    raster_cell=SEA_RASTER_CELL,
+    tile_size=SEA_TILE_SIZE,
+    warm_start=None,
+):
+    debug(f"PART 3 START — generating sea regions ({method})")
+
+    import sea_geometry
+    from sea_partition import partition_sea
+    from shapely.geometry import box
+
+    minx, miny, maxx, maxy = land.total_bounds
+
+    outer = box(minx - 100000, miny - 100000, maxx + 100000, maxy + 100000)
+    # sea polygon from the geometry cache, split into prepared tiles
+    sea = sea_geometry.cached_sea(land_union, outer, tile_size)
+
+    final_regions = partition_sea(
+        sea,
+        (minx, miny, maxx, maxy),
+        outer,
+        method=method,
+        n_regions=n_regions,
+        sample_points=sample_points,
+        smooth_radius=smooth_radius,
+        raster_cell=raster_cell,
+        seed=seed,
+        warm_start=warm_start,
+    )
+
+    debug(f"Sea regions generated: {len(final_regions)}")
+    debug("PART 3 DONE")
+    return final_regions
+
 
 # =====================================================================
-# PART 3 — SEA REGIONS (unchanged)
+# PART 3.5 — SHARED-BORDER SIMPLIFICATION
 # =====================================================================
-debug("After merge small: " + str(len(land)))
 
-debug("PART 3 START — generating sea regions")
+def simplify_borders(land, final_regions, simplify_px, size=None):
+    debug(f"PART 3.5 START — simplifying borders ({simplify_px}px)")
+
+    from export_shared import EXPORT_SIZE
+    from topology_simplify import simplify_borders as simplify
 
-minx, miny, maxx, maxy = land.total_bounds
+    # every land/sea border is simplified once, so neighbours stay gap-free
+    land, final_regions = simplify(land, final_regions, simplify_px, size=size or EXPORT_SIZE)
 
-outer = box(minx - 100000, miny - 100000, maxx + 100000, maxy + 100000)
-sea = outer.difference(land_union)
+    debug("PART 3.5 DONE")
+    return land, final_regions
 
-# sample sea points
-points = []
-for _ in range(15000):
-    x = np.random.uniform(minx, maxx)
-    y = np.random.uniform(miny, maxy)
-    p = Point(x, y)
-    if sea.contains(p):
-        points.append([x, y])
 
-points = np.array(points)
-debug(f"Sea points: {len(points)}")
+# =====================================================================
+# PART 4 — PREVIEW
+# =====================================================================
 
-# clustering
-from sklearn.cluster import KMeans
-N_REGIONS = 60
+def render_preview(land, final_regions, path=os.path.join(BASE, "preview_map.png")):
+    debug("PART 4 START — generating preview image")
 
-kmeans = KMeans(n_clusters=N_REGIONS, n_init="auto")
-centers = kmeans.fit(points).cluster_centers_
+    import matplotlib.pyplot as plt
 
-vor = voronoi_diagram(MultiPoint([Point(c[0], c[1]) for c in centers]))
+    fig, ax = plt.subplots(figsize=(18, 12))
 
-final_regions = []
-for poly in vor.geoms:
-    clipped = poly.intersection(sea)
-    if clipped.is_empty:
-        continue
+    # sea
+    for region in final_regions:
+        color = (random.random(), random.random(), random.random(), 0.7)
+        if region.geom_type == "MultiPolygon":
+            for p in region.geoms:
+                xs, ys = p.exterior.xy
+                ax.fill(xs, ys, color=color)
+        else:
+            xs, ys = region.exterior.xy
+            ax.fill(xs, ys, color=color)
 
-    # smooth edges
-    try:
-        clipped = clipped.buffer(15000).buffer(-15000)
-    except:
-        pass
+    # land borders
+    land.boundary.plot(ax=ax, color="white", linewidth=0.6)
 
-    if not clipped.is_empty:
-        final_regions.append(clipped)
+    ax.set_axis_off()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig.savefig(path, dpi=350)
+    plt.close(fig)
 
-debug(f"Sea regions generated: {len(final_regions)}")
-debug("PART 3 DONE")
+    debug("PART 4 DONE")
 
 
 # =====================================================================
-# PART 4 — PREVIEW
+# PART 5 — EXPORT TO OPENGS
 # =====================================================================
 
-debug("PART 4 START — generating preview image")
+def output_dir(config):
+    """Export folder of a config: out_dir relative to this folder, default opengs_export."""
+    return os.path.join(BASE, config["out_dir"] or "opengs_export")
+
+
+def preview_path(config):
+    """preview_map.png next to the scripts, or inside out_dir when the config sets one."""
+    folder = output_dir(config) if config["out_dir"] else BASE
+    return os.path.join(folder, "preview_map.png")
+
+
+def export_opengs(
+    land,
+    final_regions,
+    theme_modes=None,
+    out_dir=None,
+    size=None,
+    tile_size=0,
+    mesh_lods=(),
+    workers=0,
+    nuts_population=None,
+    borders=None,
+):
+    debug("Starting export...")
+
+    from export_shared import EXPORT_SIZE, OUT
+    from export_to_opengs import run_export
+
+    # předá provinces + voronoi sea regions
+    run_export(
+        land,
+        final_regions,
+        theme_modes=theme_modes,
+        out_dir=out_dir or OUT,
+        size=size or EXPORT_SIZE,
+        tile_size=tile_size,
+        mesh_lods=mesh_lods,
+        workers=workers,
+        nuts_population=nuts_population,
+        borders=borders,
+    )
+
+    debug("Export complete.")
+
+
+def seed_everything(seed):
+    """
+    Reseed the global RNGs. Called before every stage (merge, subdivide, sea,
+    simplify, preview, export) by build(), watch_map and batch_map alike, so a
+    stage sees the same RNG state no matter which stages ran before it.
+    """
+    if seed is None:
+        return
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def build(config_path=CONFIG_PATH):
+    config = load_config(config_path)
+    seed = config["seed"]
+    workers = config["workers"]
+
+    admin = load_admin()
+    land, land_union = clean_geometry(admin, workers=workers)
+    seed_everything(seed)
+    land = merge_small_absolute(land, min_area=config["min_area_abs"], workers=workers)
+    seed_everything(seed)
+    land = subdivide_large(land, max_area=config["max_area_abs"], seed=seed, workers=workers)
+
+    seed_everything(seed)
+    final_regions = generate_sea_regions(
+        land,
+        land_union,
+        n_regions=config["n_regions"],
+        sample_points=config["sea_sample_points"],
+        smooth_radius=config["sea_smooth_radius"],
+        seed=config["seed"],
+        method=config["sea_method"],
+        raster_cell=config["sea_raster_cell"],
+        tile_size=config["sea_tile_size"],
+    )
+
+    seed_everything(seed)
+    land, final_regions = simplify_borders(
+        land, final_regions, config["simplify_px"], size=config["export_size"]
+    )
+
+    if config["preview"]:
+        seed_everything(seed)
+        render_preview(land, final_regions, preview_path(config))
+
+    if config["export"]:
+        from border_overlay import border_style
+
+        seed_everything(seed)
+        export_opengs(
+            land,
+            final_regions,
+            theme_modes=config["theme_modes"],
+            out_dir=output_dir(config),
+            size=config["export_size"],
+            tile_size=config["tile_size"],
+            mesh_lods=config["mesh_lods"],
+            workers=workers,
+            nuts_population=config["nuts_population"],
+            borders=border_style(config),
+        )
 
-fig, ax = plt.subplots(figsize=(18, 12))
 
-# sea
-for region in final_regions:
-    color = (random.random(), random.random(), random.random(), 0.7)
-    if region.geom_type == "MultiPolygon":
-        for p in region.geoms:
-            xs, ys = p.exterior.xy
-            ax.fill(xs, ys, color=color)
-    else:
-        xs, ys = region.exterior.xy
-        ax.fill(xs, ys, color=color)
 
-# land borders
-land.boundary.plot(ax=ax, color="white", linewidth=0.6)
+# =====================================================================
+# COMMAND LINE
+# =====================================================================
 
-ax.set_axis_off()
-fig.savefig(os.path.join(BASE, "preview_map.png"), dpi=350)
-plt.close(fig)
+def cmd_build(args):
+    build(os.path.abspath(args.config))
 
-debug("PART 4 DONE")
 
+def cmd_watch(args):
+    from watch_map import watch
 
-# =====================================================================
-# PART 5 — EXPORT TO OPENGS
-# =====================================================================
+    try:
+        watch(os.path.abspath(args.config), interval=args.interval)
+    except KeyboardInterrupt:
+        print("[WATCH] Stopped.")
+
+
+def cmd_batch(args):
+    from batch_map import load_variants, run_batch
+
+    variants = load_variants(os.path.abspath(args.batch), os.path.abspath(args.config))
+    return 1 if run_batch(variants, workers=args.workers) else 0
+
+
+def cmd_wdqs(args):
+    from wdqs_batches import BATCHES, make_query
+
+    for key in args.batches or BATCHES:
+        print(f"--- {key} ---")
+        print(make_query(key))
+
+
+def cmd_theme(args):
+    from export_theme_map import rerender_theme_modes
+
+    config = load_config(os.path.abspath(args.config))
+    modes = [m for m in config["theme_modes"] if not args.modes or m["mode"] in args.modes]
+    unknown = set(args.modes) - {m["mode"] for m in modes}
+    if unknown:
+        print(f"[WARN] Theme modes not in {os.path.basename(args.config)}: {', '.join(sorted(unknown))}")
+    if not modes:
+        print("[EXPORT] No theme modes to render")
+        return 1
+    rerender_theme_modes(args.out_dir or output_dir(config), modes)
+
+
+def cmd_lookup(args):
+    from province_lookup import lookup_csv
+
+    config = load_config(os.path.abspath(args.config))
+    lookup_csv(os.path.abspath(args.points), args.out_dir or output_dir(config), crs=args.crs, out_path=args.output)
+
+
+def cmd_validate(args):
+    from validate_export import validate_export
+
+    config = load_config(os.path.abspath(args.config))
+    report = validate_export(args.out_dir or output_dir(config), full_hash=args.hash)
+    return 1 if report.problems else 0
+
+
+def main(argv=None):
+    config = argparse.ArgumentParser(add_help=False)
+    config.add_argument("--config", default=CONFIG_PATH, help="JSON build config")
+
+    parser = argparse.ArgumentParser(description="Europe province map build for OpenGS.")
+    parser.set_defaults(config=CONFIG_PATH, run=cmd_build)
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    commands.add_parser("build", parents=[config], help="full build (default)").set_defaults(run=cmd_build)
+
+    p = commands.add_parser("watch", parents=[config], help="resident build, reruns stages on config / population changes")
+    p.add_argument("--interval", type=float, default=1.0, help="poll interval in seconds")
+    p.set_defaults(run=cmd_watch)
+
+    p = commands.add_parser("batch", parents=[config], help="build the variants of a batch file")
+    p.add_argument("batch", help="JSON file with the variant list")
+    p.add_argument("--workers", type=int, default=None, help="variant processes (default: all cores)")
+    p.set_defaults(run=cmd_batch)
+
+    p = commands.add_parser("wdqs", help="print the Wikidata population queries")
+    p.add_argument("batches", nargs="*", help="batch keys (default: all)")
+    p.set_defaults(run=cmd_wdqs)
 
-debug("Starting export...")
+    p = commands.add_parser("theme", parents=[config], help="re-render theme_modes from the id raster of the last export")
+    p.add_argument("modes", nargs="*", help="mode names (default: every mode in theme_modes)")
+    p.add_argument("--out-dir", help="export folder (default: out_dir of the config)")
+    p.set_defaults(run=cmd_theme)
 
-from export_to_opengs import run_export
+    p = commands.add_parser("lookup", parents=[config], help="province id, state and sea flag of CSV points")
+    p.add_argument("points", help="CSV with lon/lat (or x/y) columns")
+    p.add_argument("--crs", default="EPSG:4326", help="CRS of the points (default: EPSG:4326)")
+    p.add_argument("-o", "--output", help="output CSV (default: <points>_provinces.csv)")
+    p.add_argument("--out-dir", help="export folder (default: out_dir of the config)")
+    p.set_defaults(run=cmd_lookup)
 
-# předá provinces + voronoi sea regions
-run_export(land, final_regions)
+    p = commands.add_parser("validate", parents=[config], help="check a finished export for consistency")
+    p.add_argument("out_dir", nargs="?", help="export folder (default: out_dir of the config)")
+    p.add_argument("--hash", action="store_true", help="also compare file hashes with the manifest")
+    p.set_defaults(run=cmd_validate)
 
+    args = parser.parse_args(argv)
+    return args.run(args) or 0
 
 
-debug("Export complete.")
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+"""
+Country-partitioned executor for the land pipeline.
+
+Every country's GeoDataFrame slice is processed independently, largest
+countries first so RUS/TUR do not end up as the last straggler, and the
+results are concatenated in sorted country order so the output does not
+depend on which worker finished first.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+def resolve_workers(workers):
+    """None -> all cores, 0/1 -> serial."""
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+def country_cost(group):
+    # vertex count is a better proxy for GEOS work than row count
+    return int(shapely.get_num_coordinates(group.geometry.to_numpy()).sum())
+
+
+def map_countries(gdf, func, *args, workers=0, keep_order=False, ignore_index=True):
+    """
+    Run func(country_slice, *args) for every country of gdf["country"].
+
+    func must be a module-level function (it is pickled for the process pool)
+    and return a DataFrame. Results are concatenated in sorted country order;
+    keep_order=True puts the rows back into gdf's original order instead (func
+    must then keep the index labels; rows it splits keep their parent's label).
+    """
+    groups = {country: group for country, group in gdf.groupby("country", sort=True)}
+    if not groups:
+        return gdf.copy()
+
+    workers = min(resolve_workers(workers), len(groups))
+    order = sorted(groups, key=lambda c: -country_cost(groups[c]))
+
+    results = {}
+    if workers <= 1:
+        for country in order:
+            results[country] = func(groups[country], *args)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {country: pool.submit(func, groups[country], *args) for country in order}
+            for country, future in futures.items():
+                results[country] = future.result()
+
+    parts = [results[c] for c in sorted(results)]
+    if keep_order:
+        out = pd.concat(parts)
+        position = pd.Series(np.arange(len(gdf)), index=gdf.index)
+        return out.iloc[np.argsort(position.loc[out.index].to_numpy(), kind="stable")]
+    return pd.concat(parts, ignore_index=ignore_index)
@@ -1,38 +1,41 @@
-import os
-import random
+import numpy as np
 from PIL import Image, ImageDraw
 
-from export_shared import EXPORT_SIZE, SEA_COLOR, OUTLINE_COLOR, OUT, draw_voronoi_outline
+from export_shared import SEA_COLOR, OUTLINE_COLOR, draw_voronoi_outline, render_palettes, state_color
+from province_db import state_groups
 
+NAME = "PoliticalMap.png"
 
-def export_political_map(id_map, land, sea_regions, bounds):
-    h, w = id_map.shape
 
-    img = Image.new("RGB", (w, h), SEA_COLOR)
+def export_political_map(id_map, land, sea_regions, bounds, writer, diff=None, borders=None):
+    states, _, _, codes = state_groups(land)
+    # same colours as States.txt
+    state_colors = np.array([state_color(st) for st in states], dtype=np.uint8).reshape(-1, 3)
+
+    # pid -> state color, provinces without a state stay sea colored
+    max_pid = int(id_map.max())
+    palette = np.empty((max_pid + 1, 3), dtype=np.uint8)
+    palette[:] = SEA_COLOR
+
+    pids = np.asarray(land.index, dtype=np.int64)
+    keep = (pids >= 0) & (pids <= max_pid) & (codes >= 0)
+    palette[pids[keep]] = state_colors[codes[keep]]
+
+    # with a diff of the previous export only the dirty windows are rendered again
+    windows = diff.windows(NAME, palette) if diff is not None else None
+    if windows == []:
+        writer.keep(NAME)
+        return
+    if windows is None:
+        rgb = render_palettes(id_map, [palette])[0]
+    else:
+        rgb = diff.patch(NAME, palette, windows)
+    if borders is not None:
+        borders.apply(rgb)
+    img = Image.fromarray(rgb, "RGB")
+    del rgb
+
     draw = ImageDraw.Draw(img)
+    draw_voronoi_outline(draw, sea_regions, bounds, img.width, OUTLINE_COLOR)
 
-    states = sorted(land["country"].unique())
-    state_colors = {
-        c: (
-            random.randint(20, 235),
-            random.randint(20, 235),
-            random.randint(20, 235),
-        )
-        for c in states
-    }
-
-    province_to_state = land["country"].to_dict()
-    px = img.load()
-
-    for y in range(h):
-        for x in range(w):
-            pid = id_map[y, x]
-            if pid < 0:
-                continue
-            st = province_to_state.get(pid)
-            if st:
-                px[x, y] = state_colors[st]
-
-    draw_voronoi_outline(draw, sea_regions, bounds, EXPORT_SIZE, OUTLINE_COLOR)
-
-    img.save(os.path.join(OUT, "PoliticalMap.png"))
+    writer.save_image(NAME, img)
@@ -1,16 +1,21 @@
+import hashlib
 import os
+import sys
+import tracemalloc
+
+import numpy as np
 
 EXPORT_SIZE = 4096
 SEA_COLOR = (20, 80, 200)
 OUTLINE_COLOR = (0, 32, 96)
 OUTLINE_WIDTH = 1
+# traced (tracemalloc) peaks per export stage slow every allocation down, so they are opt-in
+TRACE_MEMORY = os.environ.get("BUILD_MAP_TRACE_MEMORY", "") not in ("", "0")
 
 BASE = os.path.dirname(os.path.abspath(__file__))
+# created by the OutputWriter on the first write, importing this module has no side effects
 OUT = os.path.join(BASE, "opengs_export")
 
-os.makedirs(OUT, exist_ok=True)
-os.makedirs(os.path.join(OUT, "States"), exist_ok=True)
-
 
 def geom_to_pixel_coords(geom, bounds, size):
     minx, miny, maxx, maxy = bounds
@@ -32,3 +37,168 @@ def draw_voronoi_outline(draw, sea_regions, bounds, size, color):
         for poly in polys:
             coords = geom_to_pixel_coords(poly, bounds, size)
             draw.line(coords, fill=color, width=OUTLINE_WIDTH)
+
+
+# --------------------------------------------------------
+# STABLE COLOURS
+# --------------------------------------------------------
+def hashed_color(key, low=0, high=255, step=1):
+    """RGB derived from a hash of `key`: the same key gets the same colour in every build, seeded or not."""
+    levels = (high - low) // step + 1
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=3).digest()
+    return tuple(low + (byte % levels) * step for byte in digest)
+
+
+def state_color(code):
+    """PoliticalMap / States.txt colour of a state code."""
+    return hashed_color(f"state:{code}", 20, 235)
+
+
+# --------------------------------------------------------
+# COMPACT RASTERS
+# --------------------------------------------------------
+def pack_rgb(arr):
+    return (
+        (arr[..., 0].astype(np.uint32) << 16)
+        | (arr[..., 1].astype(np.uint32) << 8)
+        | arr[..., 2].astype(np.uint32)
+    )
+
+
+def unpack_rgb(keys):
+    keys = np.asarray(keys, dtype=np.uint32)
+    return np.stack([(keys >> 16) & 255, (keys >> 8) & 255, keys & 255], axis=-1).astype(np.uint8)
+
+
+def image_rows(img, top, bottom):
+    """RGB rows [top, bottom) of a PIL image as an array, without copying the whole image."""
+    return np.asarray(img.crop((0, top, img.width, bottom)).convert("RGB"))
+
+
+ROW_CHUNK = 256   # rows processed at once by the raster stages
+
+
+def id_dtype(max_id):
+    """Narrowest signed dtype for an id raster (-1 stays the sea/no-province marker)."""
+    for dt in (np.int16, np.int32):
+        if max_id <= np.iinfo(dt).max:
+            return dt
+    return np.int64
+
+
+def row_chunks(h, rows=ROW_CHUNK):
+    for top in range(0, h, rows):
+        yield top, min(top + rows, h)
+
+
+def render_palettes(id_map, palettes, sea_color=SEA_COLOR, missing=(120, 120, 120)):
+    """
+    Render several pid -> RGB palettes in one pass over id_map, row chunk by row chunk.
+    Sea pixels (pid < 0) and pids outside a palette get sea_color / missing.
+    Returns a list of contiguous HxWx3 uint8 arrays.
+    """
+    n = max(len(p) for p in palettes)
+    # rows 0..n-1 palettes (missing where a palette is shorter), n missing, n + 1 sea
+    lut = np.empty((n + 2, 3 * len(palettes)), dtype=np.uint8)
+    lut[:] = np.tile(np.asarray(missing, dtype=np.uint8), len(palettes))
+    for i, p in enumerate(palettes):
+        lut[: len(p), 3 * i:3 * i + 3] = p
+    lut[n + 1] = np.tile(np.asarray(sea_color, dtype=np.uint8), len(palettes))
+
+    h, w = id_map.shape
+    outs = [np.empty((h, w, 3), dtype=np.uint8) for _ in palettes]
+
+    for top, bottom in row_chunks(h):
+        block = id_map[top:bottom]
+        idx = np.where(block < 0, n + 1, np.minimum(block, n))
+        stacked = lut[idx]
+        for i, out in enumerate(outs):
+            out[top:bottom] = stacked[:, :, 3 * i:3 * i + 3]
+
+    return outs
+
+
+# --------------------------------------------------------
+# MEMORY CEILING
+# --------------------------------------------------------
+def process_peak_mb():
+    """Peak resident memory of this process in MB (None if the platform gives no number)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS bytes
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / 1024 / 1024
+    except (AttributeError, OSError):
+        pass
+
+    return None
+
+
+class MemoryReport:
+    """
+    Process peak after every export stage; with trace (BUILD_MAP_TRACE_MEMORY=1)
+    also the traced (NumPy + Python) peak per stage. NumPy buffers are visible to
+    tracemalloc; PIL images only show up in the process peak.
+    """
+
+    def __init__(self, trace=TRACE_MEMORY):
+        self.trace = trace
+        self.stages = []
+        self.current = None
+        self.started = trace and not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+
+    def stage(self, name):
+        self._close()
+        if self.trace:
+            tracemalloc.reset_peak()
+        self.current = name
+
+    def _close(self):
+        if self.current is not None:
+            traced = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if self.trace else None
+            self.stages.append((self.current, process_peak_mb(), traced))
+            self.current = None
+
+    def finish(self):
+        self._close()
+        if self.started:
+            tracemalloc.stop()
+
+        def fmt(proc, traced):
+            parts = [f"process peak {proc:.0f} MB"] if proc is not None else []
+            if traced is not None:
+                parts.append(f"traced peak {traced:.0f} MB")
+            return ", ".join(parts) or "no numbers on this platform"
+
+        for name, proc, traced in self.stages:
+            print(f"[MEM] {name}: {fmt(proc, traced)}")
+        ceiling = max((t for _, _, t in self.stages if t is not None), default=None)
+        print(f"[MEM] Ceiling: {fmt(process_peak_mb(), ceiling)}")
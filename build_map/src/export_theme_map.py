@@ -1,130 +1,309 @@
-import json
 import os
-import random
-import math
+import zlib
+
+import numpy as np
+import pandas as pd
 from PIL import Image, ImageDraw
 
-from export_shared import EXPORT_SIZE, SEA_COLOR, OUTLINE_COLOR, OUT, draw_voronoi_outline
+from border_overlay import BorderOverlay
+from export_shared import OUTLINE_COLOR, OUT, BASE, draw_voronoi_outline, render_palettes
+from output_writer import OutputWriter
+from raster_diff import BuildDiff, load_render_state
+
+NO_DATA_COLOR = (120, 120, 120)
+
+
+# --------------------------------------------------------
+# METRICS (pid -> value, as dense arrays)
+# --------------------------------------------------------
+def metric_array(metric, size):
+    """
+    dict / Series / array keyed by pid -> array of `size`, NaN where missing.
+    Numeric metrics come back as float, categorical ones (e.g. strings) as object.
+    """
+    if metric is None:
+        return np.full(size, np.nan, dtype=np.float64)
+
+    if isinstance(metric, np.ndarray):
+        metric = pd.Series(metric[:size])
+    elif isinstance(metric, dict):
+        metric = pd.Series(metric)
 
+    vals = pd.to_numeric(metric, errors="coerce")
+    if (vals.isna() & metric.notna()).any():
+        vals, out = metric.to_numpy(dtype=object), np.full(size, np.nan, dtype=object)
+    else:
+        vals, out = vals.to_numpy(dtype=np.float64), np.full(size, np.nan, dtype=np.float64)
 
-def export_theme_map(id_map, bounds, sea_regions, filename, values):
-    h, w = id_map.shape
+    pids = np.asarray(metric.index, dtype=np.int64)
+    keep = (pids >= 0) & (pids < size)
+    out[pids[keep]] = vals[keep]
+    return out
 
-    img = Image.new("RGB", (w, h))
-    px = img.load()
 
-    for y in range(h):
-        for x in range(w):
-            pid = id_map[y, x]
-            if pid < 0:
-                px[x, y] = SEA_COLOR
-            else:
-                px[x, y] = values.get(pid, (120, 120, 120))
+def table_values(values):
+    """Float view of a metric for raster_diff tables; categories become their codes."""
+    if values.dtype != object:
+        return values
+    codes, _ = pd.factorize(values, sort=False)
+    return np.where(codes >= 0, codes, np.nan)
 
+
+def load_metric_csv(path, column, key="province_id", sep=";", out_dir=OUT):
+    """Read one metric column from any CSV keyed by province id (relative paths: out_dir first, then BASE)."""
+    if not os.path.isabs(path):
+        in_out = os.path.join(out_dir, path)
+        path = in_out if os.path.exists(in_out) else os.path.join(BASE, path)
+
+    df = pd.read_csv(path, sep=sep, usecols=[key, column])
+    df = df.dropna(subset=[key])
+    # numeric columns stay numeric, anything else is kept for categorical colormaps
+    return pd.Series(df[column].to_numpy(), index=df[key].astype(np.int64).to_numpy())
+
+
+# --------------------------------------------------------
+# COLORMAPS (vectorized, one palette row per pid)
+# --------------------------------------------------------
+def _ramp(t, low, high):
+    low = np.asarray(low, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    return low + (high - low) * t[:, None]
+
+
+def compute_palette(values, spec):
+    """
+    values: metric_array result indexed by pid (NaN = no data)
+    spec: {"kind": "linear" | "log" | "quantile" | "categorical", ...}
+        linear/log:  low, high, optional vmin/vmax
+        quantile:    colors (one per bucket)
+        categorical: colors (list cycled over categories, or {value: color})
+    Returns uint8 array (len(values), 3).
+    """
+    kind = spec.get("kind", "linear")
+    palette = np.empty((len(values), 3), dtype=np.float64)
+    palette[:] = spec.get("missing", NO_DATA_COLOR)
+
+    if kind == "categorical":
+        colors = spec["colors"]
+        valid = ~pd.isna(values)
+        if isinstance(colors, dict):
+            # keys are compared as values: numbers (JSON keys are strings) for numeric
+            # metrics, text for categorical ones; keys that fit neither match nothing
+            numeric = values.dtype != object
+            labels = values if numeric else values.astype(str)
+            for value, color in colors.items():
+                key = pd.to_numeric(value, errors="coerce") if numeric else str(value)
+                palette[valid & (labels == key)] = color
+        else:
+            codes, _ = pd.factorize(values[valid], sort=True)
+            table = np.asarray(colors, dtype=np.float64)
+            palette[valid] = table[codes % len(table)]
+        return palette.astype(np.uint8)
+
+    values = pd.to_numeric(values, errors="coerce").astype(np.float64)
+
+    if kind == "log":
+        valid = np.isfinite(values) & (values > 0)
+        v = np.log10(values, where=valid, out=np.zeros_like(values))
+    else:
+        valid = np.isfinite(values)
+        v = values
+
+    if not valid.any():
+        return palette.astype(np.uint8)
+
+    if kind == "quantile":
+        colors = np.asarray(spec["colors"], dtype=np.float64)
+        edges = np.quantile(v[valid], np.linspace(0, 1, len(colors) + 1)[1:-1])
+        palette[valid] = colors[np.searchsorted(edges, v[valid], side="right")]
+        return palette.astype(np.uint8)
+
+    vmin = spec.get("vmin")
+    vmax = spec.get("vmax")
+    lo = v[valid].min() if vmin is None else (np.log10(vmin) if kind == "log" else vmin)
+    hi = v[valid].max() if vmax is None else (np.log10(vmax) if kind == "log" else vmax)
+    span = (hi - lo) or 1.0
+
+    t = np.clip((v[valid] - lo) / span, 0.0, 1.0)
+    palette[valid] = _ramp(t, spec["low"], spec["high"])
+    return np.rint(palette).astype(np.uint8)
+
+
+# --------------------------------------------------------
+# RENDERING
+# --------------------------------------------------------
+def save_theme_image(rgb, bounds, sea_regions, filename, writer):
+    img = Image.fromarray(rgb, "RGB")
     draw = ImageDraw.Draw(img)
-    draw_voronoi_outline(draw, sea_regions, bounds, EXPORT_SIZE, OUTLINE_COLOR)
+    draw_voronoi_outline(draw, sea_regions, bounds, img.width, OUTLINE_COLOR)
+    writer.save_image(filename, img)
 
-    img.save(os.path.join(OUT, filename))
 
+def mode_dir(mode_name):
+    return os.path.join("Modes", mode_name)
 
-def export_mode_folder(mode_name, file_name, description):
-    mode_dir = os.path.join(OUT, "Modes", mode_name)
-    os.makedirs(mode_dir, exist_ok=True)
 
-    src = os.path.join(OUT, f"{file_name}.png")
-    dst = os.path.join(mode_dir, f"{file_name}.png")
-    if os.path.exists(src):
-        os.replace(src, dst)
+def export_mode_folder(mode_name, file_name, description, writer):
+    """Write manifest.txt + meta.json; the map itself is saved straight into Modes/<mode>/."""
+    folder = mode_dir(mode_name)
 
-    manifest_path = os.path.join(mode_dir, "manifest.txt")
-    with open(manifest_path, "w") as f:
-        f.write(f"mode={mode_name}\n")
-        f.write(f"map={file_name}.png\n")
+    writer.write_text(
+        os.path.join(folder, "manifest.txt"),
+        f"mode={mode_name}\n" f"map={file_name}.png\n",
+    )
 
-    meta_path = os.path.join(mode_dir, "meta.json")
     meta = {
         "id": mode_name.lower(),
         "name": mode_name,
         "description": description,
         "map_file": f"{file_name}.png",
     }
-
-    with open(meta_path, "w") as f:
-        json.dump(meta, f, indent=4)
+    writer.write_json(os.path.join(folder, "meta.json"), meta)
 
     print(f"[EXPORT] Mode folder '{mode_name}' created.")
 
 
-def export_gdp_map(id_map, sea_regions, bounds, max_pid=None):
+# --------------------------------------------------------
+# THEME ENGINE
+# --------------------------------------------------------
+def export_theme_modes(id_map, sea_regions, bounds, modes, writer, max_pid=None, diff=None, borders=None):
+    """
+    modes: list of dicts
+        mode, file, description  -> Modes/<mode>/<file>.png
+        metric                   -> dict / Series / array keyed by pid
+          or csv + column (+ key, sep) -> metric read from a CSV keyed by pid
+        colormap                 -> spec for compute_palette
+    All palettes that need a full render are rendered in one pass over id_map;
+    with `diff` (raster_diff.BuildDiff) the others only patch their dirty windows.
+    `borders` (border_overlay.BorderOverlay) is painted into every map.
+    Returns the written map paths (relative to the export folder).
+    """
+    if not modes:
+        return []
+
     max_pid = max_pid if max_pid is not None else int(id_map.max())
-    gdp_values = {
-        pid: (random.randint(120, 255), 50, 50)
-        for pid in range(max_pid + 1)
+    size = max_pid + 1
+
+    if any(mode.get("metric") is None and mode.get("csv") for mode in modes):
+        # metric CSVs may be outputs of this export (e.g. Population.csv) still in the write queue
+        writer.flush()
+
+    palettes, paths, plans = [], [], []
+    for mode in modes:
+        metric = mode.get("metric")
+        if metric is None and mode.get("csv"):
+            metric = load_metric_csv(
+                mode["csv"],
+                mode["column"],
+                key=mode.get("key", "province_id"),
+                sep=mode.get("sep", ";"),
+                out_dir=writer.out_dir,
+            )
+        values = metric_array(metric, size)
+        palette = compute_palette(values, mode["colormap"])
+        path = os.path.join(mode_dir(mode["mode"]), f"{mode['file']}.png")
+
+        palettes.append(palette)
+        paths.append(path)
+        if diff is not None:
+            changed = diff.compare_table(path, table_values(values))
+            plans.append(diff.windows(path, palette, changed))
+        else:
+            plans.append(None)
+
+    full = [i for i, plan in enumerate(plans) if plan is None]
+    rendered = render_palettes(id_map, [palettes[i] for i in full], missing=NO_DATA_COLOR) if full else []
+    rendered = dict(zip(full, rendered))
+
+    for i, mode in enumerate(modes):
+        # release every map as soon as it is saved
+        if i in rendered:
+            rgb = rendered.pop(i)
+        elif plans[i]:
+            rgb = diff.patch(paths[i], palettes[i], plans[i], missing=NO_DATA_COLOR)
+        else:
+            writer.keep(paths[i])
+            rgb = None
+
+        if rgb is not None:
+            if borders is not None:
+                borders.apply(rgb)
+            save_theme_image(rgb, bounds, sea_regions, paths[i], writer)
+            del rgb
+        export_mode_folder(mode["mode"], mode["file"], mode.get("description", ""), writer)
+
+    return paths
+
+
+def rerender_theme_modes(out_dir, modes):
+    """
+    Render theme modes again without a build, from the id raster, sea outline,
+    bounds and border masks stored by the last export in out_dir. Only windows whose values changed
+    are redrawn. Returns the written map paths.
+    """
+    state = load_render_state(out_dir)
+    if state is None:
+        raise FileNotFoundError(f"No stored export state in {out_dir}, run a full export first")
+    id_map, sea_regions, bounds, overlay = state
+
+    writer = OutputWriter(out_dir)
+    diff = BuildDiff(writer, id_map, overlay)
+    borders = BorderOverlay.load(diff.dir)
+    paths = export_theme_modes(id_map, sea_regions, bounds, modes, writer, diff=diff, borders=borders)
+    writer.finish()
+    # the other maps of the export keep their stored state
+    diff.save(partial=True)
+    return paths
+
+
+def random_metric(max_pid, low=120, high=255, key=""):
+    """Placeholder values per pid, from a generator seeded by `key`, so the map is the same in every build."""
+    rng = np.random.default_rng(zlib.crc32(key.encode("utf-8")))
+    return rng.integers(low, high + 1, size=max_pid + 1).astype(np.float64)
+
+
+def gdp_mode(max_pid):
+    return {
+        "mode": "GDP",
+        "file": "GDPMap",
+        "description": "Gross Domestic Product heatmap",
+        "metric": random_metric(max_pid, key="GDP"),
+        "colormap": {"kind": "linear", "low": (120, 50, 50), "high": (255, 50, 50), "vmin": 120, "vmax": 255},
     }
-    export_theme_map(id_map, bounds, sea_regions, "GDPMap.png", gdp_values)
-    export_mode_folder("GDP", "GDPMap", "Gross Domestic Product heatmap")
 
 
-def export_population_map(id_map, sea_regions, bounds, population=None, land_areas=None, max_pid=None):
+def population_mode(max_pid, population=None, land_areas=None):
     """
     population: dict pid -> population number
     land_areas: dict pid -> area in km^2 (for density). If provided, density is used; otherwise raw pop.
     """
-    max_pid = max_pid if max_pid is not None else int(id_map.max())
+    if population is not None and len(population):
+        pop = np.nan_to_num(metric_array(population, max_pid + 1))
+        if land_areas is not None and len(land_areas):
+            area = metric_array(land_areas, max_pid + 1)
+            area[np.isnan(area)] = 1.0
+            metric = pop / area
+        else:
+            metric = pop
+        colormap = {"kind": "log", "low": (190, 230, 150), "high": (0, 120, 0)}
+    else:
+        metric = random_metric(max_pid, key="Population")
+        colormap = {"kind": "linear", "low": (50, 120, 50), "high": (50, 255, 50), "vmin": 120, "vmax": 255}
+
+    return {
+        "mode": "Population",
+        "file": "PopulationMap",
+        "description": "Population density map",
+        "metric": metric,
+        "colormap": colormap,
+    }
 
-    pop_values = None
-    metric = None
 
-    if population:
-        if land_areas:
-            metric = {
-                pid: (population.get(pid) or 0) / land_areas.get(pid, 1)
-                for pid in range(max_pid + 1)
-            }
-        else:
-            metric = {pid: population.get(pid, 0) for pid in range(max_pid + 1)}
-
-    if metric:
-        vals = [v for v in metric.values() if v > 0]
-        if vals:
-            log_min = min(math.log10(v) for v in vals)
-            log_max = max(math.log10(v) for v in vals)
-            span = log_max - log_min or 1.0
-
-            def lerp(a, b, t):
-                return int(a + (b - a) * t)
-
-            low = (190, 230, 150)   # light green
-            high = (0, 120, 0)      # dark green
-
-            pop_values = {}
-            for pid in range(max_pid + 1):
-                v = metric.get(pid, 0)
-                if v <= 0:
-                    pop_values[pid] = (120, 120, 120)
-                    continue
-                t = (math.log10(v) - log_min) / span
-                pop_values[pid] = (
-                    lerp(low[0], high[0], t),
-                    lerp(low[1], high[1], t),
-                    lerp(low[2], high[2], t),
-                )
-
-    if pop_values is None:
-        pop_values = {
-            pid: (50, random.randint(120, 255), 50)
-            for pid in range(max_pid + 1)
-        }
-
-    export_theme_map(id_map, bounds, sea_regions, "PopulationMap.png", pop_values)
-    export_mode_folder("Population", "PopulationMap", "Population density map")
-
-
-def export_ideology_map(id_map, sea_regions, bounds, max_pid=None):
-    max_pid = max_pid if max_pid is not None else int(id_map.max())
-    ideo_values = {
-        pid: (50, 50, random.randint(120, 255))
-        for pid in range(max_pid + 1)
+def ideology_mode(max_pid):
+    return {
+        "mode": "Ideology",
+        "file": "IdeologyMap",
+        "description": "Ideological spectrum map",
+        "metric": random_metric(max_pid, key="Ideology"),
+        "colormap": {"kind": "linear", "low": (50, 50, 120), "high": (50, 50, 255), "vmin": 120, "vmax": 255},
     }
-    export_theme_map(id_map, bounds, sea_regions, "IdeologyMap.png", ideo_values)
-    export_mode_folder("Ideology", "IdeologyMap", "Ideological spectrum map")
@@ -1,47 +1,74 @@
 import os
-import random
 import numpy as np
 from PIL import Image, ImageDraw
 
-from export_shared import EXPORT_SIZE, SEA_COLOR, OUT, geom_to_pixel_coords
-from export_political_map import export_political_map
+from export_shared import (
+    EXPORT_SIZE,
+    OUTLINE_COLOR,
+    OUTLINE_WIDTH,
+    SEA_COLOR,
+    OUT,
+    MemoryReport,
+    geom_to_pixel_coords,
+    hashed_color,
+    id_dtype,
+    image_rows,
+    pack_rgb,
+    row_chunks,
+    state_color,
+)
+from border_overlay import BorderOverlay, overlay_key, province_states
+from export_political_map import NAME as POLITICAL_MAP, export_political_map
 from export_theme_map import (
-    export_gdp_map,
-    export_population_map,
-    export_ideology_map,
+    NO_DATA_COLOR,
+    export_theme_modes,
+    gdp_mode,
+    population_mode,
+    ideology_mode,
 )
-from import_population import generate_population_dataset
+from geometry_cache import geometry_key
+from output_writer import OutputWriter
+from province_db import TYPE_SEA, build_province_table, export_province_db, state_groups
+from province_lookup import export_lookup_shapes
+from province_runs import export_province_runs
+from raster_diff import BuildDiff
 
 
 # --------------------------------------------------------
 # UNIQUE COLOR GENERATOR (no duplication possible)
 # --------------------------------------------------------
-def unique_color(used, step=16):
+def unique_color(used, key, step=1):
+    """
+    Colour of province `key`, from a hash of the key so unchanged provinces keep
+    their colour (and ProvinceMap its bytes) across builds. Taken colours are
+    probed with key#1, key#2, ... The full 24-bit space (step 1) leaves room
+    for far more provinces than a map has.
+    """
+    levels = 255 // step + 1
+    if len(used) >= levels ** 3:
+        raise ValueError(f"No free ProvinceMap colour left ({len(used)} used, step {step})")
+    attempt = 0
     while True:
-        step = 20   # increase to 32 if needed
-
-        r = random.randrange(0, 256, step)
-        g = random.randrange(0, 256, step)
-        b = random.randrange(0, 256, step)
-
-        c = (r, g, b)
+        c = hashed_color(key if attempt == 0 else f"{key}#{attempt}", 0, 255, step)
         if c not in used:
             used.add(c)
             return c
+        attempt += 1
 
 # --------------------------------------------------------
 # EXPORT PROVINCE MAP (colors must NOT repeat)
 # --------------------------------------------------------
-def export_province_map(land, sea_regions):
+def export_province_map(land, sea_regions, writer, size=EXPORT_SIZE):
 
     minx, miny, maxx, maxy = land.total_bounds
     bounds = (minx, miny, maxx, maxy)
 
-    img = Image.new("RGB", (EXPORT_SIZE, EXPORT_SIZE), SEA_COLOR)
+    img = Image.new("RGB", (size, size), SEA_COLOR)
     draw = ImageDraw.Draw(img)
 
     province_colors = {}
-    used_colors = set()   # stores all used RGB colors
+    # stores all used RGB colors; the background sea colour is never handed out
+    used_colors = {tuple(SEA_COLOR)}
 
     # -------------------------
     # LAND PROVINCES
@@ -51,12 +78,12 @@ def export_province_map(land, sea_regions):
         if geom.is_empty:
             continue
 
-        color = unique_color(used_colors)
+        color = unique_color(used_colors, f"land:{pid}")
         province_colors[color] = pid
 
         polys = [geom] if geom.geom_type == "Polygon" else geom.geoms
         for poly in polys:
-            coords = geom_to_pixel_coords(poly, bounds, EXPORT_SIZE)
+            coords = geom_to_pixel_coords(poly, bounds, size)
             draw.polygon(coords, fill=color)
 
     print("[DEBUG] Land provinces:", len(land))
@@ -65,239 +92,285 @@ def export_province_map(land, sea_regions):
     # -------------------------
     # SEA REGIONS (unique too)
     # -------------------------
-    sea_color_count = 0
+    sea_colors = []
 
-    for region in sea_regions:
-        color = unique_color(used_colors)
-        sea_color_count += 1
+    for i, region in enumerate(sea_regions):
+        color = unique_color(used_colors, f"sea:{i}")
+        sea_colors.append(color)
 
         polys = [region] if region.geom_type == "Polygon" else region.geoms
         for poly in polys:
-            coords = geom_to_pixel_coords(poly, bounds, EXPORT_SIZE)
+            coords = geom_to_pixel_coords(poly, bounds, size)
             draw.polygon(coords, fill=color)
 
-    print("[DEBUG] Sea regions:", sea_color_count)
-    print("[DEBUG] Total unique colors:", len(used_colors))
+    print("[DEBUG] Sea regions:", len(sea_colors))
+    print("[DEBUG] Total unique colors:", len(used_colors) - 1)
 
     # -------------------------
     # SAVE UNCOMPRESSED PNG
     # -------------------------
-    img.save(
-        os.path.join(OUT, "ProvinceMap.png"),
+    writer.save_image(
+        "ProvinceMap.png",
+        img,
         format="PNG",
         optimize=False,
         compress_level=0,
         bits=8
     )
 
-    return province_colors, bounds
+    return province_colors, bounds, img, sea_colors
 
 
 # --------------------------------------------------------
 # EXPORT ID MAP
 # --------------------------------------------------------
-def export_id_map(province_colors):
-
-    img = Image.open(os.path.join(OUT, "ProvinceMap.png")).convert("RGB")
-    arr = np.array(img)
-    h, w, _ = arr.shape
-
-    lut = np.full((256, 256, 256), -1, dtype=np.int32)
-
-    for col, pid in province_colors.items():
-        r, g, b = col
-        lut[r, g, b] = pid
-
-    id_map = np.zeros((h, w), dtype=np.int32)
-
-    for y in range(h):
-        for x in range(w):
-            r, g, b = arr[y, x]
-            id_map[y, x] = lut[r, g, b]
-
-    # Mask output
-    mask = Image.new("RGB", (w, h))
-    px = mask.load()
-
-    for y in range(h):
-        for x in range(w):
-            pid = id_map[y, x]
-            if pid < 0:
-                px[x, y] = SEA_COLOR
-            else:
-                px[x, y] = (pid % 256, pid // 256, 0)
-
-    mask.save(os.path.join(OUT, "ProvinceMask.png"))
+def export_id_map(province_colors, writer, img):
+    """
+    ProvinceMap colors -> id raster in the narrowest dtype that fits (int16 for < 32k ids).
+    Works in row chunks: no 256³ LUT and no full-size RGB or key temporaries.
+    """
+    w, h = img.size
+
+    keys = pack_rgb(np.array(list(province_colors), dtype=np.uint8).reshape(-1, 3))
+    pids = np.array(list(province_colors.values()), dtype=np.int64)
+    order = np.argsort(keys)
+    keys, pids = keys[order], pids[order]
+
+    dtype = id_dtype(int(pids.max()) if len(pids) else 0)
+    id_map = np.empty((h, w), dtype=dtype)
+    mask = np.empty((h, w, 3), dtype=np.uint8)
+
+    for top, bottom in row_chunks(h):
+        chunk = pack_rgb(image_rows(img, top, bottom))
+        pos = np.clip(np.searchsorted(keys, chunk), 0, max(len(keys) - 1, 0))
+        ids = np.where(keys[pos] == chunk, pids[pos], -1) if len(keys) else np.full(chunk.shape, -1)
+        id_map[top:bottom] = ids
+
+        # Mask output
+        m = mask[top:bottom]
+        m[..., 0] = ids % 256
+        m[..., 1] = ids // 256
+        m[..., 2] = 0
+        m[ids < 0] = SEA_COLOR
+
+    writer.save_image("ProvinceMask.png", Image.fromarray(mask, "RGB"))
+    del mask
+
+    print(f"[DEBUG] id_map dtype: {id_map.dtype} ({id_map.nbytes / 1024 / 1024:.0f} MB)")
     return id_map
 
 
 # --------------------------------------------------------
 # EXPORT STATES
 # --------------------------------------------------------
-def export_states(land):
+def export_states(land, writer):
     states = sorted(land["country"].unique())
 
-    with open(os.path.join(OUT, "States.txt"), "w") as f:
-        for st in states:
-            r = random.randint(20, 235)
-            g = random.randint(20, 235)
-            b = random.randint(20, 235)
-            f.write(f"{st};{r};{g};{b}\n")
+    lines = []
+    for st in states:
+        r, g, b = state_color(st)
+        lines.append(f"{st};{r};{g};{b}\n")
+
+    writer.write_text("States.txt", "".join(lines))
 
 
 # --------------------------------------------------------
 # EXPORT STATE FILES
 # --------------------------------------------------------
-def export_state_files(land):
-    folder = os.path.join(OUT, "States")
-    states = sorted(land["country"].unique())
-    sid = 1
+def export_state_files(land, writer):
+    states, offsets, members, _ = state_groups(land)
 
-    for st in states:
-        provs = land.index[land["country"] == st].tolist()
+    for i, st in enumerate(states):
+        sid = i + 1
+        provs = members[offsets[i]:offsets[i + 1]]
 
-        with open(os.path.join(folder, f"{sid}_{st}.txt"), "w") as f:
-            f.write("state={\n")
-            f.write(f"    id={sid}\n")
-            f.write(f"    name=\"STATE_{st}\"\n")
-            f.write("    provinces={\n")
-            for p in provs:
-                f.write(f"        {p}\n")
-            f.write("    }\n")
-            f.write("}\n")
+        lines = [
+            "state={\n",
+            f"    id={sid}\n",
+            f"    name=\"STATE_{st}\"\n",
+            "    provinces={\n",
+        ]
+        lines += [f"        {p}\n" for p in provs]
+        lines += ["    }\n", "}\n"]
 
-        sid += 1
+        writer.write_text(os.path.join("States", f"{sid}_{st}.txt"), "".join(lines))
 
 
 # --------------------------------------------------------
 # EXPORT PROVINCES.TXT
 # --------------------------------------------------------
-def export_provinces_txt(province_colors, id_map, land):
-
-    out_path = os.path.join(OUT, "Provinces.txt")
-    h, w = id_map.shape
-
-    pid_to_color = {pid: col for col, pid in province_colors.items()}
+def export_provinces_txt(table, writer):
     rows = []
-
-    max_pid = int(id_map.max())
-
-    for pid in range(max_pid + 1):
-        if pid in pid_to_color:
-            r, g, b = pid_to_color[pid]
-            st = land.loc[pid]["country"]
-            typ = "land"
-            owner = st
-            controller = st
-        else:
+    states = table["states"]
+
+    # x;y is the label anchor (deepest interior pixel), not the pixel mean
+    for pid, (r, g, b), typ, state, (cx, cy) in zip(
+        table["id"], table["color"], table["type"], table["state"], table["anchor"]
+    ):
+        if typ == TYPE_SEA:
+            rows.append(f"{pid};{r};{g};{b};sea;SEA;SEA;SEA;0;0")
             continue
 
-        ys, xs = np.where(id_map == pid)
-        if len(xs) == 0:
-            cx, cy = 0, 0
-        else:
-            cx = int(xs.mean())
-            cy = int(ys.mean())
-
-        rows.append(f"{pid};{r};{g};{b};{typ};{st};{owner};{controller};{cx};{cy}")
-
-    # SEA detection
-    used_colors = set(pid_to_color.values())
-    img = Image.open(os.path.join(OUT, "ProvinceMap.png")).convert("RGB")
-    arr = np.array(img)
-
-    sea_seen = {}
-    for y in range(arr.shape[0]):
-        for x in range(arr.shape[1]):
-            col = tuple(arr[y, x])
-            if col not in used_colors:
-                if col not in sea_seen:
-                    sea_seen[col] = len(sea_seen)
-
-    base_sea_id = max_pid + 1
-    for idx, (col, _) in enumerate(sea_seen.items()):
-        r, g, b = col
-        sea_id = base_sea_id + idx
-        rows.append(f"{sea_id};{r};{g};{b};sea;SEA;SEA;SEA;0;0")
-
-    with open(out_path, "w") as f:
-        f.write("id;R;G;B;type;state;owner;controller;x;y\n")
-        for r in rows:
-            f.write(r + "\n")
+        st = states[state]
+        rows.append(f"{pid};{r};{g};{b};land;{st};{st};{st};{int(cx)};{int(cy)}")
+
+    writer.write_text(
+        "Provinces.txt",
+        "id;R;G;B;type;state;owner;controller;x;y\n" + "".join(r + "\n" for r in rows),
+    )
 
     print(f"[EXPORT] Provinces.txt written ({len(rows)} entries).")
 
 
-def write_population_txt(rows, debug_rows, path):
+# --------------------------------------------------------
+# EXPORT LABEL ANCHORS
+# --------------------------------------------------------
+def export_label_anchors(table, writer):
+    lines = ["id;x;y;font_size\n"]
+    for pid, (x, y), size in zip(table["id"], table["anchor"], table["label_size"]):
+        lines.append(f"{pid};{int(x)};{int(y)};{size}\n")
+    writer.write_text("LabelAnchors.txt", "".join(lines))
+
+
+def write_population_txt(rows, debug_rows, path, writer):
     debug_map = {r["province_id"]: r for r in debug_rows}
-    with open(path, "w", encoding="utf-8") as f:
-        f.write("id;population;population_source;population_date;source_region;source_country;match_method\n")
-        for r in rows:
-            pid = r["province_id"]
-            pop = r["population"] if r["population"] != "" else 0
-            pop_date = r.get("population_date", "")
-            source = r.get("population_source", "")
-            d = debug_map.get(pid, {})
-            f.write(
-                f"{pid};{pop};{source};{pop_date};"
-                f"{d.get('source_region','')};{d.get('source_country','')};{d.get('match_method','')}\n"
-            )
+    lines = ["id;population;population_source;population_date;source_region;source_country;match_method\n"]
+    for r in rows:
+        pid = r["province_id"]
+        pop = r["population"] if r["population"] != "" else 0
+        pop_date = r.get("population_date", "")
+        source = r.get("population_source", "")
+        d = debug_map.get(pid, {})
+        lines.append(
+            f"{pid};{pop};{source};{pop_date};"
+            f"{d.get('source_region','')};{d.get('source_country','')};{d.get('match_method','')}\n"
+        )
+    writer.write_text(path, "".join(lines))
 
 
 # --------------------------------------------------------
 # MAIN EXPORT
 # --------------------------------------------------------
-def run_export(land, sea_regions):
+def run_export(
+    land,
+    sea_regions,
+    theme_modes=None,
+    out_dir=OUT,
+    size=EXPORT_SIZE,
+    tile_size=0,
+    mesh_lods=(),
+    workers=0,
+    nuts_population=None,
+    borders=None,
+):
+    """
+    Full OpenGS export of one map into out_dir, rasters size x size pixels.
+    tile_size > 0 also writes the Tiles/ pyramid of every map, mesh_lods (pixel
+    tolerances) the triangulated ProvinceMesh.bin. nuts_population (NUTS-3 table)
+    allocates population by area where NUTS-3 covers the land. borders
+    (border_overlay.border_style) draws province / state borders into the maps.
+    """
+    writer = OutputWriter(out_dir)
+    mem = MemoryReport()
+
     print("[EXPORT] ProvinceMap...")
-    province_colors, bounds = export_province_map(land, sea_regions)
+    mem.stage("ProvinceMap")
+    province_colors, bounds, province_img, sea_colors = export_province_map(land, sea_regions, writer, size=size)
 
     print("[EXPORT] ProvinceMask...")
-    id_map = export_id_map(province_colors)
+    mem.stage("ProvinceMask")
+    id_map = export_id_map(province_colors, writer, province_img)
 
     print("[EXPORT] PoliticalMap...")
-    export_political_map(id_map, land, sea_regions, bounds)
+    mem.stage("PoliticalMap")
+    # border masks once from the id raster, painted into the political map and every theme map
+    style = borders or {}
+    state_of = province_states(land, int(id_map.max()) + 1)
+    border_layer = BorderOverlay.build(id_map, state_of, style)
+
+    # what changed since the previous export, so maps can be patched instead of redrawn
+    overlay = geometry_key(
+        sea_regions, bounds, size, SEA_COLOR, OUTLINE_COLOR, OUTLINE_WIDTH, NO_DATA_COLOR,
+        overlay_key(style, state_of),
+    )
+    halo = max((width for _, width in style.values()), default=0)
+    diff = BuildDiff(writer, id_map, overlay, halo=halo)
+    export_political_map(id_map, land, sea_regions, bounds, writer, diff=diff, borders=border_layer)
 
     print("[EXPORT] Provinces.txt...")
-    export_provinces_txt(province_colors, id_map, land)
+    mem.stage("Provinces.txt")
+    table = build_province_table(province_colors, id_map, land, province_img)
+    # not closed: the writer may still be encoding it, it is freed once saved
+    del province_img
+    export_provinces_txt(table, writer)
+    export_label_anchors(table, writer)
 
     max_pid = int(id_map.max())
     print(f"[DEBUG] MAX PID DETECTED = {max_pid}")
 
     print("[EXPORT] Population CSV + map colors...")
+    mem.stage("Population")
+    # geopandas + the population importer are only needed from here on
+    from import_population import generate_population_dataset
+
     pop_values, rows, unmatched, debug_rows = generate_population_dataset(
         land,
-        out_path=os.path.join(OUT, "Population.csv"),
-        debug_path=os.path.join(OUT, "Population_debug.csv"),
+        out_path=writer.path("Population.csv"),
+        debug_path=writer.path("Population_debug.csv"),
+        writer=writer,
+        nuts_population=nuts_population,
     )
     if unmatched:
         print(f"[WARN] Population unmatched regions: {len(unmatched)} (showing up to 5)")
         for name, country in unmatched[:5]:
             print(f" - {name} ({country})")
-    write_population_txt(rows, debug_rows, os.path.join(OUT, "Population.txt"))
-
-    land_areas = {
-        pid: land.loc[pid].geometry.area / 1_000_000
-        for pid in land.index
-        if land.loc[pid].geometry.area > 0
-    }
-
-    print("[EXPORT] GDP Map...")
-    export_gdp_map(id_map, sea_regions, bounds, max_pid=max_pid)
-
-    print("[EXPORT] Population Map...")
-    export_population_map(
-        id_map,
-        sea_regions,
-        bounds,
-        population=pop_values,
-        land_areas=land_areas,
-        max_pid=max_pid,
+    write_population_txt(rows, debug_rows, "Population.txt", writer)
+    diff.compare_table("population", pop_values)
+
+    areas = land.geometry.area / 1_000_000
+    land_areas = areas[areas > 0]
+
+    # built-in modes + any data-driven modes from build_config.json, rendered in one pass
+    modes = [
+        gdp_mode(max_pid),
+        population_mode(max_pid, population=pop_values, land_areas=land_areas),
+        ideology_mode(max_pid),
+    ]
+    modes += list(theme_modes or [])
+
+    print(f"[EXPORT] Theme maps ({', '.join(m['mode'] for m in modes)})...")
+    mem.stage("Theme maps")
+    theme_paths = export_theme_modes(
+        id_map, sea_regions, bounds, modes, writer, max_pid=max_pid, diff=diff, borders=border_layer
     )
 
-    print("[EXPORT] Ideology Map...")
-    export_ideology_map(id_map, sea_regions, bounds, max_pid=max_pid)
+    mem.stage("States + Provinces.bin")
+    export_states(land, writer)
+    export_state_files(land, writer)
+
+    print("[EXPORT] Provinces.bin + ProvinceRuns.bin...")
+    export_province_db(table, land, pop_values, bounds, writer)
+    export_province_runs(table["run_offsets"], table["runs"], table["shape"], writer)
+    export_lookup_shapes(land, sea_regions, sea_colors, table, writer)
+
+    if mesh_lods:
+        print("[EXPORT] ProvinceMesh.bin...")
+        mem.stage("ProvinceMesh.bin")
+        from province_mesh import export_province_mesh
+
+        export_province_mesh(land, sea_regions, sea_colors, table, bounds, size, writer, lods=mesh_lods, workers=workers)
+
+    if tile_size:
+        print("[EXPORT] Tile pyramid...")
+        mem.stage("Tiles")
+        from tile_pyramid import export_tile_pyramid
 
-    export_states(land)
-    export_state_files(land)
+        export_tile_pyramid(id_map, [POLITICAL_MAP] + theme_paths, writer, tile_size)
 
+    writer.finish()
+    # only now that every map is on disk; state.json (written last) makes it the next baseline.
+    # with the sea outline + bounds the theme maps can be re-rendered without a build
+    border_layer.save(diff.dir)
+    diff.save(sea_regions=sea_regions, bounds=bounds)
+    mem.finish()
     print("[EXPORT] EXPORT COMPLETE")
@@ -0,0 +1,110 @@
+"""
+On-disk cache for expensive derived geometries (land union, sea polygon, ...).
+
+Entries are keyed by a hash of their input geometries and parameters, so a
+changed shapefile or threshold simply misses the cache. Files are stored as
+length-prefixed WKB in src/.geom_cache/<name>-<key>.wkb.
+
+Several processes (batch_map workers) may share the folder: an entry pruned by
+one of them while another is loading it is just a cache miss.
+"""
+
+import glob
+import hashlib
+import os
+import struct
+
+import numpy as np
+import shapely
+
+from output_writer import atomic_write
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE, ".geom_cache")
+KEEP_ENTRIES = 4   # per name, oldest are removed
+
+
+def geometry_key(geoms, *params):
+    """Hash of the geometries (WKB) plus any extra parameters."""
+    h = hashlib.sha256()
+    for wkb in shapely.to_wkb(np.asarray(geoms, dtype=object)):
+        h.update(wkb)
+    h.update(repr(params).encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+def _path(name, key):
+    return os.path.join(CACHE_DIR, f"{name}-{key}.wkb")
+
+
+def read_wkb(path):
+    """Geometries of a length-prefixed WKB file."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    (n,) = struct.unpack_from("<I", data, 0)
+    sizes = struct.unpack_from(f"<{n}Q", data, 4)
+    pos = 4 + 8 * n
+    blobs = []
+    for size in sizes:
+        blobs.append(data[pos:pos + size])
+        pos += size
+    return list(shapely.from_wkb(blobs))
+
+
+def wkb_bytes(geoms):
+    """Length-prefixed WKB of a list of geometries (the format of read_wkb)."""
+    blobs = [shapely.to_wkb(g) for g in geoms]
+    return struct.pack(f"<I{len(blobs)}Q", len(blobs), *map(len, blobs)) + b"".join(blobs)
+
+
+def write_wkb(path, geoms):
+    atomic_write(path, wkb_bytes(geoms))
+
+
+def load(name, key):
+    """List of cached geometries, or None on a miss."""
+    path = _path(name, key)
+    try:
+        geoms = read_wkb(path)
+        os.utime(path)   # mark as recently used for pruning
+    except FileNotFoundError:
+        return None   # never stored, or pruned by another process
+    return geoms
+
+
+def store(name, key, geoms):
+    write_wkb(_path(name, key), geoms)
+    _prune(name)
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0   # removed by another process meanwhile
+
+
+def prune_files(pattern, keep=KEEP_ENTRIES):
+    """Remove all but the `keep` most recently used files matching `pattern`."""
+    entries = sorted(glob.glob(pattern), key=_mtime, reverse=True)
+    for path in entries[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _prune(name):
+    prune_files(os.path.join(CACHE_DIR, f"{name}-*.wkb"))
+
+
+def cached(name, key, build):
+    """Return the cached geometries for (name, key), or build(), store and return them."""
+    geoms = load(name, key)
+    if geoms is not None:
+        print(f"[CACHE] {name} loaded from geometry cache")
+        return geoms
+    geoms = build()
+    store(name, key, geoms)
+    return geoms
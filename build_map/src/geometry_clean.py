@@ -0,0 +1,182 @@
+"""
+Shared admin-1 loading, geometry cleaning and small-region merging for build_map.py and import_population.py.
+
+Everything works on whole geometry arrays with shapely 2 ufuncs instead of
+GeoSeries.apply. Cleaning and the small-region merge are done per country and
+can run in a process pool (see country_pool.py).
+"""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from country_pool import map_countries
+
+# This bounding box keeps Med islands, Cyprus, Iceland, Caucasus
+EUROPE_BBOX_3035 = (900000, 1000000, 7000000, 6500000)
+RUSSIA_CUT_LONLAT = (20, 35, 60, 75)  # 20E–60E, 35N–75N
+POLYGONAL = (shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON)
+
+
+# --------------------------------------------------------
+# VECTORIZED PRIMITIVES
+# --------------------------------------------------------
+def _regroup(parts, index, n):
+    """Polygons + owner index -> one Polygon/MultiPolygon (or empty) per owner."""
+    out = np.array([shapely.Polygon()] * n, dtype=object)
+    if len(parts) == 0:
+        return out
+
+    counts = np.bincount(index, minlength=n)
+    single = counts[index] == 1
+    out[index[single]] = parts[single]
+
+    multi = ~single
+    if multi.any():
+        owners, local = np.unique(index[multi], return_inverse=True)
+        out[owners] = shapely.multipolygons(parts[multi], indices=local)
+    return out
+
+
+def polygonal_parts(geoms):
+    """Keep only the polygon parts of every geometry (make_valid/intersection can add lines or points)."""
+    geoms = np.asarray(geoms, dtype=object)
+    parts, index = shapely.get_parts(geoms, return_index=True)
+    # GeometryCollections from make_valid can nest a MultiPolygon
+    parts, sub = shapely.get_parts(parts, return_index=True)
+    index = index[sub]
+    keep = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    return _regroup(parts[keep], index[keep], len(geoms))
+
+
+def remove_holes(geoms):
+    geoms = np.asarray(geoms, dtype=object)
+    parts, index = shapely.get_parts(geoms, return_index=True)
+    keep = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    shells = shapely.polygons(shapely.get_exterior_ring(parts[keep]))
+    out = _regroup(shells, index[keep], len(geoms))
+
+    # non-polygonal input passes through unchanged, as before
+    other = ~np.isin(shapely.get_type_id(geoms), POLYGONAL)
+    out[other] = geoms[other]
+    return out
+
+
+def make_valid(geoms):
+    geoms = np.asarray(geoms, dtype=object)
+    invalid = ~shapely.is_valid(geoms)
+    if not invalid.any():
+        return geoms
+    out = geoms.copy()
+    out[invalid] = polygonal_parts(shapely.make_valid(geoms[invalid]))
+    return out
+
+
+def clip(geoms, clipper):
+    """Intersect every geometry with `clipper`; geometries already inside are left as they are."""
+    shapely.prepare(clipper)
+    geoms = np.asarray(geoms, dtype=object)
+    inside = shapely.contains_properly(clipper, geoms)
+    out = geoms.copy()
+    cut = ~inside
+    if cut.any():
+        out[cut] = polygonal_parts(shapely.intersection(geoms[cut], clipper))
+    return out
+
+
+def clean_array(geoms):
+    return make_valid(remove_holes(make_valid(geoms)))
+
+
+# --------------------------------------------------------
+# PER-COUNTRY WORKERS (run through country_pool.map_countries)
+# --------------------------------------------------------
+def _clean_country(group):
+    group = group.copy()
+    group["geometry"] = clean_array(group.geometry.to_numpy())
+    return group
+
+
+def merge_small_country(group, min_area):
+    """Merge every region below min_area (m²) into its nearest neighbour of the same country."""
+    group = group.copy()
+    group["area"] = group.geometry.area
+
+    while True:
+        small = group[group["area"] < min_area]
+
+        if small.empty:
+            break
+
+        idx = small.index[0]
+        target = group.loc[idx]
+
+        # candidates ONLY in the same country
+        candidates = group.drop(idx)
+        if candidates.empty:
+            group = group.drop(idx)
+            continue
+
+        # merge with nearest polygon
+        nearest_idx = candidates.distance(target.geometry).sort_values().index[0]
+        merged_geom = target.geometry.union(group.loc[nearest_idx].geometry)
+
+        group.loc[nearest_idx, "geometry"] = merged_geom
+        group = group.drop(idx)
+        group["area"] = group.geometry.area
+
+    return group.drop(columns="area")
+
+
+# --------------------------------------------------------
+# ADMIN-1 PIPELINE (PART 1 + PART 2)
+# --------------------------------------------------------
+def cut_russia(admin):
+    """Cut RUSSIA to its European part (one vectorized intersection over all RUS rows)."""
+    europe_3035 = gpd.GeoSeries([shapely.box(*RUSSIA_CUT_LONLAT)], crs=4326).to_crs(3035).iloc[0]
+
+    rus = (admin["country"] == "RUS").to_numpy()
+    if not rus.any():
+        return admin
+
+    admin = admin.copy()
+    geoms = admin.geometry.to_numpy()
+    geoms[rus] = clip(geoms[rus], europe_3035)
+    admin["geometry"] = geoms
+
+    keep = ~(rus & shapely.is_empty(geoms))
+    return admin[keep]
+
+
+def load_admin(shape_path, countries):
+    admin = gpd.read_file(shape_path)
+    admin = admin.to_crs(3035)
+    admin["geometry"] = make_valid(admin.geometry.to_numpy())
+
+    admin["country"] = admin["adm0_a3"]
+    admin = admin[admin["country"].isin(countries)].reset_index(drop=True)
+    print(f"[DEBUG] Regions loaded after country filter: {len(admin)}")
+
+    # keep the old row order: everything else first, then the cut Russia
+    admin = cut_russia(admin)
+    rus = admin["country"] == "RUS"
+    admin = gpd.GeoDataFrame(
+        pd.concat([admin[~rus], admin[rus]], ignore_index=True), crs=admin.crs
+    )
+
+    minx, miny, maxx, maxy = EUROPE_BBOX_3035
+    admin = admin.cx[minx:maxx, miny:maxy]
+    return admin
+
+
+def clean_admin(admin, workers=0):
+    """Remove holes and repair validity for every region, optionally in parallel by country."""
+    admin = map_countries(admin, _clean_country, workers=workers, keep_order=True)
+    return admin[~admin.geometry.is_empty]
+
+
+def merge_small_absolute(gdf, min_area, workers=0):
+    """Per-country small-region merge; rows come back grouped by country in sorted order."""
+    merged = map_countries(gdf, merge_small_country, min_area, workers=workers)
+    return gpd.GeoDataFrame(merged, geometry="geometry", crs=gdf.crs)
@@ -1,14 +1,22 @@
 ﻿import os
-import re
 import glob
-import unicodedata
 import difflib
 from typing import Dict, List, Optional, Tuple
 from statistics import median
 
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import box, Polygon, MultiPolygon
+
+from build_config import DEFAULT_CONFIG
+from population_ingest import load_latest, normalize, normalize_iso
+from population_match_cache import (
+    OVERRIDES_PATH,
+    MatchStore,
+    find_override,
+    land_fingerprint,
+    load_overrides,
+    source_key,
+)
 
 BASE = os.path.dirname(os.path.abspath(__file__))
 QUERY_PATH = os.path.join(BASE, "query.csv")
@@ -24,139 +32,58 @@ EUROPE_COUNTRIES = [
     "MDA", "UKR", "BLR", "RUS", "ARM", "GEO", "AZE", "TUR"
 ]
 
-MIN_AREA_ABS = 1_000_000_000
-STOPWORDS = {
-    "province", "region", "county", "state", "district", "republic",
-    "oblast", "voivodeship", "governorate", "gouvernorate", "prefecture",
-    "department", "autonomous", "federal", "territory", "municipality"
-}
-
-
-def normalize(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    text = unicodedata.normalize("NFKD", text)
-    text = "".join(ch for ch in text if not unicodedata.combining(ch))
-    text = text.lower()
-    text = re.sub(r"[`'\"]", "", text)
-    text = re.sub(r"[^a-z0-9]+", " ", text)
-    words = [w for w in text.split() if w not in STOPWORDS]
-    return " ".join(words).strip()
-
-
-def normalize_iso(val: Optional[str]) -> str:
-    if not isinstance(val, str):
-        return ""
-    return val.strip().upper().replace(" ", "")
-
-
-def remove_holes(g):
-    if g.geom_type == "Polygon":
-        return Polygon(g.exterior)
-    if g.geom_type == "MultiPolygon":
-        return MultiPolygon([Polygon(p.exterior) for p in g.geoms])
-    return g
+# same land as a default build_map.py run
+MIN_AREA_ABS = DEFAULT_CONFIG["min_area_abs"]
+MAX_AREA_ABS = DEFAULT_CONFIG["max_area_abs"]
 
 
-def merge_small_absolute(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    gdf = gdf.copy()
-    gdf["area"] = gdf.geometry.area
-    merged = []
-
-    for country, group in gdf.groupby("country"):
-        group = group.copy()
-
-        while True:
-            small = group[group["area"] < MIN_AREA_ABS]
-            if small.empty:
-                break
-
-            idx = small.index[0]
-            target = group.loc[idx]
-
-            candidates = group.drop(idx)
-            if candidates.empty:
-                group = group.drop(idx)
-                continue
-
-            nearest_idx = candidates.distance(target.geometry).sort_values().index[0]
-            merged_geom = target.geometry.union(group.loc[nearest_idx].geometry)
+def load_land(workers: int = 0) -> gpd.GeoDataFrame:
+    import geometry_clean
+    from subdivide_provinces import subdivide_large
 
-            group.loc[nearest_idx, "geometry"] = merged_geom
-            group = group.drop(idx)
-            group["area"] = group.geometry.area
-
-        merged.append(group)
-
-    merged = pd.concat(merged, ignore_index=True)
-    return merged.drop(columns="area")
-
-
-def load_land() -> gpd.GeoDataFrame:
-    admin = gpd.read_file(SHAPE_PATH)
-    admin = admin.to_crs(3035)
-    admin["geometry"] = admin.geometry.buffer(0)
-
-    admin["country"] = admin["adm0_a3"]
-    admin = admin[admin["country"].isin(EUROPE_COUNTRIES)].reset_index(drop=True)
-
-    def cut_russia(geom):
-        europe_lonlat = box(20, 35, 60, 75)
-        europe_3035 = gpd.GeoSeries([europe_lonlat], crs=4326).to_crs(3035).iloc[0]
-        return geom.intersection(europe_3035)
-
-    rus = admin[admin["country"] == "RUS"].copy()
-    admin = admin[admin["country"] != "RUS"]
-    rus["geometry"] = rus.geometry.apply(cut_russia)
-    rus = rus[~rus.geometry.is_empty]
-    admin = pd.concat([admin, rus], ignore_index=True)
-
-    minx, miny, maxx, maxy = 900000, 1000000, 7000000, 6500000
-    admin = admin.cx[minx:maxx, miny:maxy]
-
-    admin["geometry"] = admin.geometry.apply(remove_holes).buffer(0)
-    land = merge_small_absolute(admin).reset_index(drop=True)
+    admin = geometry_clean.load_admin(SHAPE_PATH, EUROPE_COUNTRIES)
+    admin = geometry_clean.clean_admin(admin, workers=workers)
+    land = geometry_clean.merge_small_absolute(admin, MIN_AREA_ABS, workers=workers)
+    land = subdivide_large(land, MAX_AREA_ABS, workers=workers)
     return land
 
 
 def resolve_query_path() -> str:
-    """Prefer query.csv; otherwise pick the last query*.csv in this folder."""
+    """Prefer query.csv; otherwise pick the last query*.csv, then the last query*.tsv (WDQS export) in this folder."""
     if os.path.exists(QUERY_PATH):
         return QUERY_PATH
-    candidates = sorted(glob.glob(os.path.join(BASE, "query*.csv")))
-    if candidates:
-        return candidates[-1]
-    raise FileNotFoundError("No query CSV found (expected query*.csv in src/)")
-
-
-def load_population() -> pd.DataFrame:
-    qpath = resolve_query_path()
-    df = pd.read_csv(qpath).reset_index().rename(columns={"index": "source_index"})
-    df["population"] = pd.to_numeric(df["population"], errors="coerce")
-    df["populationDate"] = pd.to_datetime(df["populationDate"], errors="coerce")
-    if "countryLabel" not in df.columns:
-        df["countryLabel"] = ""
-    if "regionLabel" not in df.columns:
-        raise KeyError("Missing required column 'regionLabel' in population CSV")
-    if "iso" not in df.columns:
-        df["iso"] = ""
-
-    df["norm_iso"] = df["iso"].apply(normalize_iso)
-    df["norm_region"] = df["regionLabel"].apply(normalize)
-    df["norm_country"] = df["countryLabel"].apply(normalize)
-
-    df = df.sort_values(["norm_iso", "norm_region", "norm_country", "populationDate"])
-
-    frames = []
-    df_iso = df[df["norm_iso"] != ""]
-    df_rest = df[df["norm_iso"] == ""]
-    if not df_iso.empty:
-        frames.append(df_iso.groupby("norm_iso", as_index=False).last())
-    if not df_rest.empty:
-        frames.append(df_rest.groupby(["norm_region", "norm_country"], as_index=False).last())
-
-    latest = pd.concat(frames, ignore_index=True, sort=False) if frames else df.head(0)
-    return latest.rename(columns={"region": "region_uri"})
+    for pattern in ("query*.csv", "query*.tsv"):
+        candidates = sorted(glob.glob(os.path.join(BASE, pattern)))
+        if candidates:
+            return candidates[-1]
+    raise FileNotFoundError("No query CSV/TSV found (expected query*.csv or query*.tsv in src/)")
+
+
+def load_population(path: Optional[str] = None) -> pd.DataFrame:
+    """Latest record per region, streamed in chunks (see population_ingest.py)."""
+    return load_latest(path or resolve_query_path())
+
+
+def subdivision_shares(land: gpd.GeoDataFrame) -> Dict[int, Tuple[int, float]]:
+    """
+    pid -> (first part pid, area share) for every part of a subdivided province
+    (subdivide_provinces.subdivide_large). Parts are matched once through their
+    first part and split the parent's population by area.
+    """
+    if "parent" not in land.columns:
+        return {}
+    split = land["parent"].duplicated(keep=False).to_numpy()
+    if not split.any():
+        return {}
+
+    parts = land.loc[split, ["parent"]].copy()
+    parts["area"] = land.geometry[split].area.to_numpy()
+    shares = {}
+    for _, group in parts.groupby("parent", sort=False):
+        total = group["area"].sum()
+        for pid, area in group["area"].items():
+            shares[pid] = (group.index[0], area / total if total > 0 else 1.0 / len(group))
+    return shares
 
 
 def build_lookup(land: gpd.GeoDataFrame):
@@ -172,6 +99,10 @@ def build_lookup(land: gpd.GeoDataFrame):
             iso_col = candidate
             break
 
+    # parts of a subdivided province share its names, only the first one is matched
+    if "parent" in land.columns:
+        land = land[~land["parent"].duplicated().to_numpy()]
+
     for pid, row in land.iterrows():
         n_country = normalize(row.get("admin", "")) or normalize(row.get("country", ""))
         country_map[pid] = n_country
@@ -212,69 +143,105 @@ def fuzzy_region_match(norm_region: str, region_index: List[Tuple[int, str]]) ->
     return best
 
 
-def match_population_to_land(pop_df: pd.DataFrame, lookup_full, lookup_region, region_index, country_map, iso_map):
-    matched = {}  # pid -> (row, method, priority)
+def resolve_match(row, lookup_full, lookup_region, region_index, country_map, iso_map):
+    """Run the match tiers for one source row: (pid or None, method)."""
+    key = (row["norm_region"], row["norm_country"])
+    hits = None
+    method = "exact_country"
+
+    # Highest-priority: ISO 3166-2 exact match if present
+    if row.get("norm_iso"):
+        pid = iso_map.get(row["norm_iso"])
+        if pid is not None:
+            hits = [pid]
+            method = "iso"
+
+    if hits is None:
+        hits = lookup_full.get(key)
+        method = "exact_country"
+
+    if not hits:
+        hits = lookup_region.get(row["norm_region"])
+        method = "region_only"
+
+    if not hits:
+        hits = fuzzy_region_match(row["norm_region"], region_index)
+        method = "fuzzy_contain"
+
+    if not hits:
+        best_pid = None
+        best_ratio = 0.0
+        for pid, name in region_index:
+            r = difflib.SequenceMatcher(None, row["norm_region"], name).ratio()
+            if r > best_ratio:
+                best_ratio = r
+                best_pid = pid
+        if best_ratio >= 0.55 and best_pid is not None:
+            hits = [best_pid]
+            method = "fuzzy_best"
+
+    # If we have a country in the source, enforce it on fuzzy matches
+    if hits and row["norm_country"]:
+        hits = [pid for pid in hits if country_map.get(pid, "") == row["norm_country"]]
+
+    if not hits:
+        return None, "unmatched"
+    return hits[0], method
+
+
+def match_population_to_land(
+    pop_df: pd.DataFrame,
+    lookup_full,
+    lookup_region,
+    region_index,
+    country_map,
+    iso_map,
+    store: Optional[MatchStore] = None,
+    overrides: Optional[dict] = None,
+):
+    """
+    matched: pid -> (row, method, priority, resolved_by), resolved_by = "computed" | "cached" | "override".
+    Overrides are checked first, then the match store, and only then the match tiers.
+    """
+    matched = {}
     unmatched = []
     priority = {
+        "override": 5,
         "iso": 4,
         "exact_country": 3,
         "region_only": 2,
         "fuzzy_contain": 1,
         "fuzzy_best": 0,
     }
+    counts = {"computed": 0, "cached": 0, "override": 0}
 
     for _, row in pop_df.iterrows():
-        key = (row["norm_region"], row["norm_country"])
-        hits = None
-        method = "exact_country"
-
-        # Highest-priority: ISO 3166-2 exact match if present
-        if row.get("norm_iso"):
-            pid = iso_map.get(row["norm_iso"])
-            if pid is not None:
-                hits = [pid]
-                method = "iso"
-
-        if hits is None:
-            hits = lookup_full.get(key)
-            method = "exact_country"
-
-        if not hits:
-            hits = lookup_region.get(row["norm_region"])
-            method = "region_only"
-
-        if not hits:
-            hits = fuzzy_region_match(row["norm_region"], region_index)
-            method = "fuzzy_contain"
-
-        if not hits:
-            best_pid = None
-            best_ratio = 0.0
-            for pid, name in region_index:
-                r = difflib.SequenceMatcher(None, row["norm_region"], name).ratio()
-                if r > best_ratio:
-                    best_ratio = r
-                    best_pid = pid
-            if best_ratio >= 0.55 and best_pid is not None:
-                hits = [best_pid]
-                method = "fuzzy_best"
-
-        # If we have a country in the source, enforce it on fuzzy matches
-        if hits and row["norm_country"]:
-            hits = [pid for pid in hits if country_map.get(pid, "") == row["norm_country"]]
-            if not hits:
-                method = "unmatched"
-
-        if not hits:
+        found, pid = find_override(overrides, row["norm_region"], row["norm_country"]) if overrides else (False, None)
+        if found:
+            if pid is None:
+                continue   # dropped by hand
+            method, resolved_by = "override", "override"
+        else:
+            key = source_key(row.get("norm_iso") or "", row["norm_region"], row["norm_country"])
+            cached = store.get(key) if store is not None else None
+            if cached is not None:
+                (pid, method), resolved_by = cached, "cached"
+            else:
+                pid, method = resolve_match(row, lookup_full, lookup_region, region_index, country_map, iso_map)
+                resolved_by = "computed"
+                if store is not None:
+                    store.put(key, pid, method)
+        counts[resolved_by] += 1
+
+        if pid is None:
             unmatched.append((row["regionLabel"], row["countryLabel"]))
             continue
 
-        pid = hits[0]
         existing = matched.get(pid)
         if existing is None:
-            matched[pid] = (row, method, priority.get(method, -1))
+            matched[pid] = (row, method, priority.get(method, -1), resolved_by)
         else:
-            _, _, cur_pri = existing
+            cur_pri = existing[2]
             new_pri = priority.get(method, -1)
             replace = False
             if new_pri > cur_pri:
@@ -285,24 +252,37 @@ def match_population_to_land(pop_df: pd.DataFrame, lookup_full, lookup_region, r
             ):
                 replace = True
             if replace:
-                matched[pid] = (row, method, new_pri)
+                matched[pid] = (row, method, new_pri, resolved_by)
 
+    print(
+        f"[POP] Matches resolved: {counts['cached']} cached, "
+        f"{counts['override']} override, {counts['computed']} computed"
+    )
     return matched, unmatched
 
 
-def build_output_rows(land: gpd.GeoDataFrame, matched: Dict[int, pd.Series]):
+def build_output_rows(land: gpd.GeoDataFrame, matched: Dict[int, tuple], shares=None):
+    """shares: subdivision_shares(land), parts get their area share of the parent's match."""
+    shares = shares or {}
     out_rows = []
     debug_rows = []
     for pid, prow in land.iterrows():
-        entry = matched.get(pid)
+        first, share = shares.get(pid, (pid, 1.0))
+        entry = matched.get(first)
         match = entry[0] if entry is not None else None
+        population = (
+            int(round(match["population"] * share)) if match is not None and pd.notna(match["population"]) else ""
+        )
         method = entry[1] if entry is not None else "unmatched"
         source = "matched" if method == "exact_country" else method
+        # the debug file says how the match was found; the tier it came from stays in match_tier
+        resolved_by = entry[3] if entry is not None else "computed"
+        debug_method = source if resolved_by == "computed" else resolved_by
         out_rows.append({
             "province_id": pid,
             "province_name": prow.get("name_en") or prow.get("name"),
             "country": prow.get("admin") or prow.get("country"),
-            "population": int(match["population"]) if match is not None and pd.notna(match["population"]) else "",
+            "population": population,
             "population_date": (
                 match["populationDate"].date().isoformat()
                 if match is not None and pd.notna(match["populationDate"])
@@ -315,8 +295,9 @@ def build_output_rows(land: gpd.GeoDataFrame, matched: Dict[int, pd.Series]):
             "province_id": pid,
             "province_name": prow.get("name_en") or prow.get("name"),
             "province_country": prow.get("admin") or prow.get("country"),
-            "match_method": source if match is not None else "unmatched",
-            "matched_population": int(match["population"]) if match is not None and pd.notna(match["population"]) else "",
+            "match_method": debug_method if match is not None else "unmatched",
+            "match_tier": source if match is not None else "unmatched",
+            "matched_population": population,
             "matched_population_date": (
                 match["populationDate"].date().isoformat()
                 if match is not None and pd.notna(match["populationDate"])
@@ -335,31 +316,82 @@ def build_output_rows(land: gpd.GeoDataFrame, matched: Dict[int, pd.Series]):
     return out_rows, debug_rows
 
 
+def apply_nuts_allocation(land, nuts_population, rows, debug_rows, pop_values):
+    """Overwrite rows / debug_rows / pop_values of the NUTS-3 covered provinces with their area-weighted population."""
+    from nuts_population import allocate_population, load_nuts_population
+
+    table = load_nuts_population(nuts_population)
+    allocated, overlay = allocate_population(land, table)
+    row_of = {r["province_id"]: i for i, r in enumerate(rows)}
+
+    for pid, (value, col) in allocated.items():
+        if value <= 0:
+            continue   # no data for the regions it lies in, the name match stays
+        nuts_id = overlay["nuts_ids"][col]
+        source = table.loc[nuts_id] if nuts_id in table.index else None
+        date = source["population_date"] if source is not None else ""
+
+        i = row_of[pid]
+        rows[i].update({
+            "population": int(round(value)),
+            "population_date": date,
+            "wikidata_uri": "",
+            "population_source": "nuts3_area",
+        })
+        debug_rows[i].update({
+            "match_method": "nuts3_area",
+            "match_tier": "nuts3_area",
+            "matched_population": int(round(value)),
+            "matched_population_date": date,
+            "source_region": overlay["nuts_names"][col],
+            "source_country": overlay["nuts_countries"][col],
+            "source_population": int(source["population"]) if source is not None else "",
+            "source_population_date": date,
+            "source_index": nuts_id,
+        })
+        pop_values[pid] = float(value)
+
+
 def generate_population_dataset(
     land: Optional[gpd.GeoDataFrame] = None,
     out_path: str = OUT_PATH,
     write_csv: bool = True,
     fill_missing: bool = True,
     debug_path: Optional[str] = None,
+    writer=None,
+    match_cache: bool = True,
+    overrides_path: Optional[str] = OVERRIDES_PATH,
+    nuts_population: Optional[str] = None,
 ):
     """
     Returns:
         pop_values: {pid: population} for matched provinces (with fills if enabled)
         rows: list of dicts ready for CSV export
         unmatched: list of (regionLabel, countryLabel) that did not match
+
+    With `writer` (output_writer.OutputWriter) the CSVs are only rewritten when their content changed.
+    match_cache reuses resolved matches of earlier runs on the same land (see population_match_cache.py),
+    overrides_path points at the hand-maintained population_overrides.csv.
+    nuts_population (NUTS-3 population table) switches provinces covered by NUTS-3 to the
+    area-weighted allocation of nuts_population.py; the name matching only fills the rest.
     """
     land = land if land is not None else load_land()
     pop_df = load_population()
     lookup_full, lookup_region, region_index, country_map, iso_map = build_lookup(land)
-    matched, unmatched = match_population_to_land(pop_df, lookup_full, lookup_region, region_index, country_map, iso_map)
+    store = MatchStore(land_fingerprint(lookup_full, lookup_region, region_index, country_map, iso_map)) if match_cache else None
+    overrides = load_overrides(lookup_full, lookup_region, country_map, overrides_path)
+    matched, unmatched = match_population_to_land(
+        pop_df, lookup_full, lookup_region, region_index, country_map, iso_map, store=store, overrides=overrides
+    )
+    if store is not None:
+        store.save()
 
-    rows, debug_rows = build_output_rows(land, matched)
+    rows, debug_rows = build_output_rows(land, matched, subdivision_shares(land))
 
-    pop_values = {
-        pid: float(row[0]["population"])
-        for pid, row in matched.items()
-        if pd.notna(row[0]["population"])
-    }
+    pop_values = {row["province_id"]: float(row["population"]) for row in rows if row["population"] != ""}
+
+    if nuts_population:
+        apply_nuts_allocation(land, nuts_population, rows, debug_rows, pop_values)
 
     if fill_missing:
         country_values: Dict[str, List[float]] = {}
@@ -390,7 +422,11 @@ def generate_population_dataset(
             row["population_source"] = row.get("population_source", "filled_global")
             pop_values[pid] = float(val)
 
-    if write_csv:
+    if write_csv and writer is not None:
+        writer.write_text(out_path, pd.DataFrame(rows).to_csv(sep=";", index=False))
+        if debug_path:
+            writer.write_text(debug_path, pd.DataFrame(debug_rows).to_csv(sep=";", index=False))
+    elif write_csv:
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
         pd.DataFrame(rows).to_csv(out_path, sep=";", index=False)
         if debug_path:
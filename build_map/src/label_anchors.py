@@ -0,0 +1,106 @@
+"""
+Label anchors: for every province the interior pixel farthest from its border
+(pole of inaccessibility on the id raster) plus a suggested label font size.
+
+Unlike the pixel mean, the anchor always lies inside the province, also for
+C-shaped coasts and island groups (the anchor then sits on the biggest part).
+All provinces are handled by one distance transform over the id raster.
+"""
+
+import numpy as np
+
+from export_shared import row_chunks
+
+LABEL_CHARS = 8          # typical label length the font size is fitted to
+CHAR_WIDTH = 0.6         # glyph width / font size
+MIN_FONT = 6
+MAX_FONT = 64
+MAX_RADIUS = int(np.ceil(MAX_FONT * LABEL_CHARS * CHAR_WIDTH / 2)) + 1   # deeper does not change the font
+BAND_ROWS = 256          # rows per distance transform band (plus the MAX_RADIUS halo)
+
+
+def border_mask(ids):
+    """Pixels with a 4-neighbour of another id; the edge of `ids` counts as border."""
+    border = np.zeros(ids.shape, dtype=bool)
+    diff = ids[:, 1:] != ids[:, :-1]
+    border[:, 1:] |= diff
+    border[:, :-1] |= diff
+    diff = ids[1:] != ids[:-1]
+    border[1:] |= diff
+    border[:-1] |= diff
+    border[[0, -1], :] = True
+    border[:, [0, -1]] = True
+    return border
+
+
+def font_size(radius):
+    """Font size whose LABEL_CHARS-long label fits across the inscribed circle."""
+    size = np.floor(2 * radius / (LABEL_CHARS * CHAR_WIDTH))
+    return np.clip(size, MIN_FONT, MAX_FONT).astype(np.uint8)
+
+
+def border_distance(ids):
+    """
+    (top, bottom, distance) row chunks: distance of every pixel to the nearest border
+    pixel, capped at MAX_RADIUS, plus 0.5 so border pixels (and one pixel wide
+    provinces) still count. Every chunk is computed on a band with a MAX_RADIUS halo,
+    which is exact up to the cap and keeps the temporaries small.
+    """
+    from scipy import ndimage
+
+    h = ids.shape[0]
+    for top, bottom in row_chunks(h, BAND_ROWS):
+        a, b = max(top - MAX_RADIUS, 0), min(bottom + MAX_RADIUS, h)
+        # one extra row each side, so the band edge is not taken for a border
+        ea, eb = max(a - 1, 0), min(b + 1, h)
+        inside = ~border_mask(ids[ea:eb])[a - ea:a - ea + (b - a)]
+        band = ndimage.distance_transform_edt(inside)
+        yield top, bottom, np.minimum(band[top - a:bottom - a], MAX_RADIUS).astype(np.float32) + 0.5
+
+
+def _best_per_id(fid, depth, off):
+    """Index of the deepest pixel (then the smallest offset) for every distinct id."""
+    order = np.lexsort((off, -depth, fid))
+    first = np.r_[True, fid[order][1:] != fid[order][:-1]]
+    return order[first]
+
+
+def label_anchors(ids, n, centroid):
+    """
+    ids:      full id raster (land + sea ids, < 0 = none)
+    n:        number of ids
+    centroid: (n, 2) pixel means, used to pick between equally deep pixels
+    Returns (anchor (n, 2) float32 pixel x/y, font size (n,) uint8, radius (n,) float32).
+    Ids without pixels get anchor -1.
+    """
+    w = ids.shape[1]
+
+    # deepest pixel of every province per band, ties go to the pixel nearest the pixel mean;
+    # only one candidate per id and band is kept, so plateaus do not pile up
+    fid, xs, ys, depth, off = [], [], [], [], []
+    for top, bottom, d in border_distance(ids):
+        f, d = ids[top:bottom].ravel(), d.ravel()
+        pos = np.flatnonzero(f >= 0)
+        f, d = f[pos].astype(np.int64), d[pos]
+
+        band_depth = np.zeros(n, dtype=np.float32)
+        np.maximum.at(band_depth, f, d)
+        deep = d == band_depth[f]
+        pos, f, d = pos[deep], f[deep], d[deep]
+
+        y, x = pos // w + top, pos % w
+        o = (x - centroid[f, 0]) ** 2 + (y - centroid[f, 1]) ** 2
+        best = _best_per_id(f, d, o)
+        for out, values in zip((fid, xs, ys, depth, off), (f, x, y, d, o)):
+            out.append(values[best])
+
+    fid, xs, ys, depth, off = (np.concatenate(a) for a in (fid, xs, ys, depth, off))
+    best = _best_per_id(fid, depth, off)
+    fid, xs, ys, depth = fid[best], xs[best], ys[best], depth[best]
+
+    radius = np.zeros(n, dtype=np.float32)
+    radius[fid] = depth
+    anchor = np.full((n, 2), -1, dtype=np.float32)
+    anchor[fid, 0] = xs
+    anchor[fid, 1] = ys
+    return anchor, font_size(radius), radius
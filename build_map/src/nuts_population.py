@@ -0,0 +1,229 @@
+"""
+Area-weighted population allocation from NUTS-3 regions (NUTS_RG_10M_2021_3035_LEVL_3.geojson).
+
+The NUTS-3 polygons are overlaid onto `land` once: an STRtree finds every
+(province, NUTS region) pair that intersects and shapely computes all their
+intersection areas in one vectorized call. The result is a sparse
+province x NUTS matrix of intersected areas, cached in
+src/.geom_cache/nuts_overlay-<key>.npz (keyed by the land geometry and the
+NUTS file), so a new population table only costs a sparse matrix-vector
+product.
+
+Each NUTS region hands its population to the provinces it overlaps in
+proportion to the overlapped area. Only provinces covered by NUTS-3 for at
+least MIN_COVERAGE of their area take part; the rest (outside the NUTS area,
+e.g. UKR, BLR, RUS) keep the name matching of import_population.py. The
+shares are normalized over those provinces, so coastline differences between
+NUTS and Natural Earth lose no population.
+
+Population table (nuts_population in build_config.json), ',' ';' or tab separated:
+
+    NUTS_ID;population                   DE27D;134000
+    geo,TIME_PERIOD,OBS_VALUE            Eurostat SDMX-CSV (e.g. demo_r_pjanaggr3), latest year per region
+"""
+
+import io
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+from geometry_cache import CACHE_DIR, geometry_key, prune_files
+from output_writer import atomic_write
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+NUTS3_PATH = os.path.join(BASE, "NUTS_RG_10M_2021_3035_LEVL_3.geojson")
+NUTS_CRS = "EPSG:3035"
+OVERLAY_NAME = "nuts_overlay"
+OVERLAY_VERSION = 1
+MIN_COVERAGE = 0.5   # share of a province's area that must lie in NUTS-3 regions
+
+ID_COLUMNS = ("NUTS_ID", "nuts_id", "geo")
+VALUE_COLUMNS = ("population", "OBS_VALUE", "value")
+TIME_COLUMNS = ("TIME_PERIOD", "time", "year", "population_date")
+
+# overlays of this process, a watch-mode rebuild does not even read the .npz again
+_overlays = {}
+
+
+# --------------------------------------------------------
+# NUTS REGIONS + POPULATION TABLE
+# --------------------------------------------------------
+def load_nuts3(path=NUTS3_PATH, crs=NUTS_CRS):
+    nuts = gpd.read_file(path)[["NUTS_ID", "CNTR_CODE", "NAME_LATN", "geometry"]]
+    if crs is not None and nuts.crs is not None and nuts.crs != crs:
+        nuts = nuts.to_crs(crs)
+    nuts["geometry"] = shapely.make_valid(nuts.geometry.to_numpy())
+    return nuts.reset_index(drop=True)
+
+
+def _column(df, names, path):
+    for name in names:
+        if name in df.columns:
+            return name
+    raise ValueError(f"{os.path.basename(path)}: no column of {', '.join(names)}")
+
+
+def load_nuts_population(path):
+    """DataFrame indexed by NUTS_ID with population + population_date (latest record per region)."""
+    path = path if os.path.isabs(path) else os.path.join(BASE, path)
+    df = pd.read_csv(path, sep=None, engine="python", dtype=str, keep_default_na=False)
+    df.columns = [c.strip() for c in df.columns]
+
+    id_col = _column(df, ID_COLUMNS, path)
+    value_col = _column(df, VALUE_COLUMNS, path)
+    time_col = next((c for c in TIME_COLUMNS if c in df.columns), None)
+
+    out = pd.DataFrame({
+        "nuts_id": df[id_col].str.strip(),
+        # Eurostat flags ("123456 p") and thousands separators are dropped
+        "population": pd.to_numeric(
+            df[value_col].str.replace(r"[^\d.]", "", regex=True), errors="coerce"
+        ),
+        "population_date": df[time_col].str.strip() if time_col else "",
+    })
+    out = out[out["population"].notna() & (out["nuts_id"] != "")]
+    if time_col:
+        out = out.sort_values("population_date", kind="stable")
+    return out.drop_duplicates("nuts_id", keep="last").set_index("nuts_id")
+
+
+# --------------------------------------------------------
+# OVERLAY
+# --------------------------------------------------------
+def build_overlay(land_geoms, nuts_geoms):
+    """Sparse (province x NUTS) matrix of intersected areas in km²."""
+    land_geoms = np.asarray(land_geoms, dtype=object)
+    nuts_geoms = np.asarray(nuts_geoms, dtype=object)
+
+    tree = shapely.STRtree(land_geoms)
+    nuts_idx, land_idx = tree.query(nuts_geoms, predicate="intersects")
+    areas = shapely.area(shapely.intersection(land_geoms[land_idx], nuts_geoms[nuts_idx])) / 1_000_000
+
+    keep = areas > 0
+    return sparse.csr_matrix(
+        (areas[keep], (land_idx[keep], nuts_idx[keep])), shape=(len(land_geoms), len(nuts_geoms))
+    )
+
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, f"{OVERLAY_NAME}-{key}.npz")
+
+
+def _load_overlay(key):
+    path = _cache_path(key)
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            overlay = {
+                "areas": sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"])),
+                "province_area": f["province_area"],
+                "nuts_ids": f["nuts_ids"],
+                "nuts_names": f["nuts_names"],
+                "nuts_countries": f["nuts_countries"],
+            }
+        os.utime(path)   # mark as recently used for pruning
+    except FileNotFoundError:
+        return None   # never stored, or pruned by another process
+    except (OSError, ValueError, KeyError):
+        print("[WARN] NUTS overlay cache unreadable, rebuilding it")
+        return None
+    return overlay
+
+
+def _store_overlay(key, overlay):
+    areas = overlay["areas"]
+    buf = io.BytesIO()
+    np.savez_compressed(
+        buf,
+        data=areas.data,
+        indices=areas.indices,
+        indptr=areas.indptr,
+        shape=np.asarray(areas.shape),
+        province_area=overlay["province_area"],
+        nuts_ids=overlay["nuts_ids"],
+        nuts_names=overlay["nuts_names"],
+        nuts_countries=overlay["nuts_countries"],
+    )
+    atomic_write(_cache_path(key), buf.getvalue())
+    prune_files(os.path.join(CACHE_DIR, f"{OVERLAY_NAME}-*.npz"))
+
+
+def nuts_overlay(land, nuts_path=NUTS3_PATH):
+    """Overlay of land (rows in land order) and NUTS-3 (columns), from memory, disk cache or built."""
+    st = os.stat(nuts_path)
+    key = geometry_key(
+        land.geometry, list(land.index), os.path.basename(nuts_path), st.st_size, st.st_mtime_ns, OVERLAY_VERSION
+    )
+    if key in _overlays:
+        return _overlays[key]
+
+    overlay = _load_overlay(key)
+    if overlay is not None:
+        print(f"[CACHE] {OVERLAY_NAME} loaded from geometry cache")
+    else:
+        nuts = load_nuts3(nuts_path, crs=land.crs or NUTS_CRS)
+        overlay = {
+            "areas": build_overlay(land.geometry.to_numpy(), nuts.geometry.to_numpy()),
+            "province_area": land.geometry.area.to_numpy() / 1_000_000,
+            "nuts_ids": nuts["NUTS_ID"].to_numpy(dtype=str),
+            "nuts_names": nuts["NAME_LATN"].to_numpy(dtype=str),
+            "nuts_countries": nuts["CNTR_CODE"].to_numpy(dtype=str),
+        }
+        _store_overlay(key, overlay)
+        print(f"[POP] NUTS-3 overlay built: {len(nuts)} regions, {overlay['areas'].nnz} province pairs")
+
+    _overlays.clear()
+    _overlays[key] = overlay
+    return overlay
+
+
+# --------------------------------------------------------
+# ALLOCATION
+# --------------------------------------------------------
+def allocation_matrix(overlay, min_coverage=MIN_COVERAGE):
+    """
+    (weights, covered): weights[p, n] = share of NUTS region n's population that goes to province p.
+    Columns sum to 1 over the covered provinces (0 for regions that touch none of them).
+    """
+    areas = overlay["areas"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage = np.asarray(areas.sum(axis=1)).ravel() / overlay["province_area"]
+    covered = np.nan_to_num(coverage) >= min_coverage
+
+    weights = sparse.diags(covered.astype(float)) @ areas
+    totals = np.asarray(weights.sum(axis=0)).ravel()
+    scale = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals > 0)
+    return (weights @ sparse.diags(scale)).tocsr(), covered
+
+
+def allocate_population(land, population, nuts_path=NUTS3_PATH, min_coverage=MIN_COVERAGE):
+    """
+    population: load_nuts_population() table.
+    Returns {pid: (population, dominant NUTS column)} for the covered provinces
+    and the overlay (names / ids / countries of the NUTS columns).
+    """
+    overlay = nuts_overlay(land, nuts_path)
+    weights, covered = allocation_matrix(overlay, min_coverage)
+
+    values = population["population"].reindex(overlay["nuts_ids"]).to_numpy(dtype=float)
+    values = np.nan_to_num(values)
+    allocated = weights @ values
+
+    # the region covering most of a province names it in the debug output
+    dominant = np.asarray(overlay["areas"].argmax(axis=1)).ravel()
+
+    result = {}
+    for row, pid in enumerate(land.index):
+        if covered[row]:
+            result[pid] = (float(allocated[row]), int(dominant[row]))
+
+    missing = int(np.count_nonzero(~np.isin(overlay["nuts_ids"], population.index)))
+    print(
+        f"[POP] NUTS-3 allocation: {len(result)} provinces covered, "
+        f"{allocated.sum():,.0f} people from {len(overlay['nuts_ids']) - missing} regions "
+        f"({missing} regions without data)"
+    )
+    return result, overlay
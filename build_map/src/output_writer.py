@@ -0,0 +1,211 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from export_shared import OUT
+
+# manifest of the previous build, relative to the output folder
+MANIFEST_PATH = os.path.join(".build", "manifest.json")
+
+IO_WORKERS = 2                          # background encode/write threads, 0 = write synchronously
+MAX_PENDING_BYTES = 512 * 1024 * 1024   # queued images/buffers; save/write blocks above this
+
+
+# --------------------------------------------------------
+# CONTENT-ADDRESSED OUTPUT WRITER
+# --------------------------------------------------------
+class _HashingBuffer(io.BytesIO):
+    """BytesIO that hashes everything written into it (PIL writes PNGs chunk by chunk)."""
+
+    def __init__(self):
+        super().__init__()
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        return super().write(data)
+
+
+def atomic_write(path, data):
+    """Write to a temp file next to `path` and rename it over, so readers never see half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class OutputWriter:
+    """
+    Writes export files only when their content changed since the last build.
+
+    Every file is hashed while it is produced and compared with the manifest
+    of the previous build; identical files are left untouched (same mtime, so
+    Godot does not re-import them). Changed files are written atomically.
+    Call finish() at the end of the export to store the new manifest.
+
+    Encoding, hashing and writing run on a small thread pool, so the export
+    goes on with the next stage meanwhile. Queued data is bounded by
+    max_pending_bytes (callers block until older writes are done). Images
+    passed to save_image must not be changed or closed afterwards. flush()
+    waits for the queue and re-raises the first failed write; call it before
+    reading back a file written in the same export.
+    """
+
+    def __init__(self, out_dir=OUT, workers=IO_WORKERS, max_pending_bytes=MAX_PENDING_BYTES):
+        self.out_dir = out_dir
+        self.manifest_path = os.path.join(out_dir, MANIFEST_PATH)
+        self.manifest = {}
+        self.written = []
+        self.unchanged = []
+
+        self.lock = threading.Lock()
+        self.space = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="output") if workers else None
+        self.pending = []   # (name, future)
+        self.pending_bytes = 0
+        self.max_pending_bytes = max_pending_bytes
+
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, encoding="utf-8") as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                print("[WARN] Output manifest unreadable, rewriting every file")
+
+    def path(self, name):
+        return name if os.path.isabs(name) else os.path.join(self.out_dir, name)
+
+    def _key(self, path):
+        return os.path.relpath(path, self.out_dir).replace(os.sep, "/")
+
+    def _commit(self, name, data, digest):
+        path = self.path(name)
+        key = self._key(path)
+
+        with self.lock:
+            old = self.manifest.get(key)
+        if old and old["sha256"] == digest:
+            try:
+                st = os.stat(path)
+                if st.st_size == old["size"] and st.st_mtime_ns == old["mtime_ns"]:
+                    with self.lock:
+                        self.unchanged.append(key)
+                    return False
+            except FileNotFoundError:
+                pass
+
+        atomic_write(path, data)
+        st = os.stat(path)
+        with self.lock:
+            self.manifest[key] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            self.written.append(key)
+        return True
+
+    # --------------------------------------------------------
+    # BACKGROUND QUEUE
+    # --------------------------------------------------------
+    def _submit(self, name, nbytes, func, *args):
+        if self.pool is None:
+            func(*args)
+            return
+
+        self._reap()
+        # back-pressure: wait until the queued data fits (a single oversized item still goes through)
+        with self.space:
+            while self.pending_bytes and self.pending_bytes + nbytes > self.max_pending_bytes:
+                self.space.wait()
+            self.pending_bytes += nbytes
+        self.pending.append((name, self.pool.submit(self._run, nbytes, func, *args)))
+
+    def _run(self, nbytes, func, *args):
+        try:
+            func(*args)
+        finally:
+            with self.space:
+                self.pending_bytes -= nbytes
+                self.space.notify_all()
+
+    def _reap(self):
+        """Drop finished writes from the queue, raising the first one that failed."""
+        still = []
+        failed = None
+        for name, future in self.pending:
+            if not future.done():
+                still.append((name, future))
+            elif failed is None and future.exception() is not None:
+                failed = (name, future.exception())
+        self.pending = still
+        if failed:
+            raise RuntimeError(f"Writing {failed[0]} failed") from failed[1]
+
+    def flush(self):
+        """Wait for every queued write; re-raises the first failed one."""
+        for _, future in self.pending:
+            future.exception()
+        self._reap()
+
+    def is_current(self, name):
+        """True if the file on disk is still the one recorded in the manifest."""
+        path = self.path(name)
+        with self.lock:
+            old = self.manifest.get(self._key(path))
+        if not old:
+            return False
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return st.st_size == old["size"] and st.st_mtime_ns == old["mtime_ns"]
+
+    def keep(self, name):
+        """Record an unchanged file without producing its content again."""
+        with self.lock:
+            self.unchanged.append(self._key(self.path(name)))
+
+    # --------------------------------------------------------
+    # OUTPUTS (queued)
+    # --------------------------------------------------------
+    def write_bytes(self, name, data):
+        self._submit(name, len(data), self._write_bytes, name, data)
+
+    def _write_bytes(self, name, data):
+        self._commit(name, data, hashlib.sha256(data).hexdigest())
+
+    def write_text(self, name, text, encoding="utf-8"):
+        # keep the platform newline, same as open(path, "w")
+        if os.linesep != "\n":
+            text = text.replace("\n", os.linesep)
+        self.write_bytes(name, text.encode(encoding))
+
+    def write_json(self, name, obj):
+        self.write_text(name, json.dumps(obj, indent=4))
+
+    def save_image(self, name, img, **save_kwargs):
+        save_kwargs.setdefault("format", "PNG")
+        self._submit(name, img.width * img.height * len(img.getbands()), self._save_image, name, img, save_kwargs)
+
+    def _save_image(self, name, img, save_kwargs):
+        buf = _HashingBuffer()
+        img.save(buf, **save_kwargs)
+        self._commit(name, buf.getvalue(), buf.hash.hexdigest())
+
+    def finish(self):
+        """Wait for the queued writes (errors propagate) and store the manifest."""
+        self.flush()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+        data = json.dumps(self.manifest, indent=1, sort_keys=True).encode("utf-8")
+        atomic_write(self.manifest_path, data)
+        print(f"[EXPORT] Outputs: {len(self.written)} written, {len(self.unchanged)} unchanged")
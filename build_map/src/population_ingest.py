@@ -0,0 +1,167 @@
+"""
+Streaming population ingest for import_population.py.
+
+Reads Wikidata/Eurostat exports as CSV or WDQS TSV in chunks with fixed
+dtypes, normalizes names once per distinct value and keeps only a running
+"latest record per key" table, so memory depends on the number of regions
+and not on the size of the dump.
+
+WDQS TSV differs from the CSV download: headers carry a "?" prefix, IRIs are
+written as <...> and literals as "...", optionally with @lang or ^^<type>.
+"""
+
+import csv
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 200_000
+
+STOPWORDS = {
+    "province", "region", "county", "state", "district", "republic",
+    "oblast", "voivodeship", "governorate", "gouvernorate", "prefecture",
+    "department", "autonomous", "federal", "territory", "municipality"
+}
+
+# columns used downstream; everything else in the dump is skipped while reading
+COLUMNS = ("region", "regionLabel", "countryLabel", "iso", "population", "populationDate")
+KEY_COLUMNS = ["key_iso", "key_region", "key_country"]
+
+_IRI = re.compile(r'^<(.*)>$')
+_LITERAL = re.compile(r'^"(.*)"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?$')
+_ESCAPE = re.compile(r'\\(.)')
+
+
+# --------------------------------------------------------
+# NORMALIZATION (memoized, applied per distinct value)
+# --------------------------------------------------------
+@lru_cache(maxsize=1 << 16)
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.lower()
+    text = re.sub(r"[`'\"]", "", text)
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    words = [w for w in text.split() if w not in STOPWORDS]
+    return " ".join(words).strip()
+
+
+def normalize(text: str) -> str:
+    if not isinstance(text, str):
+        return ""
+    return _normalize(text)
+
+
+def normalize_iso(val: Optional[str]) -> str:
+    if not isinstance(val, str):
+        return ""
+    return val.strip().upper().replace(" ", "")
+
+
+def normalize_series(values: pd.Series, func=normalize) -> np.ndarray:
+    """func applied once per distinct value of the column instead of once per row."""
+    codes, uniques = pd.factorize(values)
+    normed = np.array([func(u) for u in uniques] + [""], dtype=object)
+    return normed[codes]   # code -1 (missing) picks the trailing ""
+
+
+# --------------------------------------------------------
+# CHUNKED READING (CSV / WDQS TSV)
+# --------------------------------------------------------
+def _unwrap_wdqs(values: pd.Series) -> pd.Series:
+    """<iri> -> iri, "literal"@en / "literal"^^<type> -> literal."""
+    values = values.str.replace(_IRI, r"\1", regex=True)
+    literal = values.str.match(_LITERAL, na=False)
+    if literal.any():
+        values = values.where(
+            ~literal,
+            values.str.replace(_LITERAL, r"\1", regex=True).str.replace(_ESCAPE, r"\1", regex=True),
+        )
+    return values
+
+
+def read_chunks(path: str, chunksize: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Population dump in chunks with the columns of COLUMNS that exist, all as strings."""
+    tsv = os.path.splitext(path)[1].lower() == ".tsv"
+    options = dict(sep="\t", quoting=csv.QUOTE_NONE) if tsv else dict(sep=",")
+
+    reader = pd.read_csv(
+        path,
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        usecols=lambda c: c.lstrip("?") in COLUMNS,
+        chunksize=chunksize,
+        encoding="utf-8-sig",
+        **options,
+    )
+    for chunk in reader:
+        chunk.columns = [c.lstrip("?") for c in chunk.columns]
+        if tsv:
+            for col in chunk.columns:
+                chunk[col] = _unwrap_wdqs(chunk[col])
+        yield chunk
+
+
+def prepare_chunk(chunk: pd.DataFrame, offset: int) -> pd.DataFrame:
+    if "regionLabel" not in chunk.columns:
+        raise KeyError("Missing required column 'regionLabel' in population CSV")
+
+    chunk = chunk.reset_index(drop=True)
+    n = len(chunk)
+    empty = pd.Series([None] * n, dtype=object)
+    get = lambda col: chunk[col] if col in chunk.columns else empty
+
+    df = pd.DataFrame({
+        "source_index": np.arange(offset, offset + n, dtype=np.int64),
+        "region_uri": get("region").fillna(""),
+        "regionLabel": get("regionLabel"),
+        "countryLabel": get("countryLabel").fillna(""),
+        "iso": get("iso").fillna(""),
+        "population": pd.to_numeric(get("population"), errors="coerce").astype(np.float64),
+        "populationDate": pd.to_datetime(get("populationDate"), errors="coerce", utc=True),
+    })
+
+    df["norm_iso"] = normalize_series(df["iso"], normalize_iso)
+    df["norm_region"] = normalize_series(df["regionLabel"])
+    df["norm_country"] = normalize_series(df["countryLabel"])
+
+    # records with an ISO code are keyed by it alone, the rest by (region, country)
+    has_iso = df["norm_iso"] != ""
+    df["key_iso"] = df["norm_iso"]
+    df["key_region"] = df["norm_region"].where(~has_iso, "")
+    df["key_country"] = df["norm_country"].where(~has_iso, "")
+    return df
+
+
+def keep_latest(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per key: the newest populationDate, later rows win ties, undated rows lose to dated ones."""
+    df = df.sort_values("populationDate", kind="stable", na_position="first")
+    return df.drop_duplicates(KEY_COLUMNS, keep="last")
+
+
+# --------------------------------------------------------
+# ENTRY POINT
+# --------------------------------------------------------
+def load_latest(path: str, chunksize: int = CHUNK_ROWS) -> pd.DataFrame:
+    """Latest population record per ISO code / (region, country), ISO keys first, sorted by key."""
+    latest = None
+    rows = 0
+    for chunk in read_chunks(path, chunksize):
+        df = keep_latest(prepare_chunk(chunk, rows))
+        rows += len(chunk)
+        # source_index keeps file order, so ties between chunks still go to the later row
+        latest = df if latest is None else keep_latest(pd.concat([latest, df]).sort_values("source_index"))
+
+    if latest is None:
+        latest = prepare_chunk(pd.DataFrame({"regionLabel": pd.Series(dtype=str)}), 0)
+
+    latest = latest.assign(no_iso=latest["key_iso"] == "")
+    latest = latest.sort_values(["no_iso", *KEY_COLUMNS], kind="stable")
+    print(f"[POP] {os.path.basename(path)}: {rows} records, {len(latest)} latest per region")
+    return latest.drop(columns=["no_iso", *KEY_COLUMNS]).reset_index(drop=True)
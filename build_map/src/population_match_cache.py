@@ -0,0 +1,150 @@
+"""
+Persistent population match store + manual overrides for import_population.py.
+
+Every source row is resolved to a province by the match tiers (iso, exact,
+region only, fuzzy). The outcome only depends on the normalized source key
+(norm_iso, norm_region, norm_country) and on the land lookup tables, so it is
+stored in src/.match_cache/<land fingerprint>.json and reused on the next run.
+A different land version (merge threshold, subdivision, names) gets its own
+file; the fuzzy sweeps then only run for keys that were never seen.
+
+population_overrides.csv (optional, ';' separated, user maintained) fixes
+matches by hand and wins over the cache and every tier:
+
+    source_region;source_country;province_name;province_country;province_id
+    Region Sjælland;Denmark;Zealand;Denmark;
+    Some Region;;;;412
+    Wrong Region;Italy;-;;
+
+source_country may be empty (any country). The target is province_id, or
+province_name (+ province_country); "-" as province_name drops the source row.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from geometry_cache import prune_files
+from output_writer import atomic_write
+from population_ingest import normalize
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE, ".match_cache")
+OVERRIDES_PATH = os.path.join(BASE, "population_overrides.csv")
+CACHE_VERSION = 1
+KEEP_ENTRIES = 4   # land versions kept, oldest are removed
+
+
+def land_fingerprint(lookup_full, lookup_region, region_index, country_map, iso_map):
+    """Hash of everything the match tiers read from the land table."""
+    h = hashlib.sha256()
+    h.update(str(CACHE_VERSION).encode("utf-8"))
+    for part in (
+        sorted(lookup_full.items()),
+        sorted(lookup_region.items()),
+        region_index,
+        sorted(country_map.items()),
+        sorted(iso_map.items()),
+    ):
+        h.update(repr(part).encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+def source_key(norm_iso, norm_region, norm_country):
+    return f"{norm_iso}|{norm_region}|{norm_country}"
+
+
+# --------------------------------------------------------
+# MATCH STORE
+# --------------------------------------------------------
+class MatchStore:
+    """source key -> (pid or None, method) for one land fingerprint."""
+
+    def __init__(self, fingerprint, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, f"{fingerprint}.json")
+        self.entries = {}
+        self.added = 0
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = {k: (pid, method) for k, (pid, method) in data["entries"].items()}
+                os.utime(self.path)   # mark as recently used for pruning
+            except (OSError, ValueError, KeyError, TypeError):
+                print("[WARN] Population match cache unreadable, rebuilding it")
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, pid, method):
+        self.entries[key] = (None if pid is None else int(pid), method)
+        self.added += 1
+
+    def save(self):
+        if not self.added:
+            return
+        data = {"version": CACHE_VERSION, "entries": {k: list(v) for k, v in sorted(self.entries.items())}}
+        atomic_write(self.path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        self._prune()
+        print(f"[POP] Match cache: {self.added} new keys stored ({len(self.entries)} total)")
+        self.added = 0
+
+    def _prune(self):
+        prune_files(os.path.join(self.cache_dir, "*.json"), KEEP_ENTRIES)
+
+
+# --------------------------------------------------------
+# OVERRIDES
+# --------------------------------------------------------
+def _override_target(row, lookup_full, lookup_region, country_map):
+    """pid of an override row, None to drop the source row, or -1 if the target does not exist."""
+    pid = str(row.get("province_id") or "").strip()
+    if pid:
+        try:
+            pid = int(float(pid))
+        except (ValueError, OverflowError):
+            return -1   # not a number, reported like a missing target
+        return pid if pid in country_map else -1
+
+    name = str(row.get("province_name") or "").strip()
+    if name == "-":
+        return None
+    n_name = normalize(name)
+    n_country = normalize(row.get("province_country"))
+    hits = lookup_full.get((n_name, n_country)) if n_country else lookup_region.get(n_name)
+    return hits[0] if hits else -1
+
+
+def load_overrides(lookup_full, lookup_region, country_map, path=OVERRIDES_PATH):
+    """(norm_region, norm_country) -> pid or None (drop); norm_country "" matches any country."""
+    if not path or not os.path.exists(path):
+        return {}
+
+    df = pd.read_csv(path, sep=";", dtype=str, keep_default_na=False)
+    overrides = {}
+    for _, row in df.iterrows():
+        key = (normalize(row.get("source_region")), normalize(row.get("source_country")))
+        if not key[0]:
+            continue
+        pid = _override_target(row, lookup_full, lookup_region, country_map)
+        if pid == -1:
+            print(f"[WARN] Population override target not found: {row.get('source_region')} -> "
+                  f"{row.get('province_name') or row.get('province_id')}")
+            continue
+        overrides[key] = pid
+
+    print(f"[POP] {len(overrides)} population overrides from {os.path.basename(path)}")
+    return overrides
+
+
+def find_override(overrides, norm_region, norm_country):
+    """(found, pid) for a source row."""
+    for key in ((norm_region, norm_country), (norm_region, "")):
+        if key in overrides:
+            return True, overrides[key]
+    return False, None
@@ -0,0 +1,271 @@
+"""
+Province table + compact binary province database (Provinces.bin).
+
+Provinces.bin layout (little endian, every block padded to 8 bytes):
+
+    header   magic "OGSPDB\\0\\0", u32 version, u32 n_provinces, u32 n_states,
+             u32 n_state_members, u32 width, u32 height, f64[4] bounds (EPSG:3035)
+    states   n_states x 8 bytes ASCII state codes (NUL padded)
+    columns  id i32[N] | color u8[N*3] | type u8[N] (0 land, 1 sea) | state i32[N]
+             | owner i32[N] | centroid f32[N*2] | bbox i32[N*4] (x0, y0, x1, y1, end exclusive)
+             | pixels i32[N] | population i64[N]
+    csr      state_offsets i32[n_states + 1] | state_provinces i32[n_state_members]
+
+Provinces of state s are state_provinces[state_offsets[s]:state_offsets[s + 1]].
+Every block can be read straight into a typed array, nothing needs parsing.
+"""
+
+import struct
+
+import numpy as np
+import pandas as pd
+
+from export_shared import id_dtype, image_rows, pack_rgb, row_chunks, unpack_rgb
+from label_anchors import label_anchors
+from province_runs import RunCollector
+
+DB_FILE = "Provinces.bin"
+DB_MAGIC = b"OGSPDB\0\0"
+DB_VERSION = 1
+STATE_CODE_BYTES = 8
+
+HEADER = struct.Struct("<8sIIIIII4d")
+
+TYPE_LAND = 0
+TYPE_SEA = 1
+
+# (name, dtype, values per province)
+COLUMNS = [
+    ("id", "<i4", 1),
+    ("color", "u1", 3),
+    ("type", "u1", 1),
+    ("state", "<i4", 1),
+    ("owner", "<i4", 1),
+    ("centroid", "<f4", 2),
+    ("bbox", "<i4", 4),
+    ("pixels", "<i4", 1),
+    ("population", "<i8", 1),
+]
+
+
+# --------------------------------------------------------
+# VECTORIZED HELPERS
+# --------------------------------------------------------
+def state_groups(land):
+    """One grouped pass over land: sorted state codes + CSR (offsets, province ids)."""
+    codes, states = pd.factorize(land["country"], sort=True)
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=len(states))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    members = np.asarray(land.index, dtype=np.int32)[order]
+    return list(states), offsets, members, codes
+
+
+def pixel_stats(chunks, n, shape):
+    """
+    Per-id pixel count, centroid and bbox from (top, block) row chunks of an id raster
+    with ids in [0, n). Negative ids are ignored.
+    """
+    h, w = shape
+    count = np.zeros(n, dtype=np.int64)
+    sx = np.zeros(n, dtype=np.float64)
+    sy = np.zeros(n, dtype=np.float64)
+    x0 = np.full(n, w, dtype=np.int64)
+    y0 = np.full(n, h, dtype=np.int64)
+    x1 = np.full(n, -1, dtype=np.int64)
+    y1 = np.full(n, -1, dtype=np.int64)
+
+    cols = np.arange(w, dtype=np.int64)
+    for top, block in chunks:
+        rows = np.arange(top, top + block.shape[0], dtype=np.int64)
+
+        flat = block.ravel()
+        valid = flat >= 0
+        fid = flat[valid].astype(np.int64)
+        xs = np.broadcast_to(cols, block.shape).ravel()[valid]
+        ys = np.broadcast_to(rows[:, None], block.shape).ravel()[valid]
+
+        count += np.bincount(fid, minlength=n)
+        sx += np.bincount(fid, weights=xs, minlength=n)
+        sy += np.bincount(fid, weights=ys, minlength=n)
+        np.minimum.at(x0, fid, xs)
+        np.minimum.at(y0, fid, ys)
+        np.maximum.at(x1, fid, xs)
+        np.maximum.at(y1, fid, ys)
+
+    has = count > 0
+    cx = np.where(has, sx / np.maximum(count, 1), 0.0)
+    cy = np.where(has, sy / np.maximum(count, 1), 0.0)
+    bbox = np.where(has[:, None], np.stack([x0, y0, x1 + 1, y1 + 1], axis=1), -1)
+    return count, np.stack([cx, cy], axis=1), bbox
+
+
+def first_seen_colors(img):
+    """Packed colors of the image sorted by their first pixel (row-major), read in row chunks."""
+    w = img.width
+    keys, firsts = [], []
+    for top, bottom in row_chunks(img.height):
+        u, first = np.unique(pack_rgb(image_rows(img, top, bottom)).ravel(), return_index=True)
+        keys.append(u)
+        firsts.append(first + top * w)
+
+    keys = np.concatenate(keys)
+    firsts = np.concatenate(firsts)
+    order = np.argsort(firsts, kind="stable")
+    keys, firsts = keys[order], firsts[order]
+    _, idx = np.unique(keys, return_index=True)
+    idx.sort()
+    return keys[idx]
+
+
+# --------------------------------------------------------
+# PROVINCE TABLE (land + sea, same ids as Provinces.txt)
+# --------------------------------------------------------
+def build_province_table(province_colors, id_map, land, img):
+    """
+    Land rows: every pid with a color, up to the highest pid present in id_map.
+    Sea rows: every other color of ProvinceMap (img), in order of first appearance,
+    numbered from max_pid + 1.
+    """
+    max_pid = int(id_map.max())
+
+    land_pids = np.array(sorted(p for p in province_colors.values() if p <= max_pid), dtype=np.int64)
+    pid_to_color = {pid: col for col, pid in province_colors.items()}
+    land_keys = pack_rgb(np.array([pid_to_color[p] for p in land_pids], dtype=np.uint8).reshape(-1, 3))
+    all_land_keys = pack_rgb(np.array(list(province_colors), dtype=np.uint8).reshape(-1, 3))
+
+    seen = first_seen_colors(img)
+    sea_keys = seen[~np.isin(seen, all_land_keys)]
+    sea_ids = max_pid + 1 + np.arange(len(sea_keys))
+
+    sea_sorted = np.argsort(sea_keys)
+    sea_lookup_keys = sea_keys[sea_sorted]
+    sea_lookup_ids = sea_ids[sea_sorted]
+
+    def full_id_chunks():
+        # land ids from id_map, sea ids looked up from the colors
+        for top, bottom in row_chunks(img.height):
+            ids = id_map[top:bottom].astype(np.int32)
+            sea = ids < 0
+            if sea.any() and len(sea_lookup_keys):
+                keys = pack_rgb(image_rows(img, top, bottom))[sea]
+                pos = np.clip(np.searchsorted(sea_lookup_keys, keys), 0, len(sea_lookup_keys) - 1)
+                ids[sea] = np.where(sea_lookup_keys[pos] == keys, sea_lookup_ids[pos], -1)
+            yield top, ids
+
+    n_ids = max_pid + 1 + len(sea_keys)
+    full_ids = np.empty(id_map.shape, dtype=id_dtype(n_ids))
+
+    def keep_full(chunks):
+        for top, ids in chunks:
+            full_ids[top:top + len(ids)] = ids
+            yield top, ids
+
+    # the run-length index and the full id raster are collected in the same pass over the ids
+    runs = RunCollector(id_map.shape)
+    count, centroid, bbox = pixel_stats(runs.tap(keep_full(full_id_chunks())), n_ids, id_map.shape)
+    run_offsets, run_spans = runs.finish(n_ids)
+
+    anchor, label_size, _ = label_anchors(full_ids, n_ids, centroid)
+    del full_ids
+
+    states, _, _, codes = state_groups(land)
+    state_of = pd.Series(codes, index=land.index)
+
+    ids = np.concatenate([land_pids, sea_ids])
+    land_state = state_of.reindex(land_pids).fillna(-1).to_numpy(dtype=np.int32)
+
+    return {
+        "id": ids.astype(np.int32),
+        "color": unpack_rgb(np.concatenate([land_keys, sea_keys])),
+        "type": np.concatenate([
+            np.full(len(land_pids), TYPE_LAND, dtype=np.uint8),
+            np.full(len(sea_keys), TYPE_SEA, dtype=np.uint8),
+        ]),
+        "state": np.concatenate([land_state, np.full(len(sea_keys), -1, dtype=np.int32)]),
+        "centroid": centroid[ids].astype(np.float32),
+        "bbox": bbox[ids].astype(np.int32),
+        "pixels": count[ids].astype(np.int32),
+        "anchor": anchor[ids],
+        "label_size": label_size[ids],
+        "states": states,
+        "shape": id_map.shape,
+        "run_offsets": run_offsets,
+        "runs": run_spans,
+    }
+
+
+# --------------------------------------------------------
+# BINARY EXPORT / LOAD
+# --------------------------------------------------------
+def _pad(n):
+    return (-n) % 8
+
+
+def export_province_db(table, land, population, bounds, writer):
+    states, offsets, members, _ = state_groups(land)
+    n = len(table["id"])
+
+    pop = np.zeros(n, dtype=np.int64)
+    if population:
+        s = pd.Series(population, dtype="float64")
+        pos = pd.Series(np.arange(n), index=table["id"])
+        hit = s.index.isin(pos.index)
+        pop[pos[s.index[hit]].to_numpy()] = np.nan_to_num(s[hit].to_numpy()).astype(np.int64)
+    pop[table["type"] == TYPE_SEA] = 0
+
+    columns = {k: table[k] for k in ("id", "color", "type", "state", "centroid", "bbox", "pixels")}
+    columns["owner"] = table["state"]
+    columns["population"] = pop
+
+    h, w = table["shape"]
+    parts = [HEADER.pack(DB_MAGIC, DB_VERSION, n, len(states), len(members), w, h, *map(float, bounds))]
+
+    codes = b"".join(s.encode("ascii", "replace")[:STATE_CODE_BYTES].ljust(STATE_CODE_BYTES, b"\0") for s in states)
+    parts.append(codes)
+
+    for name, dtype, width in COLUMNS:
+        parts.append(np.ascontiguousarray(columns[name], dtype=dtype).reshape(n * width).tobytes())
+    parts.append(np.asarray(offsets, dtype="<i4").tobytes())
+    parts.append(np.asarray(members, dtype="<i4").tobytes())
+
+    data = bytearray()
+    for p in parts:
+        data += p
+        data += b"\0" * _pad(len(p))
+
+    writer.write_bytes(DB_FILE, bytes(data))
+    print(f"[EXPORT] {DB_FILE} written ({n} provinces, {len(states)} states, {len(data) / 1024:.0f} KiB).")
+
+
+def load_province_db(path):
+    """Map Provinces.bin back to NumPy arrays (views into one buffer, no parsing)."""
+    with open(path, "rb") as f:
+        buf = f.read()
+
+    magic, version, n, n_states, n_members, w, h, *bounds = HEADER.unpack_from(buf, 0)
+    if magic != DB_MAGIC:
+        raise ValueError(f"{path} is not a province database")
+    if version != DB_VERSION:
+        raise ValueError(f"{path}: unsupported province database version {version}")
+
+    pos = HEADER.size + _pad(HEADER.size)
+    size = n_states * STATE_CODE_BYTES
+    db = {
+        "version": version,
+        "shape": (h, w),
+        "bounds": tuple(bounds),
+        "states": [buf[pos + i * 8: pos + (i + 1) * 8].rstrip(b"\0").decode("ascii") for i in range(n_states)],
+    }
+    pos += size + _pad(size)
+
+    blocks = [(name, dtype, n, width) for name, dtype, width in COLUMNS]
+    blocks += [("state_offsets", "<i4", n_states + 1, 1), ("state_provinces", "<i4", n_members, 1)]
+
+    for name, dtype, count, width in blocks:
+        arr = np.frombuffer(buf, dtype=dtype, count=count * width, offset=pos)
+        db[name] = arr.reshape(count, width) if width > 1 else arr
+        size = arr.nbytes
+        pos += size + _pad(size)
+
+    return db
@@ -0,0 +1,181 @@
+"""
+Point -> province lookup against a finished export (cities, units, resources).
+
+    lookup = ProvinceLookup("opengs_export")
+    hits = lookup.query(lon, lat)                  # arrays, EPSG:4326 by default
+    hits = lookup.query(x, y, crs="EPSG:3035")
+    hits["pid"], hits["state"], hits["sea"]        # -1 = no province / no state
+    lookup.states[hits["state"]]                   # state codes (where state >= 0)
+
+Points are transformed in bulk with pyproj and resolved on the full id raster
+(land + sea ids), which is rebuilt from ProvinceRuns.bin without decoding any
+PNG. The pixel maths is the same as geom_to_pixel_coords. Points on pixels
+next to a border are resolved again against the province polygons
+(.build/lookup/, written by the export) with an STRtree, so they do not
+depend on how the border was rasterized. Where polygons overlap, the one
+drawn later into ProvinceMap wins, as in the raster.
+
+    python build_map.py lookup points.csv [--crs EPSG:4326] [-o out.csv]
+
+reads x/y (or lon/lat) columns and writes them with pid, state and sea added
+(default: points_provinces.csv next to the input).
+"""
+
+import io
+import os
+
+import numpy as np
+import shapely
+
+from export_shared import OUT
+from geometry_cache import read_wkb, wkb_bytes
+from label_anchors import border_mask
+from province_db import DB_FILE, TYPE_SEA, load_province_db
+from province_runs import RUNS_FILE, load_province_runs
+
+LOOKUP_DIR = os.path.join(".build", "lookup")
+SHAPES_FILE = os.path.join(LOOKUP_DIR, "shapes.wkb")
+SHAPE_IDS_FILE = os.path.join(LOOKUP_DIR, "shape_ids.npy")
+EXPORT_CRS = "EPSG:3035"
+
+
+# --------------------------------------------------------
+# EXPORT SIDE
+# --------------------------------------------------------
+def export_lookup_shapes(land, sea_regions, sea_colors, table, writer):
+    """Province polygons in draw order + their Provinces.txt ids, for the border fallback."""
+    from province_mesh import mesh_geometries
+
+    ids, geoms = mesh_geometries(land, sea_regions, sea_colors, table)
+    buf = io.BytesIO()
+    np.save(buf, ids.astype(np.int32), allow_pickle=False)
+    writer.write_bytes(SHAPES_FILE, wkb_bytes(geoms))
+    writer.write_bytes(SHAPE_IDS_FILE, buf.getvalue())
+
+
+# --------------------------------------------------------
+# ID RASTER
+# --------------------------------------------------------
+def runs_to_ids(index):
+    """Full id raster (int32, -1 = no province) from a ProvinceRuns.bin index."""
+    h, w = index["shape"]
+    offsets = index["offsets"].astype(np.int64)
+    runs = index["runs"].astype(np.int64)
+    pids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    # runs never overlap: +(id + 1) at every run start, -(id + 1) at its end, then a running sum
+    # (starts are unique and so are ends, so each fancy-index update sees every position once)
+    marks = np.zeros(h * w + 1, dtype=np.int32)
+    start = runs[:, 0] * w + runs[:, 1]
+    marks[start] += (pids + 1).astype(np.int32)
+    marks[start + runs[:, 2] - runs[:, 1]] -= (pids + 1).astype(np.int32)
+    return (np.cumsum(marks[:-1], dtype=np.int32) - 1).reshape(h, w)
+
+
+# --------------------------------------------------------
+# LOOKUP
+# --------------------------------------------------------
+class ProvinceLookup:
+    """Batch point lookup on one export folder; build it once, query as often as needed."""
+
+    def __init__(self, out_dir=OUT, polygons=True):
+        db = load_province_db(os.path.join(out_dir, DB_FILE))
+        self.bounds = db["bounds"]
+        self.states = np.asarray(db["states"], dtype=object)
+
+        n = int(db["id"].max()) + 1 if len(db["id"]) else 0
+        self.state_of = np.full(n + 1, -1, dtype=np.int32)
+        self.sea_of = np.zeros(n + 1, dtype=bool)
+        self.state_of[db["id"]] = db["state"]
+        self.sea_of[db["id"]] = db["type"] == TYPE_SEA
+        # index n stands for "no province", so -1 can be looked up directly
+
+        self.ids = runs_to_ids(load_province_runs(os.path.join(out_dir, RUNS_FILE)))
+        self.border = border_mask(self.ids)
+
+        self.tree = None
+        shapes = os.path.join(out_dir, SHAPES_FILE)
+        if polygons and os.path.exists(shapes):
+            self.shape_geoms = np.asarray(read_wkb(shapes), dtype=object)
+            self.shape_ids = np.load(os.path.join(out_dir, SHAPE_IDS_FILE), allow_pickle=False)
+            self.tree = shapely.STRtree(self.shape_geoms)
+        elif polygons:
+            print(f"[WARN] {SHAPES_FILE} missing in {out_dir}, border points use the raster only")
+        self._transformers = {}
+
+    def _to_export_crs(self, x, y, crs):
+        if crs is None or crs == EXPORT_CRS:
+            return x, y
+        if crs not in self._transformers:
+            from pyproj import Transformer
+
+            self._transformers[crs] = Transformer.from_crs(crs, EXPORT_CRS, always_xy=True)
+        return self._transformers[crs].transform(x, y)
+
+    def pixels(self, x, y):
+        """(row, col) of export coordinates, same rounding as geom_to_pixel_coords; -1 outside."""
+        minx, miny, maxx, maxy = self.bounds
+        h, w = self.ids.shape
+        col = np.floor((x - minx) / (maxx - minx) * w)
+        row = np.floor((1 - (y - miny) / (maxy - miny)) * h)
+        inside = (col >= 0) & (col < w) & (row >= 0) & (row < h)
+        return np.where(inside, row, -1).astype(np.int64), np.where(inside, col, -1).astype(np.int64)
+
+    def _polygon_ids(self, x, y):
+        """Province id of every point from the polygons (-1 where none contains it)."""
+        points = shapely.points(x, y)
+        point_idx, shape_idx = self.tree.query(points, predicate="intersects")
+        out = np.full(len(points), -1, dtype=np.int64)
+        # the highest shape index (drawn last) wins on overlaps
+        order = np.lexsort((shape_idx, point_idx))
+        last = np.r_[point_idx[order][1:] != point_idx[order][:-1], True] if len(order) else order
+        out[point_idx[order][last]] = self.shape_ids[shape_idx[order][last]]
+        return out
+
+    def query(self, x, y, crs="EPSG:4326"):
+        """
+        x, y: arrays of lon/lat (crs EPSG:4326) or of any other crs pyproj knows.
+        Returns {"pid": int32, "state": int32 index into self.states, "sea": bool}.
+        """
+        x, y = self._to_export_crs(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), crs)
+        x, y = np.atleast_1d(x), np.atleast_1d(y)
+
+        row, col = self.pixels(x, y)
+        inside = row >= 0
+        pid = np.full(len(x), -1, dtype=np.int64)
+        pid[inside] = self.ids[row[inside], col[inside]]
+
+        if self.tree is not None:
+            near = np.flatnonzero(inside)
+            near = near[self.border[row[near], col[near]]]
+            if len(near):
+                exact = self._polygon_ids(x[near], y[near])
+                found = exact >= 0
+                pid[near[found]] = exact[found]
+
+        pid[pid >= len(self.state_of) - 1] = -1
+        return {
+            "pid": pid.astype(np.int32),
+            "state": self.state_of[pid],
+            "sea": self.sea_of[pid],
+        }
+
+
+def lookup_csv(path, out_dir=OUT, crs="EPSG:4326", out_path=None):
+    """Write a CSV with x/y (or lon/lat) columns again with pid / state / sea added; returns the output path."""
+    import pandas as pd
+
+    df = pd.read_csv(path, sep=None, engine="python")
+    xcol, ycol = ("lon", "lat") if "lon" in df.columns else ("x", "y")
+    lookup = ProvinceLookup(out_dir)
+    hits = lookup.query(df[xcol].to_numpy(), df[ycol].to_numpy(), crs=crs)
+
+    codes = np.append(lookup.states, "")   # state -1 -> ""
+    df["pid"] = hits["pid"]
+    df["state"] = codes[hits["state"]]
+    df["sea"] = hits["sea"].astype(np.uint8)
+
+    out_path = out_path or f"{os.path.splitext(path)[0]}_provinces.csv"
+    df.to_csv(out_path, sep=";", index=False)
+    print(f"[LOOKUP] {len(df)} points -> {out_path}")
+    return out_path
@@ -0,0 +1,206 @@
+"""
+Pre-triangulated province meshes (ProvinceMesh.bin) for vector rendering in Godot.
+
+Every land province and sea region is triangulated with a constrained
+Delaunay triangulation (holes respected) in export pixel space, optionally at
+several levels of detail. LODs are simplified first with the shared-arc
+simplification of topology_simplify.py, so neighbouring meshes keep meeting.
+
+ProvinceMesh.bin layout (little endian, every block padded to 8 bytes):
+
+    header    magic "OGSMESH\\0", u32 version, u32 n_ids, u32 n_lods,
+              u32 width, u32 height, f64[4] bounds (EPSG:3035)
+    lods      f32[n_lods] simplification tolerance in pixels (0 = as exported)
+    vertex    u32[n_lods * (n_ids + 1)] vertex offsets, per LOD indexed by province id
+    index     u32[n_lods * (n_ids + 1)] index offsets, same layout
+    vertices  f32[n_vertices * 2] pixel x, y
+    indices   u32[n_indices], three per triangle, relative to the province's first vertex
+
+Province p at LOD l: vertices[v[l, p]:v[l, p + 1]], indices[i[l, p]:i[l, p + 1]].
+Ids are the same as in Provinces.txt (land and sea); ids without geometry are empty.
+All triangles are wound the same way (clockwise on screen, y pointing down).
+"""
+
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import shapely
+
+from country_pool import resolve_workers
+from topology_simplify import pixel_tolerance, simplify_partition
+
+MESH_FILE = "ProvinceMesh.bin"
+MESH_MAGIC = b"OGSMESH\0"
+MESH_VERSION = 1
+CHUNK = 64   # provinces per triangulation task
+
+HEADER = struct.Struct("<8sIIIII4d")
+
+
+# --------------------------------------------------------
+# TRIANGULATION
+# --------------------------------------------------------
+def to_pixels(coords, bounds, size):
+    """Map coordinates -> export pixel space (same transform as geom_to_pixel_coords, without rounding)."""
+    minx, miny, maxx, maxy = bounds
+    px = (coords[:, 0] - minx) / (maxx - minx) * size
+    py = (1 - (coords[:, 1] - miny) / (maxy - miny)) * size
+    return np.stack([px, py], axis=1)
+
+
+def triangulate(geom, bounds, size):
+    """(vertices f32[n, 2], indices u32[m * 3]) of one polygon / multipolygon in pixel space."""
+    if geom is None or geom.is_empty:
+        return np.empty((0, 2), dtype=np.float32), np.empty(0, dtype=np.uint32)
+
+    parts = shapely.get_parts(geom)
+    tris = shapely.get_parts(shapely.constrained_delaunay_triangles(parts))
+    if len(tris) == 0:
+        return np.empty((0, 2), dtype=np.float32), np.empty(0, dtype=np.uint32)
+
+    # every triangle is a closed ring of 4 points
+    corners = shapely.get_coordinates(shapely.get_exterior_ring(tris)).reshape(-1, 4, 2)[:, :3]
+    corners = to_pixels(corners.reshape(-1, 2), bounds, size).astype(np.float32).reshape(-1, 3, 2)
+
+    # one winding for all triangles: clockwise on screen (positive area with y down)
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    cross = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    flip = cross < 0
+    corners[flip] = corners[flip][:, [0, 2, 1]]
+    corners = corners[cross != 0]
+
+    vertices, indices = np.unique(corners.reshape(-1, 2), axis=0, return_inverse=True)
+    return vertices, indices.reshape(-1).astype(np.uint32)
+
+
+def _triangulate_chunk(geoms, bounds, size):
+    return [triangulate(g, bounds, size) for g in geoms]
+
+
+def triangulate_all(geoms, bounds, size, workers=0):
+    """Triangulate every geometry; GEOS releases the GIL, so threads run the chunks in parallel."""
+    chunks = [geoms[i:i + CHUNK] for i in range(0, len(geoms), CHUNK)]
+    workers = min(resolve_workers(workers), max(len(chunks), 1))
+    if workers <= 1:
+        results = [_triangulate_chunk(c, bounds, size) for c in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_triangulate_chunk, chunks, [bounds] * len(chunks), [size] * len(chunks)))
+    return [mesh for chunk in results for mesh in chunk]
+
+
+# --------------------------------------------------------
+# EXPORT / LOAD
+# --------------------------------------------------------
+def _pad(n):
+    return (-n) % 8
+
+
+def mesh_geometries(land, sea_regions, sea_colors, table):
+    """(ids, geometries) in Provinces.txt ids: land pids as in the table, sea regions via their ProvinceMap color."""
+    ids = table["id"].astype(np.int64)
+    land_ids = set(ids[table["type"] == 0].tolist())
+    sea_rows = table["type"] == 1
+    sea_id = {tuple(int(v) for v in c): int(i) for c, i in zip(table["color"][sea_rows], ids[sea_rows])}
+
+    out_ids, geoms = [], []
+    for pid, geom in zip(land.index, land.geometry):
+        if int(pid) in land_ids:
+            out_ids.append(int(pid))
+            geoms.append(geom)
+    for color, geom in zip(sea_colors, sea_regions):
+        # sea regions hidden completely by land never got an id
+        if tuple(color) in sea_id:
+            out_ids.append(sea_id[tuple(color)])
+            geoms.append(geom)
+    return np.asarray(out_ids, dtype=np.int64), np.asarray(geoms, dtype=object)
+
+
+def export_province_mesh(land, sea_regions, sea_colors, table, bounds, size, writer, lods=(0,), workers=0):
+    ids, geoms = mesh_geometries(land, sea_regions, sea_colors, table)
+    n_ids = int(table["id"].max()) + 1 if len(table["id"]) else 0
+    lods = [float(px) for px in lods]
+
+    v_offsets = np.zeros((len(lods), n_ids + 1), dtype=np.int64)
+    i_offsets = np.zeros((len(lods), n_ids + 1), dtype=np.int64)
+    vertices, indices = [], []
+    v_total = i_total = 0
+
+    for lod, px in enumerate(lods):
+        shapes = simplify_partition(geoms, pixel_tolerance(bounds, size, px)) if px > 0 else geoms
+        meshes = dict(zip(ids.tolist(), triangulate_all(shapes, bounds, size, workers)))
+
+        v_count = np.zeros(n_ids, dtype=np.int64)
+        i_count = np.zeros(n_ids, dtype=np.int64)
+        for pid in sorted(meshes):
+            v, i = meshes[pid]
+            vertices.append(v)
+            indices.append(i)
+            v_count[pid], i_count[pid] = len(v), len(i)
+
+        v_offsets[lod] = v_total + np.concatenate([[0], np.cumsum(v_count)])
+        i_offsets[lod] = i_total + np.concatenate([[0], np.cumsum(i_count)])
+        v_total, i_total = int(v_offsets[lod, -1]), int(i_offsets[lod, -1])
+        print(f"[EXPORT] Mesh LOD {lod} ({px:g}px): {v_count.sum()} vertices, {i_count.sum() // 3} triangles")
+
+    parts = [
+        HEADER.pack(MESH_MAGIC, MESH_VERSION, n_ids, len(lods), size, size, *bounds),
+        np.asarray(lods, dtype="<f4").tobytes(),
+        v_offsets.astype("<u4").tobytes(),
+        i_offsets.astype("<u4").tobytes(),
+        np.concatenate(vertices or [np.empty((0, 2))]).astype("<f4").tobytes(),
+        np.concatenate(indices or [np.empty(0)]).astype("<u4").tobytes(),
+    ]
+
+    data = bytearray()
+    for p in parts:
+        data += p
+        data += b"\0" * _pad(len(p))
+
+    writer.write_bytes(MESH_FILE, bytes(data))
+    print(f"[EXPORT] {MESH_FILE} written ({len(ids)} provinces, {len(lods)} LODs, {len(data) / 1024:.0f} KiB).")
+
+
+def load_province_mesh(path):
+    with open(path, "rb") as f:
+        buf = f.read()
+
+    magic, version, n_ids, n_lods, w, h, *bounds = HEADER.unpack_from(buf, 0)
+    if magic != MESH_MAGIC:
+        raise ValueError(f"{path} is not a province mesh file")
+    if version != MESH_VERSION:
+        raise ValueError(f"{path}: unsupported mesh version {version}")
+
+    pos = HEADER.size + _pad(HEADER.size)
+
+    def block(dtype, count):
+        nonlocal pos
+        arr = np.frombuffer(buf, dtype=dtype, count=count, offset=pos)
+        pos += arr.nbytes + _pad(arr.nbytes)
+        return arr
+
+    lods = block("<f4", n_lods)
+    v_offsets = block("<u4", n_lods * (n_ids + 1)).reshape(n_lods, n_ids + 1)
+    i_offsets = block("<u4", n_lods * (n_ids + 1)).reshape(n_lods, n_ids + 1)
+    vertices = block("<f4", int(v_offsets[-1, -1]) * 2 if n_lods else 0).reshape(-1, 2)
+    indices = block("<u4", int(i_offsets[-1, -1]) if n_lods else 0)
+
+    return {
+        "version": version,
+        "shape": (h, w),
+        "bounds": tuple(bounds),
+        "lods": lods,
+        "vertex_offsets": v_offsets,
+        "index_offsets": i_offsets,
+        "vertices": vertices,
+        "indices": indices,
+    }
+
+
+def province_mesh(mesh, pid, lod=0):
+    """(vertices, indices) of one province at one LOD; indices are relative to its vertices."""
+    v, i = mesh["vertex_offsets"][lod], mesh["index_offsets"][lod]
+    if pid < 0 or pid >= len(v) - 1:
+        return mesh["vertices"][:0], mesh["indices"][:0]
+    return mesh["vertices"][v[pid]:v[pid + 1]], mesh["indices"][i[pid]:i[pid + 1]]
@@ -0,0 +1,154 @@
+"""
+Run-length province index (ProvinceRuns.bin).
+
+Every province is stored as its horizontal pixel runs, so its pixels, mask or
+outline can be produced in time proportional to its size instead of scanning
+the whole ProvinceMask.
+
+ProvinceRuns.bin layout (little endian, every block padded to 8 bytes):
+
+    header   magic "OGSRUNS\\0", u32 version, u32 n_ids, u32 n_runs,
+             u32 width, u32 height, u32 coord_bytes (2 or 4)
+    offsets  u32[n_ids + 1], indexed directly by province id
+    runs     coord[n_runs * 3] = (row, x_start, x_end), x_end exclusive
+
+Runs of province p are runs[offsets[p]:offsets[p + 1]], sorted by row and x.
+Ids are the same as in Provinces.txt (land and sea).
+"""
+
+import struct
+
+import numpy as np
+
+RUNS_FILE = "ProvinceRuns.bin"
+RUNS_MAGIC = b"OGSRUNS\0"
+RUNS_VERSION = 1
+
+HEADER = struct.Struct("<8sIIIIII")
+
+
+# --------------------------------------------------------
+# BUILD (piggybacks on the id pass of build_province_table)
+# --------------------------------------------------------
+def chunk_runs(top, block):
+    """(ids, rows, x_start, x_end) of every run with id >= 0 in a block of rows starting at `top`."""
+    w = block.shape[1]
+    flat = block.ravel()
+
+    starts = np.ones(flat.size, dtype=bool)
+    starts[1:] = flat[1:] != flat[:-1]
+    starts[::w] = True
+    idx = np.flatnonzero(starts)
+    ends = np.append(idx[1:], flat.size)
+
+    ids = flat[idx]
+    keep = ids >= 0
+    idx, ends, ids = idx[keep], ends[keep], ids[keep]
+
+    rows = idx // w
+    runs = (ids, rows + top, idx - rows * w, ends - rows * w)
+    return tuple(a.astype(np.int32) for a in runs)
+
+
+class RunCollector:
+    """Collects runs from (top, block) id chunks while they are passed on to another consumer."""
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.parts = []
+
+    def tap(self, chunks):
+        for top, block in chunks:
+            self.parts.append(chunk_runs(top, block))
+            yield top, block
+
+    def finish(self, n_ids):
+        """Runs grouped by id: (offsets[n_ids + 1], runs[n_runs, 3])."""
+        if self.parts:
+            ids, rows, x0, x1 = (np.concatenate(c) for c in zip(*self.parts))
+        else:
+            ids = rows = x0 = x1 = np.empty(0, dtype=np.int64)
+        self.parts = []
+
+        # stable: inside one province the runs stay in row-major order
+        order = np.argsort(ids, kind="stable")
+        runs = np.stack([rows[order], x0[order], x1[order]], axis=1)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(ids, minlength=n_ids))])
+        return offsets.astype(np.uint32), runs
+
+
+# --------------------------------------------------------
+# EXPORT / LOAD
+# --------------------------------------------------------
+def _pad(n):
+    return (-n) % 8
+
+
+def export_province_runs(offsets, runs, shape, writer):
+    h, w = shape
+    coord = "<u2" if max(w, h) <= np.iinfo(np.uint16).max else "<u4"
+    coord_bytes = np.dtype(coord).itemsize
+
+    parts = [
+        HEADER.pack(RUNS_MAGIC, RUNS_VERSION, len(offsets) - 1, len(runs), w, h, coord_bytes),
+        np.asarray(offsets, dtype="<u4").tobytes(),
+        np.ascontiguousarray(runs, dtype=coord).tobytes(),
+    ]
+
+    data = bytearray()
+    for p in parts:
+        data += p
+        data += b"\0" * _pad(len(p))
+
+    writer.write_bytes(RUNS_FILE, bytes(data))
+    print(f"[EXPORT] {RUNS_FILE} written ({len(runs)} runs, {len(data) / 1024:.0f} KiB).")
+
+
+def load_province_runs(path):
+    with open(path, "rb") as f:
+        buf = f.read()
+
+    magic, version, n_ids, n_runs, w, h, coord_bytes = HEADER.unpack_from(buf, 0)
+    if magic != RUNS_MAGIC:
+        raise ValueError(f"{path} is not a province run index")
+    if version != RUNS_VERSION:
+        raise ValueError(f"{path}: unsupported run index version {version}")
+
+    pos = HEADER.size + _pad(HEADER.size)
+    offsets = np.frombuffer(buf, dtype="<u4", count=n_ids + 1, offset=pos)
+    pos += offsets.nbytes + _pad(offsets.nbytes)
+    coord = "<u2" if coord_bytes == 2 else "<u4"
+    runs = np.frombuffer(buf, dtype=coord, count=n_runs * 3, offset=pos).reshape(n_runs, 3)
+
+    return {"version": version, "shape": (h, w), "offsets": offsets, "runs": runs}
+
+
+# --------------------------------------------------------
+# QUERIES (cost ~ size of the province)
+# --------------------------------------------------------
+def province_runs(index, pid):
+    offsets = index["offsets"]
+    if pid < 0 or pid >= len(offsets) - 1:
+        return index["runs"][:0]
+    return index["runs"][offsets[pid]:offsets[pid + 1]]
+
+
+def province_pixel_count(index, pid):
+    runs = province_runs(index, pid).astype(np.int64)
+    return int((runs[:, 2] - runs[:, 1]).sum())
+
+
+def province_mask(index, pid):
+    """(mask, (x0, y0)): boolean mask over the province bbox and its top-left corner."""
+    runs = province_runs(index, pid).astype(np.int64)
+    if len(runs) == 0:
+        return np.zeros((0, 0), dtype=bool), (0, 0)
+
+    y0, x0 = runs[:, 0].min(), runs[:, 1].min()
+    mask = np.zeros((runs[:, 0].max() - y0 + 1, runs[:, 2].max() - x0), dtype=bool)
+    lengths = runs[:, 2] - runs[:, 1]
+    first = np.cumsum(lengths) - lengths
+    rows = np.repeat(runs[:, 0] - y0, lengths)
+    cols = np.arange(lengths.sum()) - np.repeat(first, lengths) + np.repeat(runs[:, 1] - x0, lengths)
+    mask[rows, cols] = True
+    return mask, (int(x0), int(y0))
@@ -0,0 +1,299 @@
+"""
+Changed-province diff between two exports.
+
+The id raster, the palettes of the palette-rendered maps and the population /
+metric tables of the last export are kept in <out>/.build/diff/. The next
+export compares them tile by tile. Political and theme maps re-render only
+the dirty windows and patch them into the previous PNGs. A patched image is
+pixel-identical to a full render: outside the windows neither the id nor
+its colour changed, and the sea outline is drawn again over the whole image.
+
+state.json is removed as soon as a BuildDiff has read it and written again
+last by save(), after the maps are on disk. An export that dies half way
+therefore leaves no baseline, and the next one renders everything.
+
+The sea outline geometry and the bounds are stored as well, so theme maps can
+be rendered again from the stored id raster without a build (see
+load_render_state and rerender_theme_modes in export_theme_map.py).
+"""
+
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from export_shared import render_palettes, row_chunks
+from geometry_cache import read_wkb, write_wkb
+from output_writer import atomic_write
+
+DIFF_DIR = os.path.join(".build", "diff")
+TILE = 128                 # dirty-window granularity in pixels
+FULL_RENDER_SHARE = 0.5    # above this share of dirty tiles a full render is cheaper
+
+
+# --------------------------------------------------------
+# VECTORIZED COMPARISONS
+# --------------------------------------------------------
+def _tile_any(mask, tile=TILE):
+    """(h, w) bool -> (ceil(h/tile), ceil(w/tile)) bool, True where any pixel is set."""
+    h, w = mask.shape
+    th, tw = -(-h // tile), -(-w // tile)
+    padded = np.zeros((th * tile, tw * tile), dtype=bool)
+    padded[:h, :w] = mask
+    return padded.reshape(th, tile, tw, tile).any(axis=(1, 3))
+
+
+def diff_ids(old, new, tile=TILE):
+    """Changed pids (from both rasters, sea excluded) and the tiles where any id changed."""
+    h, w = new.shape
+    tiles = np.zeros((-(-h // tile), -(-w // tile)), dtype=bool)
+    changed = []
+    # row chunks aligned to the tile size
+    for top, bottom in row_chunks(h, max(tile, (256 // tile) * tile)):
+        a, b = old[top:bottom], new[top:bottom]
+        mask = a != b
+        if not mask.any():
+            continue
+        changed += [np.unique(a[mask]), np.unique(b[mask])]
+        tiles[top // tile: -(-bottom // tile)] |= _tile_any(mask, tile)
+
+    pids = np.unique(np.concatenate(changed)) if changed else np.empty(0, dtype=np.int64)
+    return pids[pids >= 0].astype(np.int64), tiles
+
+
+def diff_palette(old, new):
+    """Ids whose colour differs between two pid -> RGB palettes (ids present in only one count as changed)."""
+    n = min(len(old), len(new))
+    ids = np.flatnonzero((old[:n] != new[:n]).any(axis=1))
+    return np.concatenate([ids, np.arange(n, max(len(old), len(new)))]).astype(np.int64)
+
+
+def diff_table(old, new):
+    """Keys whose value changed between two pid-keyed Series (NaN == NaN, missing keys count as changed)."""
+    old, new = old.align(new)
+    same = (old == new) | (old.isna() & new.isna())
+    return np.asarray(new.index[~same.to_numpy()])
+
+
+def grow_tiles(tiles):
+    """Tiles plus their 8 neighbours."""
+    grown = tiles.copy()
+    grown[1:] |= tiles[:-1]
+    grown[:-1] |= tiles[1:]
+    out = grown.copy()
+    out[:, 1:] |= grown[:, :-1]
+    out[:, :-1] |= grown[:, 1:]
+    return out
+
+
+def tiles_of_ids(id_map, ids, tile=TILE):
+    """Tiles containing any pixel with an id in `ids`."""
+    h, w = id_map.shape
+    tiles = np.zeros((-(-h // tile), -(-w // tile)), dtype=bool)
+    if len(ids) == 0:
+        return tiles
+    for top, bottom in row_chunks(h, max(tile, (256 // tile) * tile)):
+        mask = np.isin(id_map[top:bottom], ids)
+        if mask.any():
+            tiles[top // tile: -(-bottom // tile)] |= _tile_any(mask, tile)
+    return tiles
+
+
+def tile_windows(tiles, shape, tile=TILE):
+    """Dirty tiles -> (x0, y0, x1, y1) pixel windows: horizontal runs per tile row, merged down identical runs."""
+    h, w = shape
+    open_runs = {}
+    windows = []
+    for ty in range(tiles.shape[0]):
+        row = np.concatenate([[False], tiles[ty], [False]])
+        edges = np.flatnonzero(row[1:] != row[:-1])
+        runs = set(zip(edges[::2], edges[1::2]))
+
+        for run in list(open_runs):
+            if run not in runs:
+                windows.append((run, open_runs.pop(run), ty))
+        for run in runs:
+            open_runs.setdefault(run, ty)
+    windows += [(run, start, tiles.shape[0]) for run, start in open_runs.items()]
+
+    return sorted(
+        (int(a) * tile, y0 * tile, min(int(b) * tile, w), min(y1 * tile, h))
+        for (a, b), y0, y1 in windows
+    )
+
+
+# --------------------------------------------------------
+# STATE OF THE PREVIOUS EXPORT
+# --------------------------------------------------------
+def _npy_bytes(arr):
+    buf = io.BytesIO()
+    np.save(buf, arr, allow_pickle=False)
+    return buf.getvalue()
+
+
+class BuildDiff:
+    """
+    Compares this export against the state stored by the previous one.
+
+    overlay_key must change whenever anything drawn on top of the palette
+    rendering changes (sea outline geometry, bounds, size, fixed colours);
+    a different key or raster shape disables patching for the whole export.
+    halo > 0 (border overlay line width) also marks the tiles next to changed
+    ids dirty, since border pixels there depend on the neighbouring ids.
+    """
+
+    def __init__(self, writer, id_map, overlay_key, tile=TILE, halo=0):
+        self.writer = writer
+        self.id_map = id_map
+        self.tile = tile
+        self.dir = os.path.join(writer.out_dir, DIFF_DIR)
+        self.palettes = {}
+        self.tables = {}
+
+        self.state = self._load_state(overlay_key)
+        # the maps written from here on no longer match the stored state
+        try:
+            os.remove(os.path.join(self.dir, "state.json"))
+        except FileNotFoundError:
+            pass
+        self.overlay_key = overlay_key
+        self.changed_pids = None
+        self.id_tiles = None
+
+        if self.state is not None:
+            self.changed_pids, self.id_tiles = diff_ids(self.state["id_map"], id_map, tile)
+            if halo:
+                self.id_tiles = grow_tiles(self.id_tiles)
+            print(
+                f"[DIFF] {len(self.changed_pids)} provinces changed, "
+                f"{int(self.id_tiles.sum())}/{self.id_tiles.size} tiles dirty"
+            )
+        else:
+            print("[DIFF] No usable previous export, rendering everything")
+
+    def _load_state(self, overlay_key):
+        try:
+            with open(os.path.join(self.dir, "state.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("overlay") != overlay_key or meta.get("tile") != self.tile:
+                return None
+            old = np.load(os.path.join(self.dir, "id_map.npy"), allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        if old.shape != self.id_map.shape:
+            return None
+        return {
+            "id_map": old,
+            "images": set(meta.get("images", [])),
+            "tables": set(meta.get("tables", [])),
+            "bounds": meta.get("bounds"),
+        }
+
+    def _key(self, name):
+        return name.replace("\\", "/").replace("/", "__")
+
+    # --------------------------------------------------------
+    # TABLES
+    # --------------------------------------------------------
+    def compare_table(self, name, values):
+        """Changed keys of a pid-keyed table since the last export (None if there is nothing to compare)."""
+        new = pd.Series(values, dtype="float64") if not isinstance(values, pd.Series) else values.astype("float64")
+        self.tables[name] = new
+
+        if self.state is None or name not in self.state["tables"]:
+            return None
+        try:
+            with np.load(os.path.join(self.dir, f"table_{self._key(name)}.npz"), allow_pickle=False) as z:
+                old = pd.Series(z["values"], index=z["keys"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+        changed = diff_table(old, new)
+        print(f"[DIFF] {name}: {len(changed)} values changed")
+        return changed
+
+    # --------------------------------------------------------
+    # IMAGES
+    # --------------------------------------------------------
+    def windows(self, name, palette, changed_ids=None):
+        """
+        Dirty windows of image `name` rendered with `palette`, [] when nothing changed,
+        or None when it has to be rendered in full. changed_ids (e.g. from compare_table)
+        are marked dirty on top of the id and palette changes.
+        """
+        palette = np.asarray(palette, dtype=np.uint8)
+        self.palettes[name] = palette
+
+        if self.state is None or name not in self.state["images"] or not self.writer.is_current(name):
+            return None
+        try:
+            old = np.load(os.path.join(self.dir, f"palette_{self._key(name)}.npy"), allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+
+        ids = diff_palette(old, palette)
+        if changed_ids is not None and len(changed_ids):
+            ids = np.union1d(ids, np.asarray(changed_ids, dtype=np.int64))
+        tiles = self.id_tiles | tiles_of_ids(self.id_map, ids, self.tile)
+        if tiles.mean() > FULL_RENDER_SHARE:
+            return None
+        return tile_windows(tiles, self.id_map.shape, self.tile)
+
+    def patch(self, name, palette, windows, **render_options):
+        """Previous image with the windows re-rendered from id_map (same options as the full render_palettes)."""
+        with Image.open(self.writer.path(name)) as img:
+            rgb = np.array(img.convert("RGB"))
+        for x0, y0, x1, y1 in windows:
+            rgb[y0:y1, x0:x1] = render_palettes(self.id_map[y0:y1, x0:x1], [palette], **render_options)[0]
+        return rgb
+
+    # --------------------------------------------------------
+    # STORE FOR THE NEXT EXPORT
+    # --------------------------------------------------------
+    def save(self, sea_regions=None, bounds=None, partial=False):
+        """
+        Store the state for the next export. sea_regions + bounds make it re-renderable
+        (load_render_state); partial=True keeps the entries of images / tables not seen here.
+        """
+        images, tables = set(self.palettes), set(self.tables)
+        if partial and self.state is not None:
+            images |= self.state["images"]
+            tables |= self.state["tables"]
+            bounds = bounds if bounds is not None else self.state["bounds"]
+
+        atomic_write(os.path.join(self.dir, "id_map.npy"), _npy_bytes(self.id_map))
+        if sea_regions is not None:
+            write_wkb(os.path.join(self.dir, "sea_regions.wkb"), sea_regions)
+        for name, palette in self.palettes.items():
+            atomic_write(os.path.join(self.dir, f"palette_{self._key(name)}.npy"), _npy_bytes(palette))
+        for name, table in self.tables.items():
+            buf = io.BytesIO()
+            np.savez(buf, keys=np.asarray(table.index), values=table.to_numpy(dtype=np.float64))
+            atomic_write(os.path.join(self.dir, f"table_{self._key(name)}.npz"), buf.getvalue())
+
+        meta = {
+            "overlay": self.overlay_key,
+            "tile": self.tile,
+            "images": sorted(images),
+            "tables": sorted(tables),
+            "bounds": [float(v) for v in bounds] if bounds is not None else None,
+        }
+        atomic_write(os.path.join(self.dir, "state.json"), json.dumps(meta, indent=1).encode("utf-8"))
+
+
+def load_render_state(out_dir):
+    """(id_map, sea_regions, bounds, overlay_key) stored by the last export in out_dir, or None."""
+    folder = os.path.join(out_dir, DIFF_DIR)
+    try:
+        with open(os.path.join(folder, "state.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("bounds") is None:
+            return None
+        id_map = np.load(os.path.join(folder, "id_map.npy"), allow_pickle=False)
+        sea_regions = read_wkb(os.path.join(folder, "sea_regions.wkb"))
+    except (OSError, ValueError):
+        return None
+    return id_map, sea_regions, tuple(meta["bounds"]), meta["overlay"]
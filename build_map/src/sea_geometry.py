@@ -0,0 +1,159 @@
+"""
+Land union + sea polygon construction for PART 2/3.
+
+The admin polygons are (nearly) a coverage, so the land union is built with a
+coverage union instead of a full overlay, falling back to union_all per
+country where regions overlap (filled holes around enclaves). Union and sea
+are kept in the geometry cache; the sea is handed on as a TiledSea, a grid
+of prepared sea pieces, so point and intersection queries only touch the
+local pieces instead of the whole coastline.
+"""
+
+import math
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+import geometry_cache
+from geometry_clean import clip, polygonal_parts
+
+SEA_TILE_SIZE = 250_000   # metres
+
+
+# --------------------------------------------------------
+# COVERAGE UNION
+# --------------------------------------------------------
+def _coverage_union(geoms):
+    """(union, True) if geoms are a valid coverage, else (union_all, False)."""
+    geoms = geoms[~shapely.is_empty(geoms)]
+    if len(geoms) == 0:
+        return Polygon(), True
+
+    try:
+        out = shapely.coverage_union_all(geoms)
+    except shapely.errors.GEOSException:
+        out = None
+
+    # overlapping input does not fail loudly, it shows up as missing area
+    if out is not None and out.is_valid and math.isclose(out.area, shapely.area(geoms).sum(), rel_tol=1e-9):
+        return out, True
+    return shapely.union_all(geoms), False
+
+
+def land_union(geoms, countries):
+    geoms = np.asarray(geoms, dtype=object)
+    union, ok = _coverage_union(geoms)
+    if ok:
+        print("[DEBUG] Land union: coverage union")
+        return union
+
+    countries = np.asarray(countries)
+    names = np.unique(countries)
+    unions, fallback = [], []
+    for c in names:
+        u, ok = _coverage_union(geoms[countries == c])
+        unions.append(u)
+        if not ok:
+            fallback.append(str(c))
+
+    union, _ = _coverage_union(np.array(unions, dtype=object))
+    print(f"[DEBUG] Land union: coverage union per country, overlay for {', '.join(fallback) or 'the country borders'}")
+    return union
+
+
+# --------------------------------------------------------
+# TILED SEA
+# --------------------------------------------------------
+class TiledSea:
+    """
+    Sea polygon split into a grid of clipped, prepared pieces.
+
+    geometry     the whole sea polygon
+    pieces       one piece per grid cell (row-major, empty where there is no sea)
+    contains_xy  point-in-sea test that only looks at the piece under each point
+    intersection sea ∩ geoms, computed from the pieces each geometry touches
+    """
+
+    def __init__(self, sea, tile_size=SEA_TILE_SIZE, pieces=None):
+        self.geometry = sea
+        self.tile_size = tile_size
+
+        minx, miny, maxx, maxy = sea.bounds
+        self.origin = (minx, miny)
+        self.nx = max(1, math.ceil((maxx - minx) / tile_size))
+        self.ny = max(1, math.ceil((maxy - miny) / tile_size))
+
+        if pieces is None:
+            gy, gx = np.mgrid[0:self.ny, 0:self.nx]
+            x0 = minx + gx.ravel() * tile_size
+            y0 = miny + gy.ravel() * tile_size
+            cells = shapely.box(x0, y0, x0 + tile_size, y0 + tile_size)
+            pieces = clip(cells, sea)
+
+        self.pieces = np.asarray(pieces, dtype=object)
+        shapely.prepare(self.pieces)
+        self.tree = shapely.STRtree(self.pieces)
+
+    @property
+    def bounds(self):
+        return self.geometry.bounds
+
+    def contains_xy(self, xs, ys):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        minx, miny = self.origin
+
+        ix = np.floor((xs - minx) / self.tile_size).astype(np.int64)
+        iy = np.floor((ys - miny) / self.tile_size).astype(np.int64)
+        valid = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+
+        out = np.zeros(xs.shape, dtype=bool)
+        if valid.any():
+            pieces = self.pieces[iy[valid] * self.nx + ix[valid]]
+            out[valid] = shapely.contains_xy(pieces, xs[valid], ys[valid])
+        return out
+
+    def intersection(self, geoms):
+        """Polygonal sea ∩ geoms for every geometry (empty Polygon where they do not meet)."""
+        geoms = np.asarray(geoms, dtype=object)
+        out = np.array([Polygon()] * len(geoms), dtype=object)
+
+        gi, pi = self.tree.query(geoms, predicate="intersects")
+        if len(gi) == 0:
+            return out
+
+        parts = polygonal_parts(shapely.intersection(geoms[gi], self.pieces[pi]))
+        keep = ~shapely.is_empty(parts)
+        gi, parts = gi[keep], parts[keep]
+
+        order = np.argsort(gi, kind="stable")
+        gi, parts = gi[order], parts[order]
+        owners, starts = np.unique(gi, return_index=True)
+        for owner, group in zip(owners, np.split(parts, starts[1:])):
+            out[owner] = group[0] if len(group) == 1 else shapely.union_all(group)
+        return out
+
+
+# --------------------------------------------------------
+# CACHED STAGES
+# --------------------------------------------------------
+def cached_land_union(land):
+    geoms = land.geometry.to_numpy()
+    key = geometry_cache.geometry_key(geoms, "land_union")
+    (union,) = geometry_cache.cached(
+        "land_union", key, lambda: [land_union(geoms, land["country"].to_numpy())]
+    )
+    return union
+
+
+def cached_sea(union, outer, tile_size=SEA_TILE_SIZE):
+    """outer minus the land union, tiled; sea polygon and pieces come from the cache when possible."""
+    key = geometry_cache.geometry_key([union, outer], tile_size)
+
+    def build():
+        sea = outer.difference(union)
+        return [sea, *TiledSea(sea, tile_size).pieces]
+
+    sea, *pieces = geometry_cache.cached("sea", key, build)
+    return TiledSea(sea, tile_size, pieces=pieces)
@@ -0,0 +1,240 @@
+import numpy as np
+import shapely
+from shapely.geometry import MultiPoint
+from shapely.ops import voronoi_diagram
+
+from sea_geometry import TiledSea
+
+SEA_METHODS = ("kmeans", "minibatch", "raster")
+
+
+# --------------------------------------------------------
+# HELPERS
+# --------------------------------------------------------
+def polygonal(geom):
+    """Drop points/lines that intersections can leave behind."""
+    if geom is None or geom.is_empty:
+        return None
+    if geom.geom_type in ("Polygon", "MultiPolygon"):
+        return geom
+    polys = [g for g in shapely.get_parts(geom) if g.geom_type in ("Polygon", "MultiPolygon")]
+    if not polys:
+        return None
+    return shapely.union_all(polys)
+
+
+def smooth(regions, radius):
+    out = []
+    for region in regions:
+        try:
+            region = region.buffer(radius).buffer(-radius)
+        except Exception:
+            pass
+        region = polygonal(region)
+        if region is not None:
+            out.append(region)
+    return out
+
+
+def sample_sea_points(sea, bounds, n, rng=np.random):
+    """Uniform points in `bounds`, kept only where they fall into the (tiled) sea."""
+    minx, miny, maxx, maxy = bounds
+    xs = rng.uniform(minx, maxx, n)
+    ys = rng.uniform(miny, maxy, n)
+    inside = sea.contains_xy(xs, ys)
+    return np.column_stack([xs[inside], ys[inside]])
+
+
+def voronoi_regions(centers, sea, outer):
+    vor = voronoi_diagram(MultiPoint([tuple(c) for c in centers]), envelope=outer)
+    cells = np.array(list(vor.geoms), dtype=object)
+
+    clipped = sea.intersection(cells)
+    return [g for g in (polygonal(c) for c in clipped) if g is not None]
+
+
+# --------------------------------------------------------
+# METHOD: KMEANS (original) / MINIBATCH
+# --------------------------------------------------------
+def partition_kmeans(sea, bounds, outer, n_regions, sample_points, seed=None):
+    from sklearn.cluster import KMeans
+
+    points = sample_sea_points(sea, bounds, sample_points)
+    print(f"[DEBUG] Sea points: {len(points)}")
+
+    kmeans = KMeans(n_clusters=n_regions, n_init="auto", random_state=seed)
+    centers = kmeans.fit(points).cluster_centers_
+    return voronoi_regions(centers, sea, outer)
+
+
+def partition_minibatch(sea, bounds, outer, n_regions, sample_points, seed=None, warm_start=None):
+    """
+    warm_start: dict owned by the caller, n_regions -> cluster centres of its
+    previous run; they seed this run and are replaced by its centres. Without it
+    the result only depends on the inputs and the seed.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    # keep enough samples per cluster when N_REGIONS goes into the thousands
+    points = sample_sea_points(sea, bounds, max(sample_points, 30 * n_regions))
+    print(f"[DEBUG] Sea points: {len(points)}")
+
+    warm = warm_start.get(n_regions) if warm_start is not None else None
+    if warm is not None:
+        kmeans = MiniBatchKMeans(n_clusters=n_regions, init=warm, n_init=1, batch_size=4096, random_state=seed)
+    else:
+        kmeans = MiniBatchKMeans(n_clusters=n_regions, n_init="auto", batch_size=4096, random_state=seed)
+
+    centers = kmeans.fit(points).cluster_centers_
+    if warm_start is not None:
+        warm_start[n_regions] = centers
+    return voronoi_regions(centers, sea, outer)
+
+
+# --------------------------------------------------------
+# METHOD: RASTER (distance field + region growing)
+# --------------------------------------------------------
+def rasterize_sea(sea, outer, cell):
+    """Sea mask by cell-centre containment, row r covers [miny + r*cell, miny + (r+1)*cell]."""
+    minx, miny, maxx, maxy = outer.bounds
+    w = int(np.ceil((maxx - minx) / cell))
+    h = int(np.ceil((maxy - miny) / cell))
+
+    xs = minx + (np.arange(w) + 0.5) * cell
+    mask = np.zeros((h, w), dtype=bool)
+    for r in range(h):
+        mask[r] = sea.contains_xy(xs, np.full(w, miny + (r + 0.5) * cell))
+    return mask
+
+
+def labels_to_regions(labels, n_labels, origin, cell):
+    """Turn a label raster into one polygon per label via row runs + coverage union."""
+    minx, miny = origin
+    h, w = labels.shape
+
+    flat = labels.ravel()
+    starts = np.ones(flat.size, dtype=bool)
+    starts[1:] = flat[1:] != flat[:-1]
+    starts[::w] = True
+    idx = np.flatnonzero(starts)
+    ends = np.append(idx[1:], flat.size)
+
+    lab = flat[idx]
+    keep = lab > 0
+    idx, ends, lab = idx[keep], ends[keep], lab[keep]
+
+    rows = idx // w
+    x0 = idx - rows * w
+    x1 = ends - rows * w
+
+    boxes = shapely.box(minx + x0 * cell, miny + rows * cell, minx + x1 * cell, miny + (rows + 1) * cell)
+
+    order = np.argsort(lab, kind="stable")
+    lab, boxes = lab[order], boxes[order]
+    bounds = np.searchsorted(lab, np.arange(1, n_labels + 2))
+
+    regions = []
+    for i in range(n_labels):
+        a, b = bounds[i], bounds[i + 1]
+        if a == b:
+            continue
+        regions.append(shapely.coverage_union_all(boxes[a:b]))
+    return regions
+
+
+def partition_raster(sea, bounds, outer, n_regions, sample_points, cell=5000, strait_width=40000, seed=None):
+    from scipy import ndimage
+    from sklearn.cluster import MiniBatchKMeans
+
+    minx, miny, _, _ = outer.bounds
+    mask = rasterize_sea(sea, outer, cell)
+    print(f"[DEBUG] Sea raster: {mask.shape[1]}x{mask.shape[0]} @ {cell} m")
+
+    # distance to the nearest coast, in metres
+    dist = ndimage.distance_transform_edt(mask) * cell
+
+    # seeds: cluster sea pixels, then snap every centre onto the nearest sea pixel
+    rows, cols = np.nonzero(mask)
+    rng = np.random.RandomState(seed)
+    take = rng.choice(len(rows), size=min(len(rows), max(sample_points, 30 * n_regions)), replace=False)
+    pts = np.column_stack([cols[take], rows[take]]).astype(np.float64)
+    kmeans = MiniBatchKMeans(n_clusters=n_regions, n_init="auto", batch_size=4096, random_state=seed)
+    centers = kmeans.fit(pts).cluster_centers_
+
+    _, (near_r, near_c) = ndimage.distance_transform_edt(~mask, return_indices=True)
+    cr = np.clip(np.rint(centers[:, 1]).astype(int), 0, mask.shape[0] - 1)
+    cc = np.clip(np.rint(centers[:, 0]).astype(int), 0, mask.shape[1] - 1)
+    cr, cc = near_r[cr, cc], near_c[cr, cc]
+
+    markers = np.zeros(mask.shape, dtype=np.int32)
+    markers[~mask] = -1                     # land is its own basin -> regions never cross it
+    markers[cr, cc] = np.arange(1, n_regions + 1)
+
+    # sea the land basin would flood (lakes, enclosed seas without a seed)
+    # becomes a region of its own, seeded at its point farthest from the coast
+    comps, n_comps = ndimage.label(mask)
+    unseeded = np.setdiff1d(np.arange(1, n_comps + 1), comps[cr, cc])
+    if len(unseeded):
+        pos = np.array(ndimage.maximum_position(dist, comps, unseeded)).reshape(-1, 2)
+        markers[pos[:, 0], pos[:, 1]] = np.arange(n_regions + 1, n_regions + len(unseeded) + 1)
+        print(f"[DEBUG] Sea raster: {len(unseeded)} unseeded sea basins kept as extra regions")
+    n_labels = n_regions + len(unseeded)
+
+    # open water is free, narrow straits cost more -> borders settle in straits
+    cost = np.clip(strait_width - dist, 0, None)
+    cost = np.rint(cost / max(strait_width, 1) * 255).astype(np.uint8)
+
+    labels = ndimage.watershed_ift(cost, markers)
+
+    # every other cell (land, and coast the land basin flooded) takes the
+    # nearest region label, so the clip below keeps all sea near the coast
+    _, (fill_r, fill_c) = ndimage.distance_transform_edt(labels <= 0, return_indices=True)
+    labels = labels[fill_r, fill_c]
+
+    regions = labels_to_regions(labels, n_labels, (minx, miny), cell)
+
+    # exact coastline from the vector sea
+    clipped = sea.intersection(np.array(regions, dtype=object))
+    regions = [g for g in (polygonal(c) for c in clipped) if g is not None]
+
+    lost = sea.geometry.area - sum(g.area for g in regions)
+    if lost > 1e-6 * sea.geometry.area:
+        print(f"[WARN] Sea raster: regions miss {lost:.3e} m² of sea")
+    return regions
+
+
+# --------------------------------------------------------
+# ENTRY POINT
+# --------------------------------------------------------
+def partition_sea(
+    sea,
+    bounds,
+    outer,
+    method="kmeans",
+    n_regions=60,
+    sample_points=15000,
+    smooth_radius=15000,
+    raster_cell=5000,
+    seed=None,
+    warm_start=None,
+):
+    """
+    sea:    TiledSea (or a plain sea polygon, tiled here) — outer box minus land
+    bounds: land bounds, sampling area for the clustering methods
+    outer:  box around the map, Voronoi envelope / raster extent
+    warm_start: "minibatch" only, see partition_minibatch
+    Returns a list of Polygon/MultiPolygon sea regions.
+    """
+    if not isinstance(sea, TiledSea):
+        sea = TiledSea(sea)
+
+    if method == "kmeans":
+        regions = partition_kmeans(sea, bounds, outer, n_regions, sample_points, seed=seed)
+    elif method == "minibatch":
+        regions = partition_minibatch(sea, bounds, outer, n_regions, sample_points, seed=seed, warm_start=warm_start)
+    elif method == "raster":
+        regions = partition_raster(sea, bounds, outer, n_regions, sample_points, cell=raster_cell, seed=seed)
+    else:
+        raise ValueError(f"Unknown sea_method '{method}' (expected one of {', '.join(SEA_METHODS)})")
+
+    return smooth(regions, smooth_radius)
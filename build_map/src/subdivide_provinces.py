@@ -0,0 +1,161 @@
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+from shapely.geometry import MultiPoint
+from shapely.ops import voronoi_diagram
+
+from country_pool import map_countries
+from sea_partition import polygonal
+
+SAMPLES_PER_PART = 400     # sample points per requested sub-province
+LLOYD_ITERATIONS = 6
+MAX_SAMPLE_ROUNDS = 6
+
+
+# --------------------------------------------------------
+# BATCHED SAMPLING (one contains_xy call for all provinces)
+# --------------------------------------------------------
+def sample_inside(geoms, counts, rng):
+    """
+    Uniform points inside every geometry of `geoms` (counts[i] points for geoms[i]).
+    Candidates for all geometries are tested in one batched point-in-polygon call per round.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    shapely.prepare(geoms)
+
+    bounds = shapely.bounds(geoms)
+    fill = shapely.area(geoms) / np.maximum(
+        (bounds[:, 2] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 1]), 1.0
+    )
+
+    found = [[] for _ in geoms]
+    missing = np.asarray(counts, dtype=np.int64).copy()
+
+    for _ in range(MAX_SAMPLE_ROUNDS):
+        todo = np.flatnonzero(missing > 0)
+        if len(todo) == 0:
+            break
+
+        n_cand = np.ceil(missing[todo] / np.maximum(fill[todo], 0.05) * 1.3).astype(np.int64)
+        owner = np.repeat(todo, n_cand)
+        b = bounds[owner]
+        xs = b[:, 0] + rng.random(len(owner)) * (b[:, 2] - b[:, 0])
+        ys = b[:, 1] + rng.random(len(owner)) * (b[:, 3] - b[:, 1])
+
+        inside = shapely.contains_xy(geoms[owner], xs, ys)
+        owner, xs, ys = owner[inside], xs[inside], ys[inside]
+
+        order = np.argsort(owner, kind="stable")
+        owner, xs, ys = owner[order], xs[order], ys[order]
+        cuts = np.searchsorted(owner, todo, side="left")
+        ends = np.searchsorted(owner, todo, side="right")
+
+        for i, a, e in zip(todo, cuts, ends):
+            take = min(e - a, missing[i])
+            if take:
+                found[i].append(np.column_stack([xs[a:a + take], ys[a:a + take]]))
+                missing[i] -= take
+
+    return [np.concatenate(f) if f else np.empty((0, 2)) for f in found]
+
+
+# --------------------------------------------------------
+# LLOYD RELAXATION (k-means on the samples)
+# --------------------------------------------------------
+def lloyd(points, k, rng, iterations=LLOYD_ITERATIONS):
+    seeds = points[rng.choice(len(points), size=k, replace=False)]
+
+    for _ in range(iterations):
+        # KD-tree nearest seed: O(points) memory instead of a points x k distance matrix
+        _, nearest = cKDTree(seeds).query(points)
+
+        counts = np.bincount(nearest, minlength=k)
+        sx = np.bincount(nearest, weights=points[:, 0], minlength=k)
+        sy = np.bincount(nearest, weights=points[:, 1], minlength=k)
+
+        moved = counts > 0
+        seeds[moved, 0] = sx[moved] / counts[moved]
+        seeds[moved, 1] = sy[moved] / counts[moved]
+
+    return seeds
+
+
+def split_geometry(geom, seeds):
+    vor = voronoi_diagram(MultiPoint([tuple(s) for s in seeds]), envelope=geom.envelope.buffer(1.0))
+    cells = np.array(list(vor.geoms), dtype=object)
+    parts = shapely.intersection(cells, geom)
+    parts = [polygonal(p) for p in parts]
+    return [p for p in parts if p is not None]
+
+
+# --------------------------------------------------------
+# STAGE
+# --------------------------------------------------------
+def split_country(gdf, max_area, seed=0):
+    """
+    Subdivision of one country's slice. Parts keep the index label of their
+    parent so country_pool can put them back into the original row order.
+    """
+    areas = gdf.geometry.area.to_numpy()
+    big = np.flatnonzero(areas > max_area) if max_area else np.empty(0, dtype=np.int64)
+
+    if len(big) == 0:
+        out = gdf.copy()
+        out["subdivision"] = 0
+        return out
+
+    rng = np.random.default_rng(seed if seed is not None else 0)
+    ks = np.ceil(areas[big] / max_area).astype(np.int64)
+    samples = sample_inside(gdf.geometry.to_numpy()[big], ks * SAMPLES_PER_PART, rng)
+
+    split = {}
+    for i, k, pts in zip(big, ks, samples):
+        if len(pts) < k:
+            continue
+        seeds = lloyd(pts, int(k), rng)
+        parts = split_geometry(gdf.geometry.iloc[i], seeds)
+        if len(parts) > 1:
+            split[i] = parts
+
+    rows = []
+    for i in range(len(gdf)):
+        parts = split.get(i)
+        if parts is None:
+            rows.append((i, gdf.geometry.iloc[i], 0))
+            continue
+        # biggest part first, so part numbering is stable across runs
+        parts.sort(key=lambda p: -p.area)
+        rows.extend((i, p, n + 1) for n, p in enumerate(parts))
+
+    src = [r[0] for r in rows]
+    out = gdf.iloc[src].copy()
+    out["geometry"] = [r[1] for r in rows]
+    out["subdivision"] = [r[2] for r in rows]
+    return out
+
+
+def subdivide_large(gdf, max_area, seed=0, workers=0):
+    """
+    Split every province larger than `max_area` (m²) into ceil(area / max_area)
+    roughly equal-area parts. Parts keep the attributes of their parent, take its
+    place in the row order and get a running `subdivision` number (0 = unsplit).
+    `parent` is the input row of every output row, so per-province data of the
+    parent (population) can be split across its parts.
+    Countries are independent and are processed through country_pool, each one
+    with its own generator seeded from `seed`, so the result does not depend on
+    the number of workers.
+    """
+    gdf = gdf.reset_index(drop=True)
+    n_big = int((gdf.geometry.area > max_area).sum()) if max_area else 0
+    if n_big:
+        print(f"[DEBUG] Subdividing {n_big} provinces above {max_area / 1_000_000:.0f} km²")
+
+    out = map_countries(gdf, split_country, max_area, seed, workers=workers, keep_order=True)
+    # parts carry the index label of their parent row
+    out["parent"] = out.index.to_numpy(dtype=np.int64)
+    out = out.reset_index(drop=True)
+
+    if n_big:
+        n_split = int((out["subdivision"] == 1).sum())
+        print(f"[DEBUG] Subdivision: {n_split} provinces split, {len(out) - len(gdf)} provinces added ({len(out)} total)")
+    return out
@@ -0,0 +1,162 @@
+"""
+Tile pyramid export (Tiles/) so Godot can stream only the visible part of a map.
+
+Every map is cut into tile_size x tile_size PNG tiles at several levels.
+Level 0 is the full resolution, and every further level halves the size
+until the whole map fits into a single tile:
+
+    Tiles/<map>/<level>/<row>_<col>.png      e.g. Tiles/PoliticalMap/2/3_1.png
+    Tiles/manifest.json                      sizes, tile grid and path pattern of every map/level
+
+ProvinceMap and ProvinceMask are downsampled by the 2x2 mode of their ids
+(packed colours for ProvinceMap), so no tile ever contains a blended colour
+that is not a province. Colour maps (PoliticalMap, Modes/) are box filtered.
+Tiles go through the OutputWriter, so only tiles that changed are rewritten.
+"""
+
+import os
+
+import numpy as np
+from PIL import Image
+
+from export_shared import image_rows, pack_rgb, render_palettes, row_chunks, unpack_rgb
+
+TILES_DIR = "Tiles"
+TILE_SIZE = 256
+
+
+# --------------------------------------------------------
+# DOWNSAMPLING
+# --------------------------------------------------------
+def downsample_ids(ids):
+    """Halve an id raster: every 2x2 block becomes its most frequent id (ties: top-left first)."""
+    h, w = ids.shape
+    if h % 2 or w % 2:
+        ids = np.pad(ids, ((0, h % 2), (0, w % 2)), mode="edge")
+
+    a, b = ids[0::2, 0::2], ids[0::2, 1::2]
+    c, d = ids[1::2, 0::2], ids[1::2, 1::2]
+    return np.where(
+        (a == b) | (a == c) | (a == d), a,
+        np.where((b == c) | (b == d), b, np.where(c == d, c, a)),
+    )
+
+
+def level_count(shape, tile_size):
+    """Levels down to (and including) the first one that fits into a single tile."""
+    h, w = shape
+    levels = 1
+    while max(h, w) > tile_size:
+        h, w = -(-h // 2), -(-w // 2)
+        levels += 1
+    return levels
+
+
+def tile_grid(shape, tile_size):
+    """(row, col, y0, y1, x0, x1) of every tile of a level."""
+    h, w = shape
+    for row, y0 in enumerate(range(0, h, tile_size)):
+        for col, x0 in enumerate(range(0, w, tile_size)):
+            yield row, col, y0, min(y0 + tile_size, h), x0, min(x0 + tile_size, w)
+
+
+def _map_key(name):
+    return os.path.splitext(name)[0].replace("\\", "/")
+
+
+def _level_entry(key, level, shape, tile_size):
+    h, w = shape
+    return {
+        "level": level,
+        "scale": 2 ** level,
+        "width": w,
+        "height": h,
+        "cols": -(-w // tile_size),
+        "rows": -(-h // tile_size),
+        "path": f"{TILES_DIR}/{key}/{level}/{{row}}_{{col}}.png",
+    }
+
+
+# --------------------------------------------------------
+# EXPORT
+# --------------------------------------------------------
+def mask_palette(n):
+    """pid -> ProvinceMask colour (same encoding as export_id_map)."""
+    pids = np.arange(n)
+    return np.stack([pids % 256, pids // 256, np.zeros(n, dtype=np.int64)], axis=1).astype(np.uint8)
+
+
+def packed_image(name, writer):
+    """Packed RGB keys of a written image, built row chunk by row chunk."""
+    with Image.open(writer.path(name)) as img:
+        keys = np.empty((img.height, img.width), dtype=np.uint32)
+        for top, bottom in row_chunks(img.height):
+            keys[top:bottom] = pack_rgb(image_rows(img, top, bottom))
+    return keys
+
+
+def export_id_tiles(name, ids, render, writer, tile_size=TILE_SIZE):
+    """Tiles of an id-like raster, mode downsampled between levels; render(block) -> RGB tile."""
+    key = _map_key(name)
+    levels = []
+
+    for level in range(level_count(ids.shape, tile_size)):
+        if level:
+            ids = downsample_ids(ids)
+        levels.append(_level_entry(key, level, ids.shape, tile_size))
+
+        for row, col, y0, y1, x0, x1 in tile_grid(ids.shape, tile_size):
+            tile_name = os.path.join(TILES_DIR, key, str(level), f"{row}_{col}.png")
+            writer.save_image(tile_name, Image.fromarray(render(ids[y0:y1, x0:x1]), "RGB"))
+
+    return {"source": name.replace("\\", "/"), "kind": "id", "levels": levels}
+
+
+def export_color_tiles(name, writer, tile_size=TILE_SIZE):
+    """Tiles of a written colour map, box filtered between levels."""
+    key = _map_key(name)
+    levels = []
+
+    with Image.open(writer.path(name)) as src:
+        img = src.convert("RGB")
+    for level in range(level_count((img.height, img.width), tile_size)):
+        if level:
+            # reduce() averages every 2x2 block (partial blocks at odd edges too)
+            img = img.reduce(2)
+        levels.append(_level_entry(key, level, (img.height, img.width), tile_size))
+
+        for row, col, y0, y1, x0, x1 in tile_grid((img.height, img.width), tile_size):
+            tile_name = os.path.join(TILES_DIR, key, str(level), f"{row}_{col}.png")
+            writer.save_image(tile_name, img.crop((x0, y0, x1, y1)))
+
+    return {"source": name.replace("\\", "/"), "kind": "color", "levels": levels}
+
+
+def export_tile_pyramid(id_map, color_maps, writer, tile_size=TILE_SIZE):
+    """
+    id_map:     export id raster (ProvinceMask tiles)
+    color_maps: names of colour maps already written by `writer` (PoliticalMap.png, Modes/...)
+    ProvinceMap tiles are cut from the written ProvinceMap.png, so sea regions keep their colours.
+    """
+    # the maps are read back from disk
+    writer.flush()
+    maps = {}
+
+    # exact ProvinceMap colours: the mode is taken over the packed RGB keys
+    keys = packed_image("ProvinceMap.png", writer)
+    maps["ProvinceMap"] = export_id_tiles("ProvinceMap.png", keys, unpack_rgb, writer, tile_size)
+    del keys
+
+    palette = mask_palette(int(id_map.max()) + 1 if id_map.size else 1)
+    maps["ProvinceMask"] = export_id_tiles(
+        "ProvinceMask.png", id_map, lambda block: render_palettes(block, [palette])[0], writer, tile_size
+    )
+
+    for name in color_maps:
+        maps[_map_key(name)] = export_color_tiles(name, writer, tile_size)
+
+    manifest = {"tile_size": tile_size, "maps": maps}
+    writer.write_json(os.path.join(TILES_DIR, "manifest.json"), manifest)
+
+    tiles = sum(level["cols"] * level["rows"] for m in maps.values() for level in m["levels"])
+    print(f"[EXPORT] Tiles written ({len(maps)} maps, {tiles} tiles of {tile_size}px).")
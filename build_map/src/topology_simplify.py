@@ -0,0 +1,104 @@
+"""
+Topology-aware simplification of the land + sea partition.
+
+Simplifying every polygon on its own moves each copy of a shared border
+differently and opens gaps and overlaps between neighbours. Here every
+border is simplified once, as an arc shared by both sides:
+
+1. a valid coverage goes straight to shapely.coverage_simplify (GEOS >= 3.12)
+2. otherwise (land and sea only meet approximately, T-junctions, overlaps)
+   all boundaries are noded into arcs between junctions, each arc is
+   simplified with its end points fixed, the arcs are polygonized again and
+   every face goes back to the polygon it overlaps most (on overlaps the later
+   polygon wins, the same as the draw order of export_province_map). Faces
+   that were gaps before stay gaps.
+
+The tolerance is given in export pixels (`simplify_px`), so it follows the
+export size. A polygon that would vanish keeps its original geometry.
+"""
+
+import numpy as np
+import shapely
+
+from export_shared import EXPORT_SIZE
+
+
+def pixel_tolerance(bounds, size, simplify_px):
+    """simplify_px export pixels in map units (the finer axis of geom_to_pixel_coords)."""
+    minx, miny, maxx, maxy = bounds
+    return simplify_px * min(maxx - minx, maxy - miny) / size
+
+
+def _arc_simplify(geoms, tolerance):
+    # node every boundary: shared borders become single arcs split at junctions
+    lines = shapely.union_all(shapely.boundary(geoms))
+    arcs = shapely.get_parts(shapely.line_merge(lines))
+
+    # end points stay fixed, so neighbouring arcs still meet; noding again
+    # catches arcs that cross each other after simplification
+    arcs = shapely.simplify(arcs, tolerance, preserve_topology=True)
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(shapely.union_all(arcs))))
+    if len(faces) == 0:
+        return np.asarray(geoms, dtype=object)
+
+    tree = shapely.STRtree(geoms)
+    face_idx, geom_idx = tree.query(faces, predicate="intersects")
+    share = shapely.area(shapely.intersection(faces[face_idx], geoms[geom_idx])) / shapely.area(faces[face_idx])
+
+    # per face the polygon covering most of it; equal shares (overlaps) go to the later polygon
+    order = np.lexsort((-geom_idx, -np.round(share, 2), face_idx))
+    face_idx, geom_idx, share = face_idx[order], geom_idx[order], share[order]
+    first = np.r_[True, face_idx[1:] != face_idx[:-1]]
+    # faces mostly outside every polygon were gaps of the input
+    keep = first & (share >= 0.5)
+    face_idx, geom_idx = face_idx[keep], geom_idx[keep]
+
+    out = np.full(len(geoms), None, dtype=object)
+    order = np.argsort(geom_idx, kind="stable")
+    face_idx, geom_idx = face_idx[order], geom_idx[order]
+    starts = np.flatnonzero(np.r_[True, geom_idx[1:] != geom_idx[:-1]]) if len(geom_idx) else []
+    for a, b in zip(starts, np.r_[starts[1:], len(geom_idx)] if len(geom_idx) else []):
+        # faces of one polygon come from the same noded linework, so they form a valid coverage
+        out[geom_idx[a]] = shapely.coverage_union_all(faces[face_idx[a:b]])
+    return out
+
+
+def simplify_partition(geoms, tolerance):
+    """Simplified copies of `geoms` (shared borders simplified once); empty results keep the input."""
+    geoms = np.asarray(geoms, dtype=object)
+    if tolerance <= 0 or len(geoms) == 0:
+        return geoms
+
+    if hasattr(shapely, "coverage_simplify") and shapely.coverage_is_valid(geoms):
+        out = shapely.coverage_simplify(geoms, tolerance)
+    else:
+        out = _arc_simplify(geoms, tolerance)
+
+    lost = np.array([g is None or g.is_empty for g in out], dtype=bool)
+    out[lost] = geoms[lost]
+    # polygonal output only (the exporters draw Polygon / MultiPolygon)
+    return shapely.make_valid(out, method="structure", keep_collapsed=False)
+
+
+def simplify_borders(land, sea_regions, simplify_px, size=EXPORT_SIZE):
+    """
+    (land, sea_regions) with the land + sea borders simplified to `simplify_px` export pixels.
+    land keeps its index and columns; simplify_px <= 0 returns the input unchanged.
+    """
+    if not simplify_px:
+        return land, sea_regions
+
+    tolerance = pixel_tolerance(land.total_bounds, size, simplify_px)
+    geoms = np.concatenate([land.geometry.to_numpy(), np.asarray(list(sea_regions), dtype=object)])
+    before = int(shapely.get_num_coordinates(geoms).sum())
+
+    out = simplify_partition(geoms, tolerance)
+    after = int(shapely.get_num_coordinates(out).sum())
+    print(
+        f"[DEBUG] Borders simplified at {simplify_px}px ({tolerance:.0f} m): "
+        f"{before} -> {after} vertices"
+    )
+
+    land = land.copy()
+    land[land.geometry.name] = out[:len(land)]
+    return land, list(out[len(land):])
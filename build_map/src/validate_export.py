@@ -0,0 +1,186 @@
+"""
+Consistency checks of a finished OpenGS export, without rebuilding anything:
+
+    python build_map.py validate [out_dir] [--hash]
+
+- every required file is there
+- files recorded in .build/manifest.json still have their recorded size
+  (--hash also compares the sha256 of every file)
+- Provinces.txt has unique ids and unique colours
+- all maps have the same size
+- every ProvinceMap colour is a province from Provinces.txt, every province has pixels
+- ProvinceMask encodes the same land id as ProvinceMap, and sea where ProvinceMap is sea
+
+Rasters are read in row chunks, so the check stays cheap on memory.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from export_shared import OUT, SEA_COLOR, image_rows, pack_rgb, row_chunks
+from output_writer import MANIFEST_PATH
+
+REQUIRED = (
+    "ProvinceMap.png",
+    "ProvinceMask.png",
+    "PoliticalMap.png",
+    "Provinces.txt",
+    "States.txt",
+    "Population.txt",
+)
+
+
+class Report:
+    def __init__(self):
+        self.problems = []
+        self.warnings = []
+
+    def problem(self, msg):
+        self.problems.append(msg)
+        print(f"[VALIDATE] ERROR: {msg}")
+
+    def warn(self, msg):
+        self.warnings.append(msg)
+        print(f"[WARN] {msg}")
+
+
+# --------------------------------------------------------
+# FILES
+# --------------------------------------------------------
+def check_manifest(out_dir, report, full_hash=False):
+    path = os.path.join(out_dir, MANIFEST_PATH)
+    if not os.path.exists(path):
+        report.warn("No output manifest, file sizes not checked")
+        return
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    for key, entry in sorted(manifest.items()):
+        file_path = os.path.join(out_dir, key)
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            report.problem(f"{key} is in the manifest but missing")
+            continue
+        if st.st_size != entry["size"]:
+            report.problem(f"{key}: size {st.st_size} != {entry['size']} recorded by the export")
+        elif full_hash:
+            with open(file_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            if digest != entry["sha256"]:
+                report.problem(f"{key}: content differs from the export")
+        elif st.st_mtime_ns != entry["mtime_ns"]:
+            report.warn(f"{key} was modified after the export")
+
+
+def read_provinces(path, report):
+    """(ids, packed colours, is_land) of Provinces.txt."""
+    ids, colors, land = [], [], []
+    with open(path, encoding="utf-8") as f:
+        next(f, None)
+        for n, line in enumerate(f, start=2):
+            parts = line.rstrip("\n").split(";")
+            if len(parts) < 5:
+                report.problem(f"Provinces.txt line {n}: expected id;R;G;B;type;...")
+                continue
+            ids.append(int(parts[0]))
+            r, g, b = (int(v) for v in parts[1:4])
+            colors.append((r << 16) | (g << 8) | b)
+            land.append(parts[4] == "land")
+
+    ids = np.asarray(ids, dtype=np.int64)
+    colors = np.asarray(colors, dtype=np.uint32)
+    if len(np.unique(ids)) != len(ids):
+        report.problem("Provinces.txt has duplicate ids")
+    if len(np.unique(colors)) != len(colors):
+        report.problem("Provinces.txt has duplicate colours")
+    return ids, colors, np.asarray(land, dtype=bool)
+
+
+# --------------------------------------------------------
+# RASTERS
+# --------------------------------------------------------
+def map_images(out_dir):
+    names = [n for n in ("ProvinceMap.png", "ProvinceMask.png", "PoliticalMap.png")
+             if os.path.exists(os.path.join(out_dir, n))]
+    modes = os.path.join(out_dir, "Modes")
+    if os.path.isdir(modes):
+        for mode in sorted(os.listdir(modes)):
+            for name in sorted(os.listdir(os.path.join(modes, mode))):
+                if name.endswith(".png"):
+                    names.append(os.path.join("Modes", mode, name))
+    return names
+
+
+def check_sizes(out_dir, report):
+    sizes = {}
+    for name in map_images(out_dir):
+        with Image.open(os.path.join(out_dir, name)) as img:
+            sizes[name] = img.size
+    if len(set(sizes.values())) > 1:
+        detail = ", ".join(f"{name} {w}x{h}" for name, (w, h) in sizes.items())
+        report.problem(f"maps differ in size: {detail}")
+    return sizes
+
+
+def check_province_rasters(out_dir, ids, colors, land, report):
+    order = np.argsort(colors)
+    keys, pids, is_land = colors[order], ids[order], land[order]
+    seen = np.zeros(len(keys), dtype=bool)
+    sea_key = pack_rgb(np.asarray(SEA_COLOR, dtype=np.uint8))
+    unknown = mismatched = 0
+
+    with Image.open(os.path.join(out_dir, "ProvinceMap.png")) as pmap, \
+            Image.open(os.path.join(out_dir, "ProvinceMask.png")) as pmask:
+        if pmap.size != pmask.size:
+            return   # reported by check_sizes
+        for top, bottom in row_chunks(pmap.height):
+            chunk = pack_rgb(image_rows(pmap, top, bottom))
+            pos = np.clip(np.searchsorted(keys, chunk), 0, max(len(keys) - 1, 0))
+            found = keys[pos] == chunk
+            unknown += int(np.count_nonzero(~found))
+            seen[np.unique(pos[found])] = True
+
+            # mask: land id as R + 256 * G, sea colour everywhere else
+            mask = image_rows(pmask, top, bottom).astype(np.int64)
+            mask_ids = mask[..., 0] + 256 * mask[..., 1]
+            mask_sea = pack_rgb(mask.astype(np.uint8)) == sea_key
+            land_px = found & is_land[pos]
+            mismatched += int(np.count_nonzero(land_px & (mask_ids != pids[pos])))
+            mismatched += int(np.count_nonzero(~land_px & ~mask_sea))
+
+    if unknown:
+        report.problem(f"ProvinceMap.png: {unknown} pixels with a colour missing from Provinces.txt")
+    if mismatched:
+        report.problem(f"ProvinceMask.png: {mismatched} pixels disagree with ProvinceMap.png")
+    if not seen.all():
+        report.warn(f"{int((~seen).sum())} provinces of Provinces.txt have no pixels in ProvinceMap.png")
+
+
+# --------------------------------------------------------
+# ENTRY POINT
+# --------------------------------------------------------
+def validate_export(out_dir=OUT, full_hash=False):
+    """Report with the problems (errors) and warnings found in out_dir."""
+    report = Report()
+    print(f"[VALIDATE] {out_dir}")
+
+    for name in REQUIRED:
+        if not os.path.exists(os.path.join(out_dir, name)):
+            report.problem(f"{name} is missing")
+
+    check_manifest(out_dir, report, full_hash)
+    check_sizes(out_dir, report)
+
+    if os.path.exists(os.path.join(out_dir, "Provinces.txt")):
+        ids, colors, land = read_provinces(os.path.join(out_dir, "Provinces.txt"), report)
+        if all(os.path.exists(os.path.join(out_dir, n)) for n in ("ProvinceMap.png", "ProvinceMask.png")):
+            check_province_rasters(out_dir, ids, colors, land, report)
+
+    status = "OK" if not report.problems else f"{len(report.problems)} problem(s)"
+    print(f"[VALIDATE] {status}, {len(report.warnings)} warning(s)")
+    return report
@@ -0,0 +1,231 @@
+"""
+Resident build mode.
+
+Loads and cleans the admin geometry once, then watches build_config.json and
+the population inputs. Every change reruns only the stages that depend on
+what changed, against the geometry kept in memory:
+
+    python watch_map.py [--config build_config.json] [--interval 1.0]
+"""
+
+import argparse
+import glob
+import os
+import time
+import traceback
+
+import build_map
+from border_overlay import border_style
+from build_config import CONFIG_PATH, load_config
+
+# --------------------------------------------------------
+# STAGE GRAPH
+# --------------------------------------------------------
+STAGE_ORDER = ["merge", "subdivide", "sea", "simplify", "preview", "export"]
+
+# config keys each stage reads directly
+STAGE_KEYS = {
+    "merge": ("min_area_abs",),
+    "subdivide": ("max_area_abs", "seed"),
+    "sea": ("n_regions", "sea_sample_points", "sea_smooth_radius", "sea_method", "sea_raster_cell", "sea_tile_size", "seed",
+            "sea_warm_start"),
+    "simplify": ("simplify_px", "export_size"),
+    "preview": ("preview", "out_dir"),
+    "export": (
+        "export", "seed", "theme_modes", "export_size", "tile_size", "mesh_lods", "out_dir", "nuts_population",
+        "province_border_width", "province_border_color", "state_border_width", "state_border_color",
+    ),
+}
+
+# a rerun of a stage invalidates everything after it that consumes its output
+DOWNSTREAM = {
+    "merge": ("subdivide", "sea", "simplify", "preview", "export"),
+    "subdivide": ("sea", "simplify", "preview", "export"),
+    "sea": ("simplify", "preview", "export"),
+    "simplify": ("preview", "export"),
+    "preview": (),
+    "export": (),
+}
+
+
+def population_inputs(config=None):
+    paths = glob.glob(os.path.join(build_map.BASE, "query*.csv")) + glob.glob(os.path.join(build_map.BASE, "query*.tsv"))
+    if config and config["nuts_population"]:
+        paths.append(os.path.join(build_map.BASE, config["nuts_population"]))
+    return sorted(paths)
+
+
+def snapshot(paths):
+    stamps = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamps[path] = None
+    return stamps
+
+
+def dirty_stages(old_config, new_config):
+    changed = {k for k in new_config if old_config.get(k) != new_config.get(k)}
+    dirty = set()
+    for stage, keys in STAGE_KEYS.items():
+        if changed.intersection(keys):
+            dirty.add(stage)
+            dirty.update(DOWNSTREAM[stage])
+    return dirty
+
+
+class ResidentBuild:
+    def __init__(self, config_path=CONFIG_PATH):
+        self.config_path = config_path
+        self.config = load_config(config_path)
+
+        t0 = time.perf_counter()
+        admin = build_map.load_admin()
+        self.clean_land, self.land_union = build_map.clean_geometry(admin, workers=self.config["workers"])
+        print(f"[WATCH] Geometry resident ({len(self.clean_land)} regions, {time.perf_counter() - t0:.1f}s)")
+
+        self.merged = None
+        self.land = None
+        self.sea_regions = None
+        # simplified copies used for drawing
+        self.draw_land = None
+        self.draw_sea = None
+        # minibatch centres of the previous sea run (sea_warm_start)
+        self.sea_centers = {}
+
+    def run_stage(self, stage):
+        cfg = self.config
+        # same RNG state per stage as build_map.build
+        build_map.seed_everything(cfg["seed"])
+
+        if stage == "merge":
+            self.merged = build_map.merge_small_absolute(self.clean_land, min_area=cfg["min_area_abs"], workers=cfg["workers"])
+
+        elif stage == "subdivide":
+            self.land = build_map.subdivide_large(
+                self.merged, max_area=cfg["max_area_abs"], seed=cfg["seed"], workers=cfg["workers"]
+            )
+
+        elif stage == "sea":
+            self.sea_regions = build_map.generate_sea_regions(
+                self.land,
+                self.land_union,
+                n_regions=cfg["n_regions"],
+                sample_points=cfg["sea_sample_points"],
+                smooth_radius=cfg["sea_smooth_radius"],
+                seed=cfg["seed"],
+                method=cfg["sea_method"],
+                raster_cell=cfg["sea_raster_cell"],
+                tile_size=cfg["sea_tile_size"],
+                warm_start=self.sea_centers if cfg["sea_warm_start"] else None,
+            )
+
+        elif stage == "simplify":
+            self.draw_land, self.draw_sea = build_map.simplify_borders(
+                self.land, self.sea_regions, cfg["simplify_px"], size=cfg["export_size"]
+            )
+
+        elif stage == "preview":
+            if cfg["preview"]:
+                build_map.render_preview(self.draw_land, self.draw_sea, build_map.preview_path(cfg))
+
+        elif stage == "export":
+            if cfg["export"]:
+                build_map.export_opengs(
+                    self.draw_land,
+                    self.draw_sea,
+                    theme_modes=cfg["theme_modes"],
+                    out_dir=build_map.output_dir(cfg),
+                    size=cfg["export_size"],
+                    tile_size=cfg["tile_size"],
+                    mesh_lods=cfg["mesh_lods"],
+                    workers=cfg["workers"],
+                    nuts_population=cfg["nuts_population"],
+                    borders=border_style(cfg),
+                )
+
+    def rebuild(self, stages):
+        timings = []
+        t_start = time.perf_counter()
+
+        for stage in STAGE_ORDER:
+            if stage not in stages:
+                continue
+            t0 = time.perf_counter()
+            self.run_stage(stage)
+            timings.append((stage, time.perf_counter() - t0))
+
+        total = time.perf_counter() - t_start
+        detail = ", ".join(f"{s} {t:.1f}s" for s, t in timings)
+        print(f"[WATCH] Rebuild done in {total:.1f}s ({detail})")
+
+    def reload_config(self):
+        new_config = load_config(self.config_path)
+        stages = dirty_stages(self.config, new_config)
+        self.config = new_config
+        return stages
+
+
+def watch(config_path=CONFIG_PATH, interval=1.0):
+    build = ResidentBuild(config_path)
+    build.rebuild(set(STAGE_ORDER))
+
+    config_stamp = snapshot([config_path])
+    pop_stamp = snapshot(population_inputs(build.config))
+    print(f"[WATCH] Watching {os.path.basename(config_path)} + {len(pop_stamp)} population file(s). Ctrl+C to stop.")
+
+    # stages of a failed rebuild stay pending until a later rebuild succeeds
+    pending = set()
+
+    while True:
+        time.sleep(interval)
+
+        new_config_stamp = snapshot([config_path])
+        new_pop_stamp = snapshot(population_inputs(build.config))
+
+        stages = set()
+        try:
+            if new_config_stamp != config_stamp:
+                print("[WATCH] Config changed")
+                stages |= build.reload_config()
+            if new_pop_stamp != pop_stamp:
+                print("[WATCH] Population inputs changed")
+                stages.add("export")
+        except Exception:
+            # keep the resident geometry alive on a broken config edit
+            traceback.print_exc()
+            config_stamp = new_config_stamp
+            continue
+
+        config_stamp = new_config_stamp
+        pop_stamp = new_pop_stamp
+
+        if not stages:
+            continue
+
+        pending |= stages
+        print(f"[WATCH] Rerunning: {', '.join(s for s in STAGE_ORDER if s in pending)}")
+        try:
+            build.rebuild(pending)
+            pending = set()
+        except Exception:
+            traceback.print_exc()
+            print("[WATCH] Rebuild failed, waiting for the next change")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident map build that reruns stages on change.")
+    parser.add_argument("--config", default=CONFIG_PATH, help="JSON config to watch")
+    parser.add_argument("--interval", type=float, default=1.0, help="poll interval in seconds")
+    args = parser.parse_args()
+
+    try:
+        watch(os.path.abspath(args.config), interval=args.interval)
+    except KeyboardInterrupt:
+        print("[WATCH] Stopped.")
+
+
+if __name__ == "__main__":
+    main()
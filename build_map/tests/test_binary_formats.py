@@ -0,0 +1,151 @@
+"""
+Write -> load round trip of the binary export formats (Provinces.bin,
+ProvinceRuns.bin, ProvinceMesh.bin) on a small synthetic map, so a format
+change that breaks the readers fails here instead of in the game.
+
+    python -m pytest -q build_map/tests
+"""
+
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import box
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from export_shared import image_rows, pack_rgb  # noqa: E402
+from export_to_opengs import export_id_map, export_province_map  # noqa: E402
+from output_writer import OutputWriter  # noqa: E402
+from province_db import DB_FILE, TYPE_LAND, TYPE_SEA, build_province_table, export_province_db, load_province_db  # noqa: E402
+from province_lookup import runs_to_ids  # noqa: E402
+from province_mesh import MESH_FILE, export_province_mesh, load_province_mesh, province_mesh  # noqa: E402
+from province_runs import RUNS_FILE, export_province_runs, load_province_runs, province_pixel_count  # noqa: E402
+
+SIZE = 160
+CELL = 100_000
+
+
+def synthetic_map():
+    """4x4 grid of land cells with two holes of sea, two countries, sea split into three regions."""
+    rows = []
+    for i in range(4):
+        for j in range(4):
+            if (i, j) in ((1, 1), (3, 0)):
+                continue
+            country = "AAA" if i < 2 else "BBB"
+            rows.append({"country": country, "name": f"R{i}{j}",
+                         "geometry": box(i * CELL, j * CELL, (i + 1) * CELL, (j + 1) * CELL)})
+    land = gpd.GeoDataFrame(rows, crs="EPSG:3035")
+
+    sea = shapely.difference(box(0, 0, 4 * CELL, 4 * CELL), shapely.union_all(land.geometry.to_numpy()))
+    return land, list(shapely.get_parts(sea))
+
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory):
+    out = str(tmp_path_factory.mktemp("export"))
+    land, sea = synthetic_map()
+    writer = OutputWriter(out)
+
+    province_colors, bounds, img, sea_colors = export_province_map(land, sea, writer, size=SIZE)
+    id_map = export_id_map(province_colors, writer, img)
+    table = build_province_table(province_colors, id_map, land, img)
+    # ProvinceMap colours -> Provinces.txt ids, the reference for the run index
+    keys = pack_rgb(np.asarray(table["color"], dtype=np.uint8))
+    pixel_keys = pack_rgb(image_rows(img, 0, img.height))
+    order = np.argsort(keys)
+    full_ids = table["id"][order][np.searchsorted(keys[order], pixel_keys)]
+
+    population = {int(pid): 1000 * (int(pid) + 1) for pid in land.index}
+    export_province_db(table, land, population, bounds, writer)
+    export_province_runs(table["run_offsets"], table["runs"], table["shape"], writer)
+    export_province_mesh(land, sea, sea_colors, table, bounds, SIZE, writer, lods=(0, 2))
+    writer.finish()
+
+    return {
+        "out": out, "land": land, "table": table, "bounds": bounds,
+        "id_map": id_map, "full_ids": full_ids, "population": population,
+    }
+
+
+# --------------------------------------------------------
+# Provinces.bin
+# --------------------------------------------------------
+def test_province_db_round_trip(export):
+    table, land = export["table"], export["land"]
+    db = load_province_db(os.path.join(export["out"], DB_FILE))
+
+    assert db["shape"] == (SIZE, SIZE)
+    assert db["bounds"] == pytest.approx(export["bounds"])
+    assert db["states"] == ["AAA", "BBB"]
+    for name in ("id", "color", "type", "state", "bbox", "pixels"):
+        np.testing.assert_array_equal(db[name], table[name], err_msg=name)
+    np.testing.assert_array_equal(db["owner"], table["state"])
+    np.testing.assert_allclose(db["centroid"], table["centroid"])
+
+    land_rows = db["type"] == TYPE_LAND
+    expected = [export["population"][int(pid)] for pid in db["id"][land_rows]]
+    np.testing.assert_array_equal(db["population"][land_rows], expected)
+    assert (db["population"][db["type"] == TYPE_SEA] == 0).all()
+
+    # state CSR: every state lists exactly the provinces of its country
+    for s, code in enumerate(db["states"]):
+        members = db["state_provinces"][db["state_offsets"][s]:db["state_offsets"][s + 1]]
+        assert sorted(members.tolist()) == sorted(land.index[land["country"] == code].tolist())
+
+
+# --------------------------------------------------------
+# ProvinceRuns.bin
+# --------------------------------------------------------
+def test_province_runs_round_trip(export):
+    table = export["table"]
+    index = load_province_runs(os.path.join(export["out"], RUNS_FILE))
+
+    assert index["shape"] == (SIZE, SIZE)
+    ids = runs_to_ids(index)
+    np.testing.assert_array_equal(ids, export["full_ids"])
+
+    land_px = export["id_map"] >= 0
+    np.testing.assert_array_equal(ids[land_px], export["id_map"][land_px])
+    for pid, pixels in zip(table["id"], table["pixels"]):
+        assert province_pixel_count(index, int(pid)) == pixels
+
+
+# --------------------------------------------------------
+# ProvinceMesh.bin
+# --------------------------------------------------------
+def test_province_mesh_round_trip(export):
+    table, land = export["table"], export["land"]
+    mesh = load_province_mesh(os.path.join(export["out"], MESH_FILE))
+
+    assert mesh["shape"] == (SIZE, SIZE)
+    np.testing.assert_allclose(mesh["lods"], [0, 2])
+
+    # one map pixel in m², the land cells are axis aligned so LOD 0 keeps their area exactly
+    minx, miny, maxx, maxy = export["bounds"]
+    px_area = (maxx - minx) / SIZE * (maxy - miny) / SIZE
+    for pid, geom in zip(land.index, land.geometry):
+        v, i = province_mesh(mesh, int(pid), lod=0)
+        assert len(i) and len(i) % 3 == 0
+        assert i.max() < len(v)
+        a, b, c = (v[i[k::3]].astype(np.float64) for k in range(3))
+        ab, ac = b - a, c - a
+        area = 0.5 * np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]).sum()
+        assert area == pytest.approx(geom.area / px_area, rel=1e-4)
+
+    # every id of the table has a mesh at every LOD
+    for lod in range(len(mesh["lods"])):
+        for pid in table["id"]:
+            assert len(province_mesh(mesh, int(pid), lod)[1]) > 0
+
+
+def test_readers_reject_other_files(export, tmp_path):
+    bogus = tmp_path / "bogus.bin"
+    bogus.write_bytes(b"\0" * 256)
+    for load in (load_province_db, load_province_runs, load_province_mesh):
+        with pytest.raises(ValueError):
+            load(str(bogus))